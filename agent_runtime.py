@@ -1,23 +1,34 @@
 import os
+import asyncio
+import time
 from langgraph.graph import StateGraph, END
-from typing import TypedDict, Annotated
+from typing import TypedDict, Annotated, Optional
 import operator
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.callbacks import adispatch_custom_event
 
 # Import your local modules
 # Ensure os_kernel.py and tools.py are in the same folder
 from os_kernel import PermissionEngine, MemoryManager
-from tools import AgentTools 
+from llm_cache import LLMResponseCache
+from llm_gateway import get_chat_model
+import metrics
+from checkpoint import get_checkpointer
+from tools import build_default_registry
+from resilience import (
+    Backoff, ClassifiedError, ErrorKind, breakers, give_up_counts, merge_errors, retry_counts, settle
+)
 
 # Define the State of the OS
 class AgentState(TypedDict):
     messages: list
     current_agent: str
     error_count: int
+    task: str                      # original user task; retries isi ko dobara chalate hain
+    last_error: Optional[dict]     # ClassifiedError.as_state() of the last worker turn
 
 class AgentOrchestrator:
-    def __init__(self):
+    def __init__(self, checkpointer=None):
         # 1. Setup Infrastructure
         # NOTE: Make sure you set this environment variable, or paste your key directly below
         api_key = os.getenv("OPENROUTER_API_KEY", "your_openrouter_key_here")
@@ -26,32 +37,34 @@ class AgentOrchestrator:
         # These lines are now perfectly aligned with 'api_key' above
         self.permissions = PermissionEngine()
         self.memory = MemoryManager()
+        self.llm_cache = LLMResponseCache() # Opt-in: LLM_CACHE_ENABLED=1
         # -----------------------------------
         
-        # 2. Setup LLM (OpenRouter configuration)
-        self.llm = ChatOpenAI(
-    # Ye model bilkul free hai aur bina balance ke chalega
-    model="google/gemini-2.0-flash-exp:free", 
-    openai_api_key=os.getenv("OPENROUTER_API_KEY"),
-    openai_api_base="https://openrouter.ai/api/v1",
-    default_headers={
-        "HTTP-Referer": "http://localhost:8000", # OpenRouter ke liye zaroori
-        "X-Title": "Agent OS Interface"
-    }
-)
+        # 2. Setup LLM: gateway (OpenRouter by default) - shared pool, fastest healthy model, optional hedging
+        self.llm = get_chat_model()
         # 3. Map Tools for the Agent to use
-        self.available_tools = {
-            "read_email": AgentTools.read_emails,
-            "execute_python": AgentTools.execute_python
-        }
+        # Registry schemas ek hi baar bante hain; llm_with_tools har call pe rebuild nahi hota
+        self.max_parallel_tools = int(os.getenv("MAX_PARALLEL_TOOLS", "4"))
+        self.tools = build_default_registry(max_workers=self.max_parallel_tools)
+        self.available_tools = self.tools.functions
+        self.llm_with_tools = self.llm.bind_tools(self.tools.schemas)
+
+        # Retry policy: exponential backoff + jitter; breakers shared across orchestrators
+        self.max_retries = int(os.getenv("MAX_RETRIES", "3"))
+        self.backoff = Backoff(
+            base=float(os.getenv("RETRY_BASE_DELAY", "0.5")), cap=float(os.getenv("RETRY_MAX_DELAY", "30")),
+            max_retry_after=float(os.getenv("RETRY_MAX_RETRY_AFTER")) if os.getenv("RETRY_MAX_RETRY_AFTER") else None,
+        )
+        self.llm_breaker = breakers.get(f"llm:{self.llm.model_name}")
 
         # --- PILLAR 2: GRAPH CONSTRUCTION ---
         self.workflow = StateGraph(AgentState)
         
         # Add Nodes
-        self.workflow.add_node("supervisor", self.supervisor_node)
-        self.workflow.add_node("worker", self.worker_node)
-        self.workflow.add_node("retry_handler", self.recovery_node)
+        self.workflow.add_node("supervisor", metrics.instrument_node("runtime", "supervisor", self.supervisor_node))
+        self.workflow.add_node("worker", metrics.instrument_node("runtime", "worker", self.worker_node))
+        self.workflow.add_node("retry_handler", metrics.instrument_node("runtime", "retry_handler", self.recovery_node))
+        self.workflow.add_node("failure_handler", metrics.instrument_node("runtime", "failure_handler", self.failure_node))
         
         # Define Edges (The Flow)
         self.workflow.set_entry_point("supervisor")
@@ -63,108 +76,163 @@ class AgentOrchestrator:
             self.check_health,
             {
                 "ok": END,
-                "error": "retry_handler"
+                "error": "retry_handler",
+                "fail": "failure_handler"
             }
         )
         
         # If retry happens, go back to worker
         self.workflow.add_edge("retry_handler", "worker")
+        self.workflow.add_edge("failure_handler", END)
         
-        # Compile
-        self.app = self.workflow.compile()
+        # Compile (durable per-thread checkpoints: crash/retry ke baad wahi se resume)
+        self.app = self.workflow.compile(checkpointer=checkpointer or get_checkpointer())
 
     # --- PILLAR 3: NODE LOGIC ---
 
     def supervisor_node(self, state: AgentState):
         """Decides which agent performs the task and initializes error count."""
         print("--- [Supervisor] Assigning task to Research Agent ---")
-        return {"current_agent": "research_agent", "error_count": 0}
-
-    def worker_node(self, state: AgentState):
-        """The core logic: THINK (LLM) -> CHECK (Security) -> ACT (Tools)"""
-        agent_role = state['current_agent']
-        
         # Get the user's task from the message history
         last_message = state['messages'][-1] if state['messages'] else HumanMessage(content="Check my emails")
         user_task = last_message.content if hasattr(last_message, 'content') else str(last_message)
+        return {"current_agent": "research_agent", "error_count": 0, "task": user_task, "last_error": None}
+
+    async def worker_node(self, state: AgentState):
+        """The core logic: THINK (LLM) -> CHECK (Security) -> ACT (Tools, in parallel)"""
+        agent_role = state['current_agent']
+        user_task = state['task']
 
         print(f"--- [Worker: {agent_role}] Processing: {user_task} ---")
 
-        # 1. THINK: Bind tools and ask LLM what to do
-        llm_with_tools = self.llm.bind_tools([
-            {"type": "function", "function": {"name": "read_email", "description": "Read user emails"}},
-            {"type": "function", "function": {"name": "execute_python", "description": "Run Python code to solve math or data tasks"}}
-        ])
-        
+        # 1. THINK: ask LLM what to do (tools pehle se bound hain)
+        if not self.llm_breaker.allow():
+            error = ClassifiedError(ErrorKind.CIRCUIT_OPEN, f"LLM circuit open, retry in {self.llm_breaker.retry_in():.0f}s")
+            return {"messages": [f"ERROR: {error.message}"], "last_error": error.as_state()}
         try:
             # Send context to LLM
-            response = llm_with_tools.invoke([
+            response = await self.llm_cache.ainvoke(self.llm_with_tools, [
                 SystemMessage(content=f"You are {agent_role}. You verify permissions before acting. Choose a tool if needed."),
                 HumanMessage(content=user_task)
-            ])
+            ], route="worker")
         except Exception as e:
-            return {"messages": [f"ERROR: LLM invocation failed - {str(e)}"]}
+            error = settle(self.llm_breaker, e)
+            return {"messages": [f"ERROR: LLM invocation failed - {str(e)}"], "last_error": error.as_state()}
+        else:
+            self.llm_breaker.record_success()
+        finally:
+            # Cancel (CancelledError) pe bhi half-open probe slot khaali ho, warna breaker hamesha band
+            self.llm_breaker.release()
 
-        # 2. DECIDE & CHECK PERMISSIONS
+        # 2. DECIDE & ACT: har tool call concurrently, results original order mein
         if response.tool_calls:
-            tool_call = response.tool_calls[0]
-            tool_name = tool_call["name"]
-            tool_args = tool_call["args"]
-            
-            print(f"--- [Worker] LLM wants to use tool: {tool_name} ---")
-
-            # A. Security Check (The Guardrail)
-            if self.permissions.verify_action(agent_role, tool_name):
-                
-                # B. Execute Tool (ACT)
-                if tool_name in self.available_tools:
-                    try:
-                        # Special handling for tools that need arguments (like 'execute_python')
-                        if tool_name == "execute_python":
-                            code_to_run = tool_args.get("code", "")
-                            tool_result = self.available_tools[tool_name](code_to_run)
-                        else:
-                            # Standard execution for tools like 'read_email'
-                            tool_result = self.available_tools[tool_name]()
-                        
-                        # C. Memory Storage
-                        self.memory.save_context(agent_role, str(tool_result))
-                        
-                        return {"messages": [f"SUCCESS: {tool_result}"]}
-                    except Exception as e:
-                        return {"messages": [f"ERROR: Tool execution failed - {str(e)}"]}
-                else:
-                    return {"messages": [f"ERROR: Tool {tool_name} not found in available_tools"]}
-            else:
-                return {"messages": ["SECURITY ERROR: Permission Denied for this agent."]}
+            print(f"--- [Worker] LLM wants to use tools: {[c['name'] for c in response.tool_calls]} ---")
+            # A. Security Check (The Guardrail) - ek batch, ek policy snapshot
+            allowed = self.permissions.verify_many(agent_role, [c["name"] for c in response.tool_calls])
+            limiter = asyncio.Semaphore(self.max_parallel_tools)
+            results = await asyncio.gather(*[
+                self._run_tool_call(agent_role, call, ok, limiter) for call, ok in zip(response.tool_calls, allowed)
+            ])
+            error = merge_errors(err for _, err in results)
+            return {"messages": [msg for msg, _ in results], "last_error": error.as_state() if error else None}
         
         # If no tool was called, just return the LLM's text response
-        return {"messages": [response.content]}
+        return {"messages": [response.content], "last_error": None}
+
+    async def _run_tool_call(self, agent_role: str, tool_call: dict, allowed: bool, limiter: asyncio.Semaphore):
+        """ACT -> REMEMBER for a single, already permission-checked tool call. Returns (message, error)."""
+        tool_name = tool_call["name"]
+        tool_args = tool_call.get("args") or {}
+
+        # Permission denial / unknown tool: retry se kuch nahi badlega
+        if not allowed:
+            metrics.TOOL_CALLS.inc(tool=tool_name, agent_role=agent_role, outcome="denied")
+            message = f"SECURITY ERROR: Permission Denied for this agent ({tool_name})."
+            return message, ClassifiedError(ErrorKind.PERMANENT, message)
+        if tool_name not in self.tools:
+            metrics.TOOL_CALLS.inc(tool=tool_name, agent_role=agent_role, outcome="unknown")
+            message = f"ERROR: Tool {tool_name} not found in available_tools"
+            return message, ClassifiedError(ErrorKind.PERMANENT, message)
+
+        breaker = breakers.get(f"tool:{tool_name}")
+        if not breaker.allow():
+            metrics.TOOL_CALLS.inc(tool=tool_name, agent_role=agent_role, outcome="circuit_open")
+            message = f"ERROR: Tool {tool_name} circuit open, retry in {breaker.retry_in():.0f}s"
+            return message, ClassifiedError(ErrorKind.CIRCUIT_OPEN, message)
+
+        # B. Execute Tool (ACT)
+        async with limiter:
+            await self._emit("tool_call", {"tool": tool_name, "args": tool_args})
+            started = time.perf_counter()
+            try:
+                tool_result = await self.tools.acall(tool_name, tool_args)
+            except Exception as e:
+                self._observe_tool(tool_name, agent_role, "error", started)
+                return f"ERROR: Tool execution failed ({tool_name}) - {str(e)}", settle(breaker, e)
+            else:
+                breaker.record_success()
+            finally:
+                breaker.release()
+            self._observe_tool(tool_name, agent_role, "ok", started)
+            await self._emit("tool_result", {"tool": tool_name, "result": str(tool_result)})
+
+        # C. Memory Storage
+        await self.memory.asave_context(agent_role, tool_name, str(tool_result))
+        return f"SUCCESS: {tool_result}", None
+
+    @staticmethod
+    def _observe_tool(tool_name: str, agent_role: str, outcome: str, started: float):
+        elapsed = time.perf_counter() - started
+        metrics.TOOL_SECONDS.observe(elapsed, tool=tool_name, agent_role=agent_role, outcome=outcome)
+        metrics.TOOL_CALLS.inc(tool=tool_name, agent_role=agent_role, outcome=outcome)
+        metrics.record(metrics.TOOL_SECONDS.name, elapsed, {"tool": tool_name})
+
+    async def _emit(self, name: str, data: dict):
+        """Streaming clients ke liye custom graph event (graph ke bahar call ho toh ignore)."""
+        try:
+            await adispatch_custom_event(name, data)
+        except RuntimeError:
+            pass
 
     # --- PILLAR 4: RECOVERY & HEALTH ---
 
     def check_health(self, state: AgentState):
-        """Checks the last message for error keywords."""
-        if not state["messages"]:
+        """Routes on the classified error of the last worker turn: ok, retry (error) or give up (fail)."""
+        error = state.get("last_error")
+        if not error:
             return "ok"
-            
-        last_msg = state["messages"][-1]
-        content = last_msg.content if hasattr(last_msg, 'content') else str(last_msg)
-        
-        if "ERROR" in content or "Exception" in content:
-            return "error"
-        return "ok"
+        kind = ErrorKind(error["kind"])
+        # Retry-After ghante bhar ka ho toh request ke andar sote nahi: fail fast
+        too_long = kind == ErrorKind.RATE_LIMITED and self.backoff.too_long(error.get("retry_after"))
+        if kind in (ErrorKind.PERMANENT, ErrorKind.CIRCUIT_OPEN) or too_long or state.get("error_count", 0) >= self.max_retries:
+            give_up_counts[kind.value] += 1
+            return "fail"
+        return "error"
 
-    def recovery_node(self, state: AgentState):
-        """Self-healing logic: increment error count and retry."""
+    async def recovery_node(self, state: AgentState):
+        """Self-healing logic: back off (exponential + jitter, honours Retry-After), then retry."""
         current_errors = state.get("error_count", 0)
-        
-        if current_errors >= 3:
-            return {"messages": ["CRITICAL FAILURE: Max retries exceeded. Shutting down agent."]}
-            
-        print(f"⚠️ [System] Failure Detected. Retry {current_errors + 1}/3...")
+        error = state["last_error"]
+        delay = self.backoff.delay(current_errors, error.get("retry_after"))
+        retry_counts[error["kind"]] += 1
+        metrics.RETRIES.inc(agent_role=state.get("current_agent"), kind=error["kind"])
+        metrics.RETRY_DELAY.observe(delay, kind=error["kind"])
+
+        print(f"⚠️ [System] {error['kind']} failure detected. Retry {current_errors + 1}/{self.max_retries} in {delay:.2f}s...")
+        await asyncio.sleep(delay)
         
         return {
             "error_count": current_errors + 1,
             "messages": ["System Note: Retrying operation..."]
-        }
\ No newline at end of file
+        }
+
+    def failure_node(self, state: AgentState):
+        """Terminal node: permanent error, open circuit, or retries exhausted."""
+        error = state["last_error"]
+        if state.get("error_count", 0) >= self.max_retries:
+            reason = "Max retries exceeded"
+        elif error["kind"] == ErrorKind.RATE_LIMITED.value and self.backoff.too_long(error.get("retry_after")):
+            reason = f"Rate limited, provider asked to retry after {error['retry_after']:.0f}s"
+        else:
+            reason = f"{error['kind']} error, not retrying"
+        return {"messages": state["messages"] + [f"CRITICAL FAILURE: {reason}. Shutting down agent."]}
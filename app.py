@@ -1,3 +1,4 @@
+import json
 import streamlit as st
 import requests
 
@@ -9,6 +10,12 @@ st.caption("Powered by LangGraph & Llama 3")
 # --- CONFIGURATION ---
 # Backend ka URL wahi hona chahiye jo main.py mein define hai
 BACKEND_URL = "http://127.0.0.1:8000/spawn_agent"
+STREAM_URL = f"{BACKEND_URL}/stream"
+
+@st.cache_resource
+def get_session():
+    """One HTTP session per Streamlit server, taaki TCP connection har message pe reuse ho."""
+    return requests.Session()
 
 # Sidebar for Settings (Optional but Professional)
 with st.sidebar:
@@ -33,50 +40,70 @@ if prompt := st.chat_input("Give your agent a command..."):
         st.markdown(prompt)
     st.session_state.messages.append({"role": "user", "content": prompt})
 
-    # 5. Send to Your Backend (The Brain)
+    # 5. Send to Your Backend (The Brain) - streaming, tokens aate hi dikhte hain
     with st.chat_message("assistant"):
-        with st.spinner("Agent is thinking..."):
-            try:
-                # Payload creation
-                payload = {
-                    "user_id": "streamlit_user",
-                    "task": prompt
-                }
-                
-                # Headers for security
-                headers = {
-                    "X-API-Key": api_key,
-                    "Content-Type": "application/json"
-                }
+        status_box = st.status("Agent is thinking...", expanded=False)
+        placeholder = st.empty()
+        try:
+            # Payload creation
+            payload = {
+                "user_id": "streamlit_user",
+                "task": prompt
+            }
+            
+            # Headers for security
+            headers = {
+                "X-API-Key": api_key,
+                "Content-Type": "application/json",
+                "Accept": "application/x-ndjson"
+            }
 
-                # --- THE CONNECTION ---
-                response = requests.post(BACKEND_URL, json=payload, headers=headers)
-                
+            # --- THE CONNECTION (kept-alive session, streamed body) ---
+            session = get_session()
+            with session.post(STREAM_URL, json=payload, headers=headers, stream=True, timeout=(5, 300)) as response:
                 if response.status_code == 200:
-                    data = response.json()
-                    # Backend se jo bhi key aaye use yahan handle karein
-                    # Agar backend {"status": "success", "trace": [...]} bhej raha hai:
-                    ai_reply = str(data) # Safety ke liye pura JSON string banaya
-                    
-                    # Agar koi specific message field hai to use dikhayein:
-                    if "response" in data:
-                        ai_reply = data["response"]
-                    elif "trace" in data:
-                        ai_reply = f"✅ Task Completed. Trace: {data['trace'][-1]}"
+                    ai_reply = ""
+                    final_reply = None
+                    for line in response.iter_lines(decode_unicode=True):
+                        if not line:
+                            continue
+                        event = json.loads(line)
+                        kind = event.get("type")
+                        if kind == "token":
+                            ai_reply += event["content"]
+                            placeholder.markdown(ai_reply + "▌")
+                        elif kind == "node_start":
+                            status_box.update(label=f"Running node: {event['node']}")
+                        elif kind == "tool_call":
+                            status_box.write(f"🔧 Tool call: `{event.get('tool')}`")
+                        elif kind == "tool_result":
+                            status_box.write(f"📦 Tool result: {str(event.get('result'))[:200]}")
+                        elif kind == "final":
+                            final_reply = event.get("response")
+                        elif kind == "error":
+                            st.error(f"Agent error: {event.get('error')}")
 
-                    st.markdown(ai_reply)
+                    # Agar model ne stream nahi kiya toh final response dikhao
+                    ai_reply = ai_reply or str(final_reply or "")
+                    placeholder.markdown(ai_reply)
+                    status_box.update(label="Done", state="complete")
                     st.session_state.messages.append({"role": "assistant", "content": ai_reply})
                 
                 elif response.status_code == 422:
+                    status_box.update(label="Failed", state="error")
                     st.error("Error 422: Data mismatch. Check if 'JobRequest' in main.py matches the payload.")
                 
                 elif response.status_code == 401:
+                    status_box.update(label="Failed", state="error")
                     st.error("Error 401: Unauthorized. Check your API Key.")
                 
                 else:
+                    status_box.update(label="Failed", state="error")
                     st.error(f"Error {response.status_code}: {response.text}")
 
-            except requests.exceptions.ConnectionError:
-                st.error("❌ Connection Refused! Is 'uvicorn main:app --reload' running?")
-            except Exception as e:
-                st.error(f"An unexpected error occurred: {e}")
\ No newline at end of file
+        except requests.exceptions.ConnectionError:
+            status_box.update(label="Failed", state="error")
+            st.error("❌ Connection Refused! Is 'uvicorn main:app --reload' running?")
+        except Exception as e:
+            status_box.update(label="Failed", state="error")
+            st.error(f"An unexpected error occurred: {e}")
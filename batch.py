@@ -0,0 +1,312 @@
+"""
+Bulk runner: pushes a JSONL file of tasks through the agent graph with bounded concurrency.
+
+    python -m batch tasks.jsonl --out results.ndjson --concurrency 16
+    python -m batch requests.jsonl --task-field body --id-field request_id
+
+Each input line is a JSON object ({"task": ..., "user_id": ..., "thread_id": ...}) or a bare
+JSON string. Results are NDJSON in completion order, each tagged with its input `index`.
+Progress is checkpointed in SQLite per batch id; re-running the same input (or passing the
+same --batch-id) skips tasks that already succeeded. Inputs are read lazily and only
+`concurrency` tasks are in flight, so memory stays flat whatever the batch size.
+"""
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Dict, Iterable, Optional, Tuple, Union
+
+import metrics
+from storage import get_pool, get_writer
+
+# --- BATCH: JSONL in, NDJSON out, SQLite checkpoints ---
+
+DEFAULT_CONCURRENCY = 8
+MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "64"))
+
+BATCH_TASK_SECONDS = metrics.registry.histogram("batch_task_seconds", "Batch task latency.", ("status",))
+
+Record = Tuple[int, Union[Dict[str, Any], Exception]]
+Runner = Callable[[Dict[str, Any], str], Awaitable[Any]]
+
+
+def parse_line(line: Union[str, bytes], task_field: str = "task") -> Dict[str, Any]:
+    """One JSONL line -> {"task", ...}; raises ValueError on anything unusable."""
+    value = json.loads(line)
+    if isinstance(value, str):
+        value = {"task": value}
+    if not isinstance(value, dict):
+        raise ValueError("line is not a JSON object or string")
+    if task_field != "task" and task_field in value:
+        value = dict(value, task=value[task_field])
+    if not isinstance(value.get("task"), str) or not value["task"].strip():
+        raise ValueError(f"missing '{task_field}'")
+    return value
+
+
+def read_jsonl(lines: Iterable[Union[str, bytes]], task_field: str = "task") -> Iterable[Record]:
+    """Lazily numbers non-blank lines; parse errors come through as the record (reported, not raised)."""
+    index = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield index, parse_line(line, task_field)
+        except ValueError as e:  # json.JSONDecodeError bhi ValueError hai
+            yield index, e
+        index += 1
+
+
+class BatchStore:
+    """
+    Per-batch progress in SQLite: one row per finished item (status only, results are streamed
+    out, not kept), so resume works across processes and memory never holds the batch.
+    """
+    def __init__(self, db_path: str = "agent_os.db"):
+        self.pool = get_pool(db_path)
+        self.writer = get_writer(db_path)
+        self.pool.executescript('''
+            CREATE TABLE IF NOT EXISTS batch_runs (
+                batch_id TEXT PRIMARY KEY,
+                source TEXT,
+                created_at REAL,
+                updated_at REAL,
+                owner TEXT
+            );
+            CREATE TABLE IF NOT EXISTS batch_items (
+                batch_id TEXT,
+                idx INTEGER,
+                status TEXT,
+                error TEXT,
+                seconds REAL,
+                finished_at REAL,
+                PRIMARY KEY (batch_id, idx)
+            ) WITHOUT ROWID;
+        ''')
+        # Purani DB files: owner column baad mein aaya
+        if "owner" not in {row[1] for row in self.pool.execute("PRAGMA table_info(batch_runs)")}:
+            self.pool.executescript("ALTER TABLE batch_runs ADD COLUMN owner TEXT;")
+
+    def open(self, batch_id: str, source: Optional[str] = None, owner: Optional[str] = None) -> bool:
+        """
+        Registers the batch; returns True if it already existed (i.e. this is a resume). A batch
+        belongs to the `owner` that created it: anyone else gets PermissionError, not its progress.
+        """
+        self.writer.flush()
+        existing = self.pool.execute("SELECT owner FROM batch_runs WHERE batch_id = ?", (batch_id,))
+        if existing:
+            if existing[0][0] != owner:
+                raise PermissionError(f"batch {batch_id} belongs to another user")
+            return True
+        now = time.time()
+        self.writer.submit(
+            "INSERT OR IGNORE INTO batch_runs (batch_id, source, created_at, updated_at, owner) VALUES (?, ?, ?, ?, ?)",
+            (batch_id, source, now, now, owner)
+        )
+        # Do requests ek saath same naye batch_id pe: jo pehle commit hua wahi owner
+        self.writer.flush()
+        winner = self.pool.execute("SELECT owner FROM batch_runs WHERE batch_id = ?", (batch_id,))
+        if winner and winner[0][0] != owner:
+            raise PermissionError(f"batch {batch_id} belongs to another user")
+        return False
+
+    def is_done(self, batch_id: str, index: int) -> bool:
+        # Failed items resume pe dobara chalte hain; sirf 'ok' skip
+        return bool(self.pool.execute(
+            "SELECT 1 FROM batch_items WHERE batch_id = ? AND idx = ? AND status = 'ok'", (batch_id, index)
+        ))
+
+    def mark(self, batch_id: str, index: int, status: str, seconds: float, error: Optional[str] = None):
+        now = time.time()
+        self.writer.submit(
+            "INSERT OR REPLACE INTO batch_items (batch_id, idx, status, error, seconds, finished_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (batch_id, index, status, error, seconds, now)
+        )
+        self.writer.submit("UPDATE batch_runs SET updated_at = ? WHERE batch_id = ?", (now, batch_id))
+
+    def progress(self, batch_id: str) -> Dict[str, int]:
+        self.writer.flush()
+        rows = self.pool.execute("SELECT status, count(*) FROM batch_items WHERE batch_id = ? GROUP BY status", (batch_id,))
+        return dict(rows)
+
+
+class BatchReport:
+    """Running totals for the summary line (constant size: no per-item latencies kept)."""
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.ok = self.failed = self.skipped = 0
+        self.task_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def add(self, status: str, seconds: float):
+        if status == "ok":
+            self.ok += 1
+        else:
+            self.failed += 1
+        self.task_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    def summary(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self.started
+        ran = self.ok + self.failed
+        return {
+            "type": "summary",
+            "ran": ran, "ok": self.ok, "failed": self.failed, "skipped": self.skipped,
+            "seconds": round(elapsed, 3),
+            "tasks_per_second": round(ran / elapsed, 2) if elapsed > 0 else 0.0,
+            "mean_ms": round(1000 * self.task_seconds / ran, 1) if ran else 0.0,
+            "max_ms": round(1000 * self.max_seconds, 1),
+        }
+
+
+async def _records(source: Union[Iterable[Record], AsyncIterable[Record]]) -> AsyncIterator[Record]:
+    if hasattr(source, "__aiter__"):
+        async for record in source:
+            yield record
+    else:
+        for record in source:
+            yield record
+
+
+async def run_batch(records: Union[Iterable[Record], AsyncIterable[Record]], runner: Runner, batch_id: str,
+                    concurrency: int = DEFAULT_CONCURRENCY, store: Optional[BatchStore] = None,
+                    resume: bool = False, default_user_id: str = "batch",
+                    report: Optional[BatchReport] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Yields one result per input record in completion order. The next record is only read once
+    a slot frees up, so at most `concurrency` records (and their tasks) are alive at a time.
+    `runner(record, thread_id)` returns the agent reply; thread ids are `<batch_id>-<index>`,
+    so a task interrupted mid-graph resumes from its LangGraph checkpoint.
+    """
+    report = report or BatchReport()
+    source = _records(records).__aiter__()
+    pending: set = set()
+    exhausted = False
+
+    async def run_one(index: int, record: Dict[str, Any]) -> Dict[str, Any]:
+        thread_id = record.get("thread_id") or f"{batch_id}-{index}"
+        started = time.perf_counter()
+        try:
+            reply = await runner(dict(record, user_id=record.get("user_id") or default_user_id), thread_id)
+            result = {"status": "ok", "response": reply}
+        except Exception as e:
+            result = {"status": "error", "error": str(e)}
+        result["seconds"] = time.perf_counter() - started
+        return dict(result, index=index, thread_id=thread_id, **({"id": record["id"]} if "id" in record else {}))
+
+    try:
+        while True:
+            while not exhausted and len(pending) < concurrency:
+                try:
+                    index, record = await source.__anext__()
+                except StopAsyncIteration:
+                    exhausted = True
+                    break
+                if isinstance(record, Exception):
+                    # Kharab line: run nahi hoti, par result stream mein dikhti hai
+                    report.add("error", 0.0)
+                    yield {"type": "result", "index": index, "status": "error", "error": f"invalid input: {record}"}
+                    continue
+                if resume and store is not None and await asyncio.to_thread(store.is_done, batch_id, index):
+                    report.skipped += 1
+                    continue
+                pending.add(asyncio.create_task(run_one(index, record)))
+            if not pending:
+                break
+            finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in finished:
+                result = task.result()
+                seconds = result.pop("seconds")
+                report.add(result["status"], seconds)
+                BATCH_TASK_SECONDS.observe(seconds, status=result["status"])
+                if store is not None:
+                    store.mark(batch_id, result["index"], result["status"], seconds, result.get("error"))
+                yield dict(result, type="result", ms=round(1000 * seconds, 1))
+    finally:
+        # Client chala gaya / generator band: bache hue tasks orphan na rahein
+        for task in pending:
+            task.cancel()
+    if store is not None:
+        await asyncio.to_thread(store.writer.flush)
+
+
+def default_batch_id(path: str) -> str:
+    """Stable per input file, so re-running the same command resumes it."""
+    return "batch-" + hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:12]
+
+
+# --- CLI ---
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run a JSONL file of tasks through the agent graph")
+    parser.add_argument("input", help="JSONL file ('-' for stdin)")
+    parser.add_argument("--out", help="append NDJSON results here (default: stdout)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--batch-id", help="checkpoint id (default: derived from the input path)")
+    parser.add_argument("--fresh", action="store_true", help="new batch id: ignore earlier progress")
+    parser.add_argument("--task-field", default="task", help="JSON field holding the task text")
+    parser.add_argument("--id-field", help="JSON field echoed back as `id` in each result")
+    parser.add_argument("--user-id", default="batch", help="memory namespace for records without user_id")
+    parser.add_argument("--progress-every", type=float, default=10.0, help="seconds between progress logs")
+    return parser.parse_args(argv)
+
+
+async def _main(args, out) -> Dict[str, Any]:
+    # main import pe stdout pe print karta hai; NDJSON output saaf rakhne ke liye stderr pe bhejo
+    with contextlib.redirect_stdout(sys.stderr):
+        import main as app_main
+
+    if args.fresh:
+        batch_id = f"batch-{uuid.uuid4().hex[:12]}"
+    elif args.batch_id:
+        batch_id = args.batch_id
+    else:
+        batch_id = default_batch_id(args.input) if args.input != "-" else f"batch-{uuid.uuid4().hex[:12]}"
+    store = BatchStore()
+    resume = await asyncio.to_thread(store.open, batch_id, args.input)
+    logging.info(f"📦 Batch {batch_id}{' (resuming)' if resume else ''}, concurrency {args.concurrency}")
+
+    async def runner(record: Dict[str, Any], thread_id: str):
+        result = await app_main.invoke_graph({"messages": [record["task"]], "user_id": record["user_id"]}, thread_id)
+        return result["messages"][-1]
+
+    report = BatchReport()
+    with (sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")) as f:
+        records = read_jsonl(f, args.task_field)
+        if args.id_field:
+            records = ((i, dict(r, id=r.get(args.id_field)) if isinstance(r, dict) else r) for i, r in records)
+        last_log = time.monotonic()
+        with contextlib.redirect_stdout(sys.stderr):
+            async for result in run_batch(records, runner, batch_id, min(args.concurrency, MAX_CONCURRENCY),
+                                          store, resume, args.user_id, report):
+                out.write(json.dumps(result, default=str) + "\n")
+                out.flush()
+                if time.monotonic() - last_log >= args.progress_every:
+                    last_log = time.monotonic()
+                    s = report.summary()
+                    logging.info(f"⏱️ {s['ran']} done ({s['failed']} failed, {s['skipped']} skipped), {s['tasks_per_second']}/s")
+    app_main.get_memory().close()
+    return dict(report.summary(), batch_id=batch_id)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr, format="%(message)s")
+    out = open(args.out, "a", encoding="utf-8") if args.out else sys.stdout
+    try:
+        summary = asyncio.run(_main(args, out))
+    finally:
+        if args.out:
+            out.close()
+    print(json.dumps(summary), file=sys.stderr)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
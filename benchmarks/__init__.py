@@ -0,0 +1 @@
+"""Offline load tests and microbenchmarks (fake LLM, stub sandbox). Run: python -m benchmarks.run --help"""
@@ -0,0 +1,68 @@
+import asyncio
+import json
+import random
+import time
+import uuid
+from typing import Any, Dict, NamedTuple, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# --- FAKE OPENAI-COMPATIBLE SERVER: per-model latency, tail and error profiles ---
+# llm_gateway ko asli HTTP stack (openai SDK + shared httpx pool) ke saath test karne ke liye.
+
+
+class ModelProfile(NamedTuple):
+    latency: float = 0.05          # base seconds per completion
+    jitter: float = 0.0            # + uniform(0, jitter)
+    slow_ratio: float = 0.0        # share of requests hitting the tail...
+    slow_factor: float = 10.0      # ...which take latency * slow_factor
+    error_rate: float = 0.0        # share answered with HTTP 503
+    reply: str = "Done."
+
+
+def create_app(models: Dict[str, ModelProfile], seed: Optional[int] = None) -> FastAPI:
+    """POST /v1/chat/completions (JSON or SSE stream) for the given model names; others get 404."""
+    app = FastAPI()
+    rng = random.Random(seed)
+    app.state.requests = {name: 0 for name in models}
+
+    def chunk(model: str, completion_id: str, delta: Dict[str, Any], finish: Optional[str] = None) -> bytes:
+        body = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+        return f"data: {json.dumps(body)}\n\n".encode()
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        payload = await request.json()
+        model = payload.get("model")
+        profile = models.get(model)
+        if profile is None:
+            return JSONResponse(status_code=404, content={"error": {"message": f"model {model} not found", "type": "invalid_request_error"}})
+        app.state.requests[model] += 1
+        delay = profile.latency + (rng.uniform(0, profile.jitter) if profile.jitter else 0.0)
+        if rng.random() < profile.slow_ratio:
+            delay *= profile.slow_factor
+        await asyncio.sleep(delay)
+        if rng.random() < profile.error_rate:
+            return JSONResponse(status_code=503, content={"error": {"message": "upstream overloaded", "type": "server_error"}})
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in payload.get("messages", []))
+        completion_tokens = len(profile.reply.split())
+        if payload.get("stream"):
+            async def events():
+                yield chunk(model, completion_id, {"role": "assistant", "content": ""})
+                for word in profile.reply.split(" "):
+                    yield chunk(model, completion_id, {"content": word + " "})
+                yield chunk(model, completion_id, {}, "stop")
+                yield b"data: [DONE]\n\n"
+            return StreamingResponse(events(), media_type="text/event-stream")
+        return {
+            "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": profile.reply}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    return app
@@ -0,0 +1,125 @@
+import asyncio
+import itertools
+import os
+import random
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import PrivateAttr
+
+import sandbox_pool
+from sandbox_pool import ExecutionResult, SandboxBackend, SandboxSession
+
+# --- FAKE LLM: ChatOpenAI ki jagah, bina network / bina paise ---
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model that sleeps `latency` (+ uniform `jitter`) seconds and answers with `reply`.
+    When tools are bound, responses cycle through `tool_script`: each entry is the list of
+    tool calls ({"name", "args"}) for one turn; an empty list means a plain text answer.
+    """
+    model_name: str = "fake-model"
+    latency: float = 0.05
+    jitter: float = 0.0
+    reply: str = "Done."
+    tool_script: List[List[Dict[str, Any]]] = []
+    seed: Optional[int] = None
+
+    _rng: Any = PrivateAttr(default=None)
+    _turns: Any = PrivateAttr(default=None)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    def model_post_init(self, __context: Any) -> None:
+        self._rng = random.Random(self.seed)
+        self._turns = itertools.count()
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=tools, **kwargs)
+
+    def _delay(self) -> float:
+        with self._lock:
+            return self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0.0)
+
+    def _message(self, kwargs: dict) -> AIMessage:
+        if kwargs.get("tools") and self.tool_script:
+            calls = self.tool_script[next(self._turns) % len(self.tool_script)]
+            if calls:
+                return AIMessage(content="", tool_calls=[
+                    {"name": c["name"], "args": c.get("args", {}), "id": f"call_{uuid.uuid4().hex[:8]}"} for c in calls
+                ])
+        return AIMessage(content=self.reply)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self._delay())
+        return ChatResult(generations=[ChatGeneration(message=self._message(kwargs))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self._delay())
+        return ChatResult(generations=[ChatGeneration(message=self._message(kwargs))])
+
+
+# --- STUB SANDBOX ---
+
+
+class StubSession(SandboxSession):
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def run(self, code: str, timeout: float) -> ExecutionResult:
+        time.sleep(self.latency)
+        return ExecutionResult(stdout=f"ran {len(code)} chars", result="42")
+
+    def reset(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class StubBackend(SandboxBackend):
+    """SANDBOX_BACKEND=stub; latency from BENCH_SANDBOX_LATENCY (seconds)."""
+    name = "stub"
+
+    def __init__(self):
+        self.latency = float(os.getenv("BENCH_SANDBOX_LATENCY", "0.01"))
+
+    def create(self) -> SandboxSession:
+        return StubSession(self.latency)
+
+
+DEFAULT_TOOL_SCRIPT = [
+    [{"name": "read_email", "args": {}}],
+    [{"name": "read_email", "args": {}}, {"name": "execute_python", "args": {"code": "print(6 * 7)"}}],
+    [],
+]
+
+
+def install_fakes(latency: float = 0.05, jitter: float = 0.0, tool_script: Optional[list] = None,
+                  sandbox_latency: float = 0.01, seed: Optional[int] = None):
+    """
+    Must run before main / agent_runtime are imported: replaces langchain_openai.ChatOpenAI with
+    a FakeChatModel factory and routes execute_python to the stub sandbox backend.
+    """
+    import langchain_openai
+
+    options = dict(latency=latency, jitter=jitter, seed=seed,
+                   tool_script=DEFAULT_TOOL_SCRIPT if tool_script is None else tool_script)
+
+    def fake_chat_openai(model: str = "fake-model", **_ignored):
+        return FakeChatModel(model_name=model, **options)
+
+    langchain_openai.ChatOpenAI = fake_chat_openai
+    sandbox_pool.BACKENDS["stub"] = StubBackend
+    os.environ["SANDBOX_BACKEND"] = "stub"
+    os.environ["BENCH_SANDBOX_LATENCY"] = str(sandbox_latency)
+    os.environ.setdefault("OPENROUTER_API_KEY", "bench-offline-key")
@@ -0,0 +1,146 @@
+import asyncio
+import functools
+import math
+import os
+import platform
+import subprocess
+import time
+from collections import Counter, defaultdict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# --- Measurement helpers shared by load tests and microbenchmarks ---
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(samples: List[float], elapsed: Optional[float] = None) -> Dict[str, Any]:
+    """Latency summary in milliseconds (+ throughput if the wall time is given)."""
+    values = sorted(samples)
+    summary = {
+        "count": len(values),
+        "mean_ms": round(1000 * sum(values) / len(values), 3) if values else 0.0,
+        "p50_ms": round(1000 * percentile(values, 50), 3),
+        "p95_ms": round(1000 * percentile(values, 95), 3),
+        "p99_ms": round(1000 * percentile(values, 99), 3),
+        "max_ms": round(1000 * values[-1], 3) if values else 0.0,
+    }
+    if elapsed is not None:
+        summary["per_second"] = round(len(values) / elapsed, 1) if elapsed else 0.0
+    return summary
+
+
+class Timings:
+    """Per-component latency samples, filled by wrapping methods on live objects."""
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+
+    def record(self, name: str, seconds: float):
+        self.samples[name].append(seconds)
+
+    def wrap_async(self, obj: Any, attr: str, name: str):
+        original = getattr(obj, attr)
+
+        @functools.wraps(original)
+        async def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await original(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - started)
+
+        setattr(obj, attr, timed)
+
+    def wrap_sync(self, obj: Any, attr: str, name: str):
+        original = getattr(obj, attr)
+
+        @functools.wraps(original)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - started)
+
+        setattr(obj, attr, timed)
+
+    def report(self) -> Dict[str, Any]:
+        return {name: summarize(values) for name, values in sorted(self.samples.items())}
+
+
+async def drive(send: Callable[[int], Awaitable[int]], requests: int, concurrency: int,
+                warmup: int = 0) -> Dict[str, Any]:
+    """
+    Runs `requests` calls of send(i) -> status code with `concurrency` concurrent clients
+    (closed loop: each client sends its next request when the previous one returns).
+    """
+    for i in range(warmup):
+        await send(-1 - i)
+
+    counter = iter(range(requests))
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+
+    async def client():
+        for i in counter:
+            started = time.perf_counter()
+            try:
+                status = await send(i)
+            except Exception as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[str(status)] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "statuses": dict(statuses),
+        "latency": summarize(latencies, elapsed),
+    }
+
+
+def environment() -> Dict[str, Any]:
+    """Run metadata so saved reports can be compared like for like."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), timeout=5
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float = 0.10,
+            path: str = "") -> List[str]:
+    """
+    Walks two reports and lists latency metrics (*_ms) that got worse, and throughput
+    (per_second) that dropped, by more than `threshold`.
+    """
+    regressions = []
+    for key, value in current.items():
+        where = f"{path}.{key}" if path else key
+        old = baseline.get(key) if isinstance(baseline, dict) else None
+        if isinstance(value, dict) and isinstance(old, dict):
+            regressions.extend(compare(value, old, threshold, where))
+        elif isinstance(value, (int, float)) and isinstance(old, (int, float)) and old > 0:
+            change = (value - old) / old
+            if key.endswith("_ms") and change > threshold:
+                regressions.append(f"{where}: {old} -> {value} ({change:+.0%})")
+            elif key == "per_second" and -change > threshold:
+                regressions.append(f"{where}: {old} -> {value} ({change:+.0%})")
+    return regressions
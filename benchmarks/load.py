@@ -0,0 +1,233 @@
+import asyncio
+import contextlib
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from benchmarks.harness import Timings, drive
+
+# --- HTTP load tests against the real FastAPI app (fake LLM, stub sandbox) ---
+
+BENCH_API_KEY = "bench-api-key"
+BENCH_PLAN = "bench"
+SCENARIOS = ("spawn_agent", "auth", "jobs_submit", "runtime_graph")
+
+
+def register_bench_plan():
+    from rate_limit import PLAN_LIMITS, PlanLimit
+
+    PLAN_LIMITS[BENCH_PLAN] = PlanLimit(rate=1e9, burst=10 ** 9, daily_tokens=None)
+
+
+def seed_db():
+    """Seeds an API key on the unthrottled plan and lets the worker agent use execute_python."""
+    from os_kernel import PermissionEngine
+    from storage import get_pool
+
+    get_pool("agent_os.db").executescript(f'''
+        CREATE TABLE IF NOT EXISTS api_keys (key TEXT PRIMARY KEY, user_id TEXT, plan TEXT);
+        INSERT OR REPLACE INTO api_keys (key, user_id, plan) VALUES ('{BENCH_API_KEY}', 'bench-user', '{BENCH_PLAN}');
+    ''')
+    PermissionEngine().grant("research_agent", "execute_python")
+
+
+def prepare_app(timings: Timings):
+    """
+    Imports main (install_fakes() must already have run), seeds the DB and wraps the
+    components we break down.
+    """
+    import main
+
+    register_bench_plan()
+    seed_db()
+
+    timings.wrap_async(main.get_orchestrator().app, "ainvoke", "graph")
+    timings.wrap_async(main.get_llm_cache(), "ainvoke", "llm")
+    timings.wrap_async(main.get_memory(), "abuild_context", "memory.build_context")
+    timings.wrap_async(main.get_memory(), "asave_context", "memory.save")
+    timings.wrap_async(main.get_job_queue(), "submit", "jobs.submit")
+    return main
+
+
+def prepare_runtime(timings: Timings):
+    from agent_runtime import AgentOrchestrator
+
+    orchestrator = AgentOrchestrator()
+    timings.wrap_async(orchestrator.llm_cache, "ainvoke", "llm")
+    timings.wrap_async(orchestrator.tools, "acall", "tools")
+    timings.wrap_async(orchestrator.memory, "asave_context", "memory.save")
+    timings.wrap_sync(orchestrator.permissions, "verify_many", "permissions")
+    return orchestrator
+
+
+def _sender(client: httpx.AsyncClient, scenario: str, users: int):
+    headers = {"X-API-Key": BENCH_API_KEY}
+
+    async def send(i: int) -> int:
+        if scenario == "spawn_agent":
+            # Har request ka task alag: SingleFlight coalescing se numbers flatter na hon
+            r = await client.post("/spawn_agent", json={"user_id": f"bench-{i % users}", "task": f"Summarise report #{i}"},
+                                  headers=headers)
+        elif scenario == "auth":
+            r = await client.get(f"/jobs/missing-{i}", headers=headers)
+        elif scenario == "jobs_submit":
+            r = await client.post("/jobs", json={"task": f"Background task #{i}"}, headers=headers)
+        else:
+            raise ValueError(f"Unknown HTTP scenario: {scenario}")
+        return r.status_code
+
+    return send
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextlib.contextmanager
+def _uvicorn_server(app):
+    import uvicorn
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on"))
+    thread = threading.Thread(target=server.run, name="bench-uvicorn", daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 30
+    while not server.started:
+        if time.monotonic() > deadline or not thread.is_alive():
+            raise RuntimeError("uvicorn did not start")
+        time.sleep(0.05)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+
+
+@contextlib.contextmanager
+def _uvicorn_workers(workers: int, fake_options: Dict[str, Any]):
+    """`uvicorn --workers N` in a child process serving benchmarks.worker_app (fakes installed per worker)."""
+    from storage import flush_all
+
+    flush_all()
+    port = _free_port()
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), BENCH_FAKES=json.dumps(fake_options),
+               PYTHONPATH=os.pathsep.join(filter(None, [repo_root, os.environ.get("PYTHONPATH")])))
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.worker_app:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL
+    )
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+async def _wait_for_server(base_url: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url, timeout=5) as client:
+        while True:
+            try:
+                if (await client.get("/readyz")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError("uvicorn workers did not become ready")
+            await asyncio.sleep(0.1)
+
+
+async def _run_http(app, base_url: str, transport, scenarios: List[str], timings: Timings, requests: int,
+                    concurrency: int, users: int, warmup: int) -> Dict[str, Any]:
+    results = {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, transport=transport, limits=limits, timeout=120) as client:
+        # Warm-up background mein chalta hai; numbers tabhi jab app ready ho
+        deadline = time.monotonic() + 60
+        while (await client.get("/readyz")).status_code != 200:
+            if time.monotonic() > deadline:
+                raise RuntimeError("app did not become ready")
+            await asyncio.sleep(0.05)
+        for scenario in scenarios:
+            timings.samples.clear()
+            report = await drive(_sender(client, scenario, users), requests, concurrency, warmup)
+            report["components"] = timings.report()
+            results[scenario] = report
+    return results
+
+
+async def _run_runtime(timings: Timings, requests: int, concurrency: int, warmup: int) -> Dict[str, Any]:
+    orchestrator = prepare_runtime(timings)
+
+    async def send(i: int) -> str:
+        state = {"messages": [f"Check my emails and compute item #{i}"], "error_count": 0}
+        result = await orchestrator.app.ainvoke(state, {"configurable": {"thread_id": f"bench-runtime-{i}"}})
+        return "ok" if not result.get("last_error") else result["last_error"]["kind"]
+
+    timings.samples.clear()
+    report = await drive(send, requests, concurrency, warmup)
+    report["components"] = timings.report()
+    return report
+
+
+def run_workers(scenarios: List[str], requests: int, concurrency: int, users: int, warmup: int,
+                workers: int, fake_options: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Same HTTP scenarios against `uvicorn --workers N` (one DB, shared-state layer on). No
+    component breakdown: the components live in the worker processes.
+    """
+    http_scenarios = [s for s in scenarios if s != "runtime_graph"]
+    seed_db()
+    with _uvicorn_workers(workers, fake_options) as base_url:
+        async def drive_all():
+            await _wait_for_server(base_url)
+            return await _run_http(None, base_url, None, http_scenarios, Timings(), requests, concurrency, users, warmup)
+        results = asyncio.run(drive_all())
+    for report in results.values():
+        report["workers"] = workers
+    return results
+
+
+def run(mode: str, scenarios: List[str], requests: int, concurrency: int, users: int = 50,
+        warmup: int = 5, workers: int = 2, fake_options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    mode: "inprocess" (httpx ASGITransport, same event loop), "uvicorn" (real sockets) or
+    "workers" (`uvicorn --workers N` child process).
+    """
+    if mode == "workers":
+        return run_workers(scenarios, requests, concurrency, users, warmup, workers, fake_options or {})
+    timings = Timings()
+    http_scenarios = [s for s in scenarios if s != "runtime_graph"]
+    results: Dict[str, Any] = {}
+    # agent_runtime / main har step pe print karte hain; report ko saaf rakhne ke liye chup
+    with contextlib.redirect_stdout(io.StringIO()):
+        main = prepare_app(timings)
+        if http_scenarios and mode == "uvicorn":
+            with _uvicorn_server(main.app) as base_url:
+                results.update(asyncio.run(_run_http(
+                    main.app, base_url, None, http_scenarios, timings, requests, concurrency, users, warmup
+                )))
+        elif http_scenarios:
+            async def inprocess():
+                # ASGITransport lifespan events nahi chalata, isliye startup/shutdown khud
+                async with main.app.router.lifespan_context(main.app):
+                    return await _run_http(
+                        main.app, "http://bench", httpx.ASGITransport(app=main.app), http_scenarios,
+                        timings, requests, concurrency, users, warmup
+                    )
+            results.update(asyncio.run(inprocess()))
+        if "runtime_graph" in scenarios:
+            results["runtime_graph"] = asyncio.run(_run_runtime(timings, requests, concurrency, warmup))
+    return results
@@ -0,0 +1,115 @@
+import random
+import time
+from typing import Any, Callable, Dict, List
+
+from benchmarks.harness import summarize
+
+# --- Microbenchmarks: MemoryManager and PermissionEngine at realistic table sizes ---
+
+WORDS = ("invoice report meeting python error deploy budget customer email schedule "
+         "refund latency database agent sandbox quota review release memory search").split()
+
+
+def _sentence(rng: random.Random, n: int = 12) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(n))
+
+
+def _time_calls(fn: Callable[[int], Any], iterations: int) -> Dict[str, Any]:
+    samples: List[float] = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        t = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - t)
+    return summarize(samples, time.perf_counter() - started)
+
+
+def memory_benchmarks(rows: int = 100_000, agents: int = 100, iterations: int = 1000, seed: int = 0) -> Dict[str, Any]:
+    from os_kernel import MemoryManager
+
+    rng = random.Random(seed)
+    memory = MemoryManager(db_path="bench_memory.db")
+    results: Dict[str, Any] = {}
+
+    # Writes: save_context sirf queue karta hai; throughput flush tak ka wall time hai
+    started = time.perf_counter()
+    results["save_context"] = _time_calls(
+        lambda i: memory.save_context(f"agent-{i % agents}", "note", _sentence(rng)), rows
+    )
+    memory.flush()
+    elapsed = time.perf_counter() - started
+    results["save_context"]["durable_rows_per_second"] = round(rows / elapsed, 1)
+
+    large = "x" * 20_000
+    results["save_context_compressed"] = _time_calls(lambda i: memory.save_context("agent-0", "blob", large), 1000)
+    memory.flush()
+
+    agent = lambda i: f"agent-{rng.randrange(agents)}"
+    memory.short_term.clear()
+    results["recent_context_cold"] = _time_calls(lambda i: (memory.short_term.clear(), memory.recent_context(agent(i))), iterations)
+    results["recent_context_cached"] = _time_calls(lambda i: memory.recent_context("agent-1"), iterations)
+    results["query_memory_page"] = _time_calls(lambda i: memory.query_memory(agent(i), limit=100), iterations)
+    results["recent_memory"] = _time_calls(lambda i: memory.recent_memory(agent(i), 10), iterations)
+    results["search_memory"] = _time_calls(lambda i: memory.search_memory(agent(i), _sentence(rng, 3), 5), iterations)
+    results["build_context"] = _time_calls(lambda i: memory.build_context(agent(i), _sentence(rng, 3), 500), iterations)
+    results["storage"] = memory.storage_stats()
+    memory.close()
+    return results
+
+
+def permission_benchmarks(roles: int = 1000, tools_per_role: int = 50, iterations: int = 100_000,
+                          seed: int = 0) -> Dict[str, Any]:
+    from os_kernel import PermissionEngine
+
+    rng = random.Random(seed)
+    engine = PermissionEngine(db_path="bench_permissions.db")
+    tools = [f"tool_{i}" for i in range(tools_per_role * 4)]
+    with engine.pool.connection() as conn:
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO permission_rules (role, tool) VALUES (?, ?)",
+                [(f"role_{r}", t) for r in range(roles) for t in rng.sample(tools, tools_per_role)]
+            )
+            conn.execute("UPDATE permission_version SET version = version + 1 WHERE id = 1")
+    started = time.perf_counter()
+    engine.reload(force=True)
+    compile_ms = round(1000 * (time.perf_counter() - started), 3)
+
+    role = lambda: f"role_{rng.randrange(roles)}"
+    return {
+        "rules": roles * tools_per_role,
+        "compile_ms": compile_ms,
+        "verify_action": _time_calls(lambda i: engine.verify_action(role(), rng.choice(tools)), iterations),
+        "verify_many_5": _time_calls(lambda i: engine.verify_many(role(), rng.sample(tools, 5)), iterations // 5),
+    }
+
+
+def vector_benchmarks(vectors: int = 100_000, dim: int = 256, iterations: int = 200, seed: int = 0) -> Dict[str, Any]:
+    if vectors <= 0:
+        return {"skipped": "disabled"}
+    try:
+        import numpy as np
+    except ImportError:
+        return {"skipped": "numpy not installed"}
+    from vector_memory import HashingEmbedder, VectorMemory
+
+    store = VectorMemory(path="bench_vectors", embedder=HashingEmbedder(dim), db_path="bench_vectors.db")
+    matrix = np.random.default_rng(seed).standard_normal((vectors, dim)).astype(np.float32)
+    started = time.perf_counter()
+    for i, start in enumerate(range(0, vectors, 50_000)):
+        store.add_vectors(f"agent-{i % 10}", matrix[start:start + 50_000])
+    append_s = time.perf_counter() - started
+    return {
+        "vectors": vectors,
+        "append_vectors_per_second": round(vectors / append_s, 1),
+        "search_top10": _time_calls(lambda i: store.search_vector(matrix[i % vectors], 10), iterations),
+        "search_top10_agent": _time_calls(lambda i: store.search_vector(matrix[i % vectors], 10, agent_id="agent-0"), iterations),
+    }
+
+
+def run(rows: int, roles: int, vectors: int, iterations: int) -> Dict[str, Any]:
+    return {
+        "memory": memory_benchmarks(rows=rows, iterations=iterations),
+        "permissions": permission_benchmarks(roles=roles, iterations=iterations * 100),
+        "vectors": vector_benchmarks(vectors=vectors, iterations=iterations // 5 or 1),
+    }
@@ -0,0 +1,120 @@
+"""
+Offline benchmark runner. Nothing here calls OpenRouter or E2B: ChatOpenAI is replaced by a fake
+model and execute_python by a stub sandbox, and every run works in a fresh temp directory.
+
+    python -m benchmarks.run --mode inprocess --clients 32 --requests 2000 --llm-latency 0.05
+    python -m benchmarks.run --mode uvicorn --scenarios spawn_agent auth
+    python -m benchmarks.run --mode workers --workers 4 --llm-latency 0 --clients 64
+    python -m benchmarks.run --mode micro --rows 100000 --roles 1000
+    python -m benchmarks.run --mode gateway --requests 1000 --clients 32
+    python -m benchmarks.run --mode all --out bench.json --compare baseline.json
+
+Each mode runs in its own process (fresh DBs, module state and event loop); the report is JSON.
+With --compare, latencies more than --threshold worse than the baseline (or throughput that
+dropped by as much) are listed and the exit code is 1.
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ("inprocess", "uvicorn", "workers", "micro", "gateway")
+
+
+def parse_args(argv=None):
+    from benchmarks.load import SCENARIOS
+
+    parser = argparse.ArgumentParser(description="Agent OS offline load tests and microbenchmarks")
+    parser.add_argument("--mode", choices=MODES + ("all",), default="inprocess")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--clients", type=int, default=16, help="concurrent clients")
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--users", type=int, default=50, help="distinct user_ids for /spawn_agent")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="fake model latency (s)")
+    parser.add_argument("--llm-jitter", type=float, default=0.0, help="extra uniform random latency (s)")
+    parser.add_argument("--sandbox-latency", type=float, default=0.01)
+    parser.add_argument("--no-tools", action="store_true", help="fake model never calls tools")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=2, help="workers: uvicorn worker processes")
+    parser.add_argument("--rows", type=int, default=100_000, help="micro: agent_memory rows")
+    parser.add_argument("--roles", type=int, default=1000, help="micro: roles (50 tools each)")
+    parser.add_argument("--vectors", type=int, default=100_000, help="micro: vectors (0 to skip)")
+    parser.add_argument("--iterations", type=int, default=1000, help="micro: calls per read benchmark")
+    parser.add_argument("--out", help="write the JSON report here (default: stdout)")
+    parser.add_argument("--compare", help="baseline report to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    return parser.parse_args(argv)
+
+
+def run_mode(args) -> dict:
+    """Runs one mode in this process, inside a scratch directory."""
+    from benchmarks import fakes, gateway, load, micro
+
+    os.chdir(tempfile.mkdtemp(prefix=f"agentos-bench-{args.mode}-"))
+    if args.mode == "micro":
+        return micro.run(rows=args.rows, roles=args.roles, vectors=args.vectors, iterations=args.iterations)
+    if args.mode == "gateway":
+        # Fakes nahi: real ChatOpenAI + httpx pool, sirf upstream local fake server hai
+        return gateway.run(args.requests, args.clients, args.warmup)
+    fake_options = dict(latency=args.llm_latency, jitter=args.llm_jitter, sandbox_latency=args.sandbox_latency,
+                        tool_script=[] if args.no_tools else None, seed=args.seed)
+    fakes.install_fakes(**fake_options)
+    return load.run(args.mode, args.scenarios, args.requests, args.clients, args.users, args.warmup,
+                    workers=args.workers, fake_options=fake_options)
+
+
+def run_all(argv) -> dict:
+    report = {}
+    for mode in MODES:
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+            out = f.name
+        child = [a for a in argv if a not in ("--mode", "all")]
+        # --out/--compare sirf parent ke liye
+        for flag in ("--out", "--compare"):
+            if flag in child:
+                i = child.index(flag)
+                del child[i:i + 2]
+        subprocess.run([sys.executable, "-m", "benchmarks.run", "--mode", mode, "--out", out, *child],
+                       cwd=REPO_ROOT, check=True)
+        with open(out) as f:
+            report[mode] = json.load(f)["results"]
+        os.remove(out)
+    return report
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.ERROR, force=True)
+    from benchmarks.harness import compare, environment
+
+    results = run_all(argv) if args.mode == "all" else {args.mode: run_mode(args)}
+    report = {"environment": environment(), "config": vars(args), "results": results}
+    if args.mode != "all":
+        report["results"] = results[args.mode]
+
+    text = json.dumps(report, indent=2, default=str)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report["results"], baseline["results"], args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, REPO_ROOT)
+    sys.exit(main())
@@ -0,0 +1,12 @@
+import json
+import os
+
+from benchmarks import fakes, load
+
+# --- ASGI entry point for `--mode workers`: har uvicorn worker process ise import karta hai ---
+# install_fakes() main se pehle chalna chahiye, isliye yeh module main ko khud import karta hai.
+
+fakes.install_fakes(**json.loads(os.getenv("BENCH_FAKES", "{}")))
+load.register_bench_plan()
+
+from main import app  # noqa: E402
@@ -0,0 +1,162 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Thread-safe in-process cache bounded by entry count and (approximate) bytes, with TTL expiry.
+    Least-recently-used entries are evicted first once either budget is exceeded.
+    """
+    def __init__(self, max_entries: int = 1024, max_bytes: Optional[int] = None,
+                 ttl: Optional[float] = None, sizeof: Callable[[Any], int] = sys.getsizeof):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (value, expires_at, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # In-flight loads: key -> [loaders, generation]; load ke dauraan write hua toh result cache nahi hota
+        self._loading: Dict[Hashable, list] = {}
+        # Counters taaki cache ko size kar sakein
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at, _ = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        size = self.sizeof(value)
+        with self._lock:
+            self._store(key, value, ttl, size)
+
+    def update(self, key: Hashable, fn: Callable[[Any], Any]) -> bool:
+        """Applies `fn` to a live cached value in place (write-through); returns False on a miss."""
+        with self._lock:
+            self._bump(key)
+            entry = self._data.get(key)
+            if entry is None or (entry[1] is not None and entry[1] <= time.monotonic()):
+                return False
+            value = fn(entry[0])
+            size = self.sizeof(value)
+            self._bytes += size - entry[2]
+            self._data[key] = (value, entry[1], size)
+            self._data.move_to_end(key)
+            self._evict()
+            return True
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any], ttl: Optional[float] = None,
+                    cache_if: Optional[Callable[[Any], bool]] = None) -> Any:
+        """
+        Read-through: returns the cached value or calls `loader` and caches its result (only if
+        `cache_if(result)`, when given). If the key is written (update/delete/clear) while the
+        loader runs, the result is returned but not cached, since it may predate that write.
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        with self._lock:
+            loading = self._loading.setdefault(key, [0, 0])
+            loading[0] += 1
+            generation = loading[1]
+        try:
+            value = loader()
+        except BaseException:
+            with self._lock:
+                self._finish_load(key)
+            raise
+        size = self.sizeof(value)
+        with self._lock:
+            if self._finish_load(key) == generation and (cache_if is None or cache_if(value)):
+                self._store(key, value, ttl, size)
+        return value
+
+    def delete(self, key: Hashable) -> bool:
+        with self._lock:
+            self._bump(key)
+            if key not in self._data:
+                return False
+            self._remove(key)
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+            for loading in self._loading.values():
+                loading[1] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    # --- internals (lock already held) ---
+
+    def _store(self, key: Hashable, value: Any, ttl: Optional[float], size: int):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        if key in self._data:
+            self._remove(key)
+        self._data[key] = (value, expires_at, size)
+        self._bytes += size
+        self._evict()
+
+    def _bump(self, key: Hashable):
+        loading = self._loading.get(key)
+        if loading is not None:
+            loading[1] += 1
+
+    def _finish_load(self, key: Hashable) -> int:
+        """Drops one loader for `key`; returns the key's generation at that point."""
+        loading = self._loading[key]
+        loading[0] -= 1
+        if not loading[0]:
+            del self._loading[key]
+        return loading[1]
+
+    def _remove(self, key: Hashable):
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+
+    def _evict(self):
+        while self._data and (
+            len(self._data) > self.max_entries
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            _, (_, _, size) = self._data.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
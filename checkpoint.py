@@ -0,0 +1,254 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+)
+
+from storage import get_pool, get_write_lock, get_writer
+
+# --- DURABLE GRAPH CHECKPOINTS (SQLite) ---
+# Sibling DB file: checkpoint writes agent_os.db ke memory/jobs writes se lock contention nahi karte.
+DEFAULT_CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", "agent_os.checkpoints.db")
+
+
+class SQLiteCheckpointSaver(BaseCheckpointSaver):
+    """
+    LangGraph checkpointer on our pooled SQLite storage. put()/put_writes() are queued on the
+    write-behind writer (batched commits, no fsync per node); reads flush the queue first so a
+    thread always sees its own latest checkpoint.
+    """
+    def __init__(self, db_path: str = DEFAULT_CHECKPOINT_DB, *, serde=None):
+        super().__init__(serde=serde)
+        self.db_path = db_path
+        self.pool = get_pool(db_path)
+        self.writer = get_writer(db_path)
+        self.write_lock = get_write_lock(db_path)
+        self._bootstrap_db()
+
+    def _bootstrap_db(self):
+        self.pool.executescript('''
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL DEFAULT '',
+                checkpoint_id TEXT NOT NULL,
+                parent_checkpoint_id TEXT,
+                type TEXT,
+                checkpoint BLOB,
+                metadata_type TEXT,
+                metadata BLOB,
+                created_at REAL,
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+            );
+            CREATE TABLE IF NOT EXISTS checkpoint_writes (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL DEFAULT '',
+                checkpoint_id TEXT NOT NULL,
+                task_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                channel TEXT NOT NULL,
+                type TEXT,
+                value BLOB,
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+            );
+            CREATE INDEX IF NOT EXISTS idx_checkpoints_created ON checkpoints (created_at);
+        ''')
+
+    # --- Sync API ---
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        self.writer.flush()
+        configurable = config["configurable"]
+        thread_id = configurable["thread_id"]
+        checkpoint_ns = configurable.get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        columns = "checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata"
+        if checkpoint_id:
+            rows = self.pool.execute(
+                f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                (thread_id, checkpoint_ns, checkpoint_id)
+            )
+        else:
+            rows = self.pool.execute(
+                f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC LIMIT 1",
+                (thread_id, checkpoint_ns)
+            )
+        if not rows:
+            return None
+        return self._to_tuple(thread_id, checkpoint_ns, rows[0])
+
+    def list(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+             before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        self.writer.flush()
+        where, params = [], []
+        if config is not None:
+            where.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            checkpoint_ns = config["configurable"].get("checkpoint_ns")
+            if checkpoint_ns is not None:
+                where.append("checkpoint_ns = ?")
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                where.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before is not None and (before_id := get_checkpoint_id(before)):
+            where.append("checkpoint_id < ?")
+            params.append(before_id)
+        sql = (
+            "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata "
+            f"FROM checkpoints {'WHERE ' + ' AND '.join(where) if where else ''} ORDER BY checkpoint_id DESC"
+        )
+        emitted = 0
+        for thread_id, checkpoint_ns, *row in self.pool.execute(sql, params):
+            tup = self._to_tuple(thread_id, checkpoint_ns, row)
+            if filter and any(tup.metadata.get(k) != v for k, v in filter.items()):
+                continue
+            yield tup
+            emitted += 1
+            if limit is not None and emitted >= limit:
+                return
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        configurable = config["configurable"]
+        thread_id = configurable["thread_id"]
+        checkpoint_ns = configurable.get("checkpoint_ns", "")
+        type_, blob = self.serde.dumps_typed(checkpoint)
+        metadata_type, metadata_blob = self.serde.dumps_typed(dict(metadata))
+        self.writer.submit(
+            "INSERT OR REPLACE INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, "
+            "type, checkpoint, metadata_type, metadata, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (thread_id, checkpoint_ns, checkpoint["id"], configurable.get("checkpoint_id"),
+             type_, blob, metadata_type, metadata_blob, time.time())
+        )
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                   task_path: str = "") -> None:
+        configurable = config["configurable"]
+        # Special channels (errors, interrupts) ka fixed idx hota hai aur woh overwrite karte hain
+        verb = "INSERT OR REPLACE" if all(channel in WRITES_IDX_MAP for channel, _ in writes) else "INSERT OR IGNORE"
+        for idx, (channel, value) in enumerate(writes):
+            type_, blob = self.serde.dumps_typed(value)
+            self.writer.submit(
+                f"{verb} INTO checkpoint_writes (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (configurable["thread_id"], configurable.get("checkpoint_ns", ""), configurable["checkpoint_id"],
+                 task_id, WRITES_IDX_MAP.get(channel, idx), channel, type_, blob)
+            )
+
+    def delete_thread(self, thread_id: str) -> None:
+        self.writer.submit("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+        self.writer.submit("DELETE FROM checkpoint_writes WHERE thread_id = ?", (thread_id,))
+        self.writer.flush()
+
+    def _to_tuple(self, thread_id: str, checkpoint_ns: str, row) -> CheckpointTuple:
+        checkpoint_id, parent_id, type_, blob, metadata_type, metadata_blob = row
+        writes = self.pool.execute(
+            "SELECT task_id, channel, type, value FROM checkpoint_writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id)
+        )
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+            checkpoint=self.serde.loads_typed((type_, blob)),
+            metadata=self.serde.loads_typed((metadata_type, metadata_blob)) if metadata_blob else {},
+            parent_config=(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_id}}
+                if parent_id else None
+            ),
+            pending_writes=[(task_id, channel, self.serde.loads_typed((t, v))) for task_id, channel, t, v in writes],
+        )
+
+    # --- Async API (SQLite kaam thread pe, event loop free) ---
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+                    before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        # Sirf queue pe submit hota hai, isliye seedha call (thread hop ki zaroorat nahi)
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                          task_path: str = "") -> None:
+        self.put_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    # --- Retention / compaction ---
+
+    def prune(self, keep_last: int = 20, max_age_days: Optional[float] = 7.0) -> int:
+        """
+        Keeps the newest `keep_last` checkpoints per thread/namespace, drops anything older than
+        `max_age_days`, removes orphaned writes and truncates the WAL. Returns rows deleted.
+        """
+        self.writer.flush()
+        with self.pool.connection() as conn, self.write_lock:
+            with conn:
+                deleted = conn.execute('''
+                    DELETE FROM checkpoints WHERE rowid IN (
+                        SELECT rowid FROM (
+                            SELECT rowid, ROW_NUMBER() OVER (
+                                PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC
+                            ) AS rn FROM checkpoints
+                        ) WHERE rn > ?
+                    )
+                ''', (keep_last,)).rowcount
+                if max_age_days is not None:
+                    deleted += conn.execute(
+                        "DELETE FROM checkpoints WHERE created_at < ?", (time.time() - max_age_days * 86400,)
+                    ).rowcount
+                deleted += conn.execute('''
+                    DELETE FROM checkpoint_writes WHERE NOT EXISTS (
+                        SELECT 1 FROM checkpoints c WHERE c.thread_id = checkpoint_writes.thread_id
+                        AND c.checkpoint_ns = checkpoint_writes.checkpoint_ns
+                        AND c.checkpoint_id = checkpoint_writes.checkpoint_id
+                    )
+                ''').rowcount
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        if deleted:
+            logging.info(f"🧹 Pruned {deleted} checkpoint rows.")
+        return deleted
+
+    def start_retention(self, interval: float = 3600.0, **prune_kwargs):
+        """Runs prune() every `interval` seconds on a daemon thread."""
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.prune(**prune_kwargs)
+                except Exception as e:
+                    logging.error(f"❌ Checkpoint pruning failed: {e}")
+        threading.Thread(target=loop, name="checkpoint-retention", daemon=True).start()
+
+
+_checkpointer: Optional[SQLiteCheckpointSaver] = None
+_lock = threading.Lock()
+
+
+def get_checkpointer() -> SQLiteCheckpointSaver:
+    """Process-wide checkpointer shared by both orchestrators."""
+    global _checkpointer
+    with _lock:
+        if _checkpointer is None:
+            _checkpointer = SQLiteCheckpointSaver()
+        return _checkpointer
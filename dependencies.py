@@ -1,21 +1,132 @@
 # dependencies.py
-import sqlite3
-from fastapi import Security, HTTPException, status
+import hashlib
+import time
+from typing import Optional
+from fastapi import Depends, Response, Security, HTTPException, status
 from fastapi.security.api_key import APIKeyHeader
+from starlette.concurrency import run_in_threadpool
+
+from cache import LRUCache
+from rate_limit import rate_limiter
+from shared_state import bus
+from storage import get_pool
 
 api_key_header = APIKeyHeader(name="X-API-Key", auto_error=True)
 
+DB_PATH = "agent_os.db"
+
+# In-process auth cache: sha256(key) -> (user_id, plan).
+KEY_CACHE_TTL = 60.0
+_key_cache = LRUCache(max_entries=10000, ttl=KEY_CACHE_TTL)
+# Invalid keys ka alag, chhota LRU: brute-force traffic SQLite tak nahi pahunchta,
+# aur random keys ki baadh valid keys ko cache se evict nahi kar sakti
+NEGATIVE_CACHE_TTL = 5.0
+_invalid_key_cache = LRUCache(max_entries=1000, ttl=NEGATIVE_CACHE_TTL)
+
+
+def _key_digest(api_key: str) -> bytes:
+    # Raw keys memory mein cache nahi karte
+    return hashlib.sha256(api_key.encode()).digest()
+
+
+def _lookup_api_key(api_key: str):
+    rows = get_pool(DB_PATH).execute("SELECT user_id, plan FROM api_keys WHERE key = ?", (api_key,))
+    return rows[0] if rows else None
+
+
+def _load_api_key(api_key: str, digest: bytes):
+    """
+    One DB lookup that fills the positive or the negative cache. Both loads span the lookup, so a
+    revoke (invalidate_api_key) landing mid-lookup leaves neither cache holding a stale answer.
+    """
+    return _invalid_key_cache.get_or_load(
+        digest,
+        lambda: _key_cache.get_or_load(digest, lambda: _lookup_api_key(api_key), cache_if=bool),
+        cache_if=lambda user: not user,
+    )
+
+
+def _drop_cached_key(digest_hex: Optional[str]):
+    if digest_hex is None:
+        _key_cache.clear()
+        _invalid_key_cache.clear()
+    else:
+        digest = bytes.fromhex(digest_hex)
+        _key_cache.delete(digest)
+        _invalid_key_cache.delete(digest)
+
+
+def invalidate_api_key(api_key: Optional[str] = None):
+    """
+    Call when a key is revoked or its plan changes; no argument clears the whole cache.
+    Other worker processes drop it too (via the invalidation bus, within its poll interval).
+    """
+    digest_hex = None if api_key is None else _key_digest(api_key).hex()
+    _drop_cached_key(digest_hex)
+    bus.publish("api_keys", digest_hex)
+
+
+bus.subscribe("api_keys", _drop_cached_key)
+
+
 async def verify_api_key(api_key: str = Security(api_key_header)):
-    # Note: In a production app, use a connection pool instead of opening/closing every time
-    conn = sqlite3.connect("agent_os.db")
-    cursor = conn.cursor()
-    cursor.execute("SELECT user_id, plan FROM api_keys WHERE key = ?", (api_key,))
-    user = cursor.fetchone()
-    conn.close()
+    digest = _key_digest(api_key)
+    user = _key_cache.get(digest)
+    if user is None and digest not in _invalid_key_cache:
+        user = await run_in_threadpool(_load_api_key, api_key, digest)
 
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid API Key. Get one at dashboard.agentos.com"
         )
-    return user
\ No newline at end of file
+    return user
+
+
+def rate_limit_key(api_key: str) -> str:
+    """Stable, non-reversible id for an API key (rate-limit and quota counters use this)."""
+    return _key_digest(api_key).hex()[:32]
+
+
+async def enforce_rate_limit(response: Response, api_key: str = Security(api_key_header),
+                             user: tuple = Depends(verify_api_key)):
+    """Per-key token bucket sized by plan; sets X-RateLimit-* headers. Returns (user_id, plan, rate_key)."""
+    user_id, plan = user
+    key = rate_limit_key(api_key)
+    decision = rate_limiter.check_request(key, plan)
+    if not decision.allowed:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Rate limit exceeded for plan '{plan}'.",
+            headers=decision.headers()
+        )
+    response.headers.update(decision.headers())
+    return user_id, plan, key
+
+
+async def enforce_token_quota(response: Response, user_info: tuple = Depends(enforce_rate_limit)):
+    """
+    enforce_rate_limit + 429 once the key's daily LLM token quota is used up. For every route that
+    runs the agent graph; the run itself is metered from the model's usage (rate_limit.metering).
+    """
+    _, plan, key = user_info
+    remaining = rate_limiter.quota_remaining(key, plan)
+    if remaining is not None:
+        if remaining <= 0:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=f"Daily LLM token quota exhausted for plan '{plan}'.",
+                headers={"Retry-After": str(int(86400 - time.time() % 86400))}
+            )
+        response.headers["X-TokenQuota-Remaining"] = str(remaining)
+    return user_info
+
+
+def scoped_user_id(owner: str, requested: Optional[str] = None) -> str:
+    """
+    Memory/thread namespace for a request. Callers may split their traffic by end user, but those
+    ids always live under the API key's own user_id, so one key can't read another's memory.
+    """
+    if not requested or requested == owner:
+        return owner
+    return f"{owner}/{requested}"
@@ -0,0 +1,231 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Collection, Dict, Optional
+
+from storage import get_pool, get_write_lock
+
+# --- JOB QUEUE: background agent runs with per-plan worker pools ---
+
+# Plan -> max concurrently running jobs. Override with JOB_PLAN_LIMITS="free=2,pro=8".
+DEFAULT_PLAN_LIMITS = {"free": 2, "pro": 8, "enterprise": 32}
+
+
+def _plan_limits_from_env() -> Dict[str, int]:
+    limits = dict(DEFAULT_PLAN_LIMITS)
+    for item in filter(None, os.getenv("JOB_PLAN_LIMITS", "").split(",")):
+        plan, _, value = item.partition("=")
+        limits[plan.strip()] = int(value)
+    return limits
+
+
+class QueueFull(Exception):
+    """Raised by submit() when the backlog is at capacity (callers should answer 429)."""
+
+
+class JobQueue:
+    """
+    SQLite-persisted job queue. Each plan has its own in-memory queue and its own workers
+    (so a free-plan backlog never blocks paid plans), and a global cap bounds total concurrency.
+    Jobs left queued or running by a previous process are picked up again on start(); finished
+    jobs are deleted after a retention period by prune() / start_retention().
+
+    With several worker processes on one DB, a job is claimed by a conditional UPDATE (exactly
+    one worker runs it) and start() only re-queues 'running' jobs whose owner is not in
+    `live_workers()`.
+    """
+    def __init__(self, runner: Callable[[Dict[str, Any]], Awaitable[Any]], db_path: str = "agent_os.db",
+                 max_running: int = 16, max_queued: int = 1000, plan_limits: Optional[Dict[str, int]] = None,
+                 default_plan_limit: int = 1, worker_id: Optional[str] = None,
+                 live_workers: Optional[Callable[[], Collection[str]]] = None):
+        self.runner = runner
+        self.pool = get_pool(db_path)
+        self.write_lock = get_write_lock(db_path)
+        self.worker_id = worker_id or str(os.getpid())
+        self.live_workers = live_workers
+        self.max_queued = max_queued
+        self.plan_limits = plan_limits or _plan_limits_from_env()
+        self.default_plan_limit = default_plan_limit
+        self._running = asyncio.Semaphore(max_running)
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._workers: list = []
+        self._enqueued: set = set()   # job ids queued ya chal rahe (is process mein): recovery inhe dobara nahi daalti
+        self._depth = 0
+        self._bootstrap_db()
+
+    def _bootstrap_db(self):
+        self.pool.executescript('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                user_id TEXT,
+                plan TEXT,
+                meter_key TEXT,
+                task TEXT,
+                status TEXT,
+                result TEXT,
+                error TEXT,
+                created_at REAL,
+                started_at REAL,
+                finished_at REAL,
+                worker TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at);
+        ''')
+        # Purani DB files mein meter_key / worker columns nahi hote
+        columns = {row[1] for row in self.pool.execute("PRAGMA table_info(jobs)", ())}
+        for column in ("meter_key", "worker"):
+            if column not in columns:
+                self._write(f"ALTER TABLE jobs ADD COLUMN {column} TEXT", ())
+
+    def _write(self, sql: str, params: tuple) -> int:
+        # Job state changes durable hone chahiye, isliye write-behind nahi, seedha commit
+        with self.pool.connection() as conn, self.write_lock:
+            with conn:
+                return conn.execute(sql, params).rowcount
+
+    # --- Lifecycle ---
+
+    async def start(self):
+        """Re-queues unfinished jobs from the DB; workers are started per plan on demand."""
+        running = await asyncio.to_thread(self.pool.execute, "SELECT id, worker FROM jobs WHERE status = 'running'", ())
+        live = set(await asyncio.to_thread(self.live_workers)) if self.live_workers else set()
+        # Zinda worker ke running jobs ko haath nahi lagate; baaki (crash / purana process) wapas queue
+        for job_id, worker in running:
+            if worker not in live or worker == self.worker_id:
+                await asyncio.to_thread(
+                    self._write, "UPDATE jobs SET status = 'queued', started_at = NULL, worker = NULL "
+                                 "WHERE id = ? AND status = 'running'", (job_id,)
+                )
+        rows = await asyncio.to_thread(
+            self.pool.execute, "SELECT id, plan FROM jobs WHERE status = 'queued' ORDER BY created_at", ()
+        )
+        # submit() se pehle hi queue mein aaye jobs skip: warna har job do baar claim hota
+        rows = [(job_id, plan) for job_id, plan in rows if job_id not in self._enqueued]
+        for job_id, plan in rows:
+            self._enqueue(job_id, plan)
+        if rows:
+            logging.info(f"♻️ Recovered {len(rows)} unfinished job(s) from the queue.")
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+
+    def _queue_for(self, plan: str) -> asyncio.Queue:
+        queue = self._queues.get(plan)
+        if queue is None:
+            queue = self._queues[plan] = asyncio.Queue()
+            for _ in range(self.plan_limits.get(plan, self.default_plan_limit)):
+                self._workers.append(asyncio.create_task(self._worker(queue)))
+        return queue
+
+    def _enqueue(self, job_id: str, plan: str):
+        if job_id in self._enqueued:
+            return
+        self._enqueued.add(job_id)
+        self._depth += 1
+        self._queue_for(plan).put_nowait(job_id)
+
+    # --- Retention ---
+
+    def prune(self, max_age_days: float = 7.0) -> int:
+        """Deletes succeeded/failed jobs that finished more than `max_age_days` ago. Returns rows deleted."""
+        deleted = self._write(
+            "DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND finished_at < ?",
+            (time.time() - max_age_days * 86400,)
+        )
+        if deleted:
+            logging.info(f"🧹 Pruned {deleted} finished job(s).")
+        return deleted
+
+    def start_retention(self, interval: float = 3600.0, **prune_kwargs):
+        """Runs prune() every `interval` seconds on a daemon thread."""
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.prune(**prune_kwargs)
+                except Exception as e:
+                    logging.error(f"❌ Job pruning failed: {e}")
+        threading.Thread(target=loop, name="job-retention", daemon=True).start()
+
+    # --- API ---
+
+    async def submit(self, user_id: str, plan: str, task: str, meter_key: Optional[str] = None) -> str:
+        """
+        Persists a job and returns its id immediately; raises QueueFull when shedding load.
+        `meter_key` identifies whose LLM token quota the run is charged to.
+        """
+        if self._depth >= self.max_queued:
+            raise QueueFull(f"{self._depth} jobs queued")
+        job_id = uuid.uuid4().hex
+        await asyncio.to_thread(
+            self._write,
+            "INSERT INTO jobs (id, user_id, plan, meter_key, task, status, created_at) VALUES (?, ?, ?, ?, ?, 'queued', ?)",
+            (job_id, user_id, plan, meter_key, task, time.time())
+        )
+        self._enqueue(job_id, plan)
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        rows = self.pool.execute(
+            "SELECT id, user_id, plan, meter_key, task, status, result, error, created_at, started_at, finished_at FROM jobs WHERE id = ?",
+            (job_id,)
+        )
+        if not rows:
+            return None
+        keys = ("id", "user_id", "plan", "meter_key", "task", "status", "result", "error", "created_at", "started_at", "finished_at")
+        job = dict(zip(keys, rows[0]))
+        if job["result"] is not None:
+            job["result"] = json.loads(job["result"])
+        return job
+
+    async def aget(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.get, job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"queued": self._depth, "per_plan": {plan: q.qsize() for plan, q in self._queues.items()}}
+
+    # --- Worker ---
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            job_id = await queue.get()
+            self._depth -= 1
+            try:
+                async with self._running:
+                    await self._execute(job_id)
+            finally:
+                # Claim/run khatam hone tak tracked: beech mein start() chale toh bhi dobara queue nahi
+                self._enqueued.discard(job_id)
+
+    async def _execute(self, job_id: str):
+        # Claim: har worker recovered queued jobs dekhta hai, par UPDATE sirf ek ka succeed hota hai
+        claimed = await asyncio.to_thread(
+            self._write, "UPDATE jobs SET status = 'running', started_at = ?, worker = ? WHERE id = ? AND status = 'queued'",
+            (time.time(), self.worker_id, job_id)
+        )
+        if not claimed:
+            return
+        job = await self.aget(job_id)
+        try:
+            result = await self.runner(job)
+        except asyncio.CancelledError:
+            # Shutdown: job 'running' reh jayega aur agle start() pe dobara queue hoga
+            raise
+        except Exception as e:
+            logging.error(f"❌ Job {job_id} failed: {e}")
+            await asyncio.to_thread(
+                self._write, "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                (str(e), time.time(), job_id)
+            )
+            return
+        await asyncio.to_thread(
+            self._write, "UPDATE jobs SET status = 'succeeded', result = ?, finished_at = ? WHERE id = ?",
+            (json.dumps(result, default=str), time.time(), job_id)
+        )
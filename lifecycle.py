@@ -0,0 +1,152 @@
+import asyncio
+import inspect
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Generic, List, Optional, Tuple, TypeVar, Union
+
+# --- LIFECYCLE: lazy components, startup warm-up, health/readiness ---
+# Import sirf cheap kaam karta hai; DB / LLM client / graph pehli zaroorat pe (ya warm-up mein) bante hain.
+
+_IMPORTED_AT = time.perf_counter()
+
+T = TypeVar("T")
+
+
+class Lazy(Generic[T]):
+    """Thread-safe, build-once holder: the factory runs on the first get(), never twice."""
+    def __init__(self, name: str, factory: Callable[[], T]):
+        self.name = name
+        self.factory = factory
+        self.build_seconds: Optional[float] = None
+        self._value: Optional[T] = None
+        self._built = False
+        self._lock = threading.Lock()
+
+    def get(self) -> T:
+        if self._built:
+            return self._value
+        with self._lock:
+            if not self._built:
+                started = time.perf_counter()
+                self._value = self.factory()
+                self.build_seconds = time.perf_counter() - started
+                self._built = True
+                logging.info(f"🔧 {self.name} initialised in {self.build_seconds * 1000:.0f} ms")
+        return self._value
+
+    def peek(self) -> Optional[T]:
+        """The value if already built, else None (never triggers construction)."""
+        return self._value if self._built else None
+
+    @property
+    def built(self) -> bool:
+        return self._built
+
+
+WarmupFn = Callable[[], Union[None, Awaitable[None]]]
+
+
+class Lifecycle:
+    """
+    Registry of lazy components and ordered warm-up steps. run_warmup() executes the steps at
+    startup (sync steps in a thread so the loop stays responsive to /healthz) and flips
+    readiness; report() gives import time, per-step timings and time-to-ready.
+    """
+    STARTING, WARMING, READY, FAILED = "starting", "warming", "ready", "failed"
+
+    def __init__(self):
+        self.state = self.STARTING
+        self.import_seconds: Optional[float] = None
+        self.time_to_ready: Optional[float] = None
+        self.error: Optional[str] = None
+        self._components: Dict[str, Lazy] = {}
+        self._steps: List[Tuple[str, WarmupFn]] = []
+        self._step_seconds: Dict[str, float] = {}
+        self._checks: List[Tuple[str, Callable[[], Any]]] = []
+
+    def component(self, name: str, factory: Callable[[], T]) -> Lazy[T]:
+        lazy = self._components[name] = Lazy(name, factory)
+        return lazy
+
+    def get(self, name: str) -> Any:
+        """Cross-module access (e.g. routers) without importing main."""
+        return self._components[name].get()
+
+    def peek(self, name: str) -> Any:
+        lazy = self._components.get(name)
+        return lazy.peek() if lazy else None
+
+    def warmup(self, name: str):
+        """Decorator: registers a warm-up step; steps run in registration order."""
+        def register(fn: WarmupFn) -> WarmupFn:
+            self._steps.append((name, fn))
+            return fn
+        return register
+
+    def readiness_check(self, name: str):
+        """Decorator: a cheap check run on every /readyz (raise to report not ready)."""
+        def register(fn: Callable[[], Any]):
+            self._checks.append((name, fn))
+            return fn
+        return register
+
+    def mark_imported(self):
+        """Call at the end of the app module: everything since lifecycle import counts as import time."""
+        self.import_seconds = time.perf_counter() - _IMPORTED_AT
+        logging.info(f"📦 App imported in {self.import_seconds * 1000:.0f} ms")
+
+    async def run_warmup(self):
+        self.state = self.WARMING
+        try:
+            for name, fn in self._steps:
+                started = time.perf_counter()
+                if inspect.iscoroutinefunction(fn):
+                    await fn()
+                else:
+                    await asyncio.to_thread(fn)
+                self._step_seconds[name] = time.perf_counter() - started
+        except Exception as e:
+            self.state = self.FAILED
+            self.error = f"{name}: {e}"
+            logging.error(f"❌ Warm-up step {name} failed: {e}")
+            raise
+        self.time_to_ready = time.perf_counter() - _IMPORTED_AT
+        self.state = self.READY
+        logging.info(f"🚀 Ready in {self.time_to_ready * 1000:.0f} ms "
+                     f"(import {(self.import_seconds or 0) * 1000:.0f} ms, warm-up {sum(self._step_seconds.values()) * 1000:.0f} ms)")
+
+    @property
+    def ready(self) -> bool:
+        return self.state == self.READY
+
+    def check(self) -> Dict[str, str]:
+        """Runs readiness checks; returns name -> "ok" or the error."""
+        results = {}
+        for name, fn in self._checks:
+            try:
+                fn()
+                results[name] = "ok"
+            except Exception as e:
+                results[name] = f"error: {e}"
+        return results
+
+    def report(self) -> Dict[str, Any]:
+        def ms(seconds: Optional[float]) -> Optional[float]:
+            return round(seconds * 1000, 1) if seconds is not None else None
+
+        return {
+            "state": self.state,
+            "error": self.error,
+            "import_ms": ms(self.import_seconds),
+            "time_to_ready_ms": ms(self.time_to_ready),
+            "uptime_s": round(time.perf_counter() - _IMPORTED_AT, 1),
+            "warmup_ms": {name: ms(s) for name, s in self._step_seconds.items()},
+            "components": {
+                name: {"built": lazy.built, "init_ms": ms(lazy.build_seconds)}
+                for name, lazy in self._components.items()
+            },
+        }
+
+
+lifecycle = Lifecycle()
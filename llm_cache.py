@@ -0,0 +1,224 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional
+
+from langchain_core.messages import convert_to_messages, message_to_dict, messages_from_dict
+
+import metrics
+from cache import LRUCache
+from rate_limit import meter_llm_usage
+from storage import get_pool, get_writer
+
+# --- LLM RESPONSE CACHE: in-memory LRU front + SQLite persistent tier ---
+# Same (model, messages, tools, temperature) dobara aaye toh OpenRouter ko call nahi karte.
+
+
+def _env_flag(name: str, default: bool = False) -> bool:
+    return os.getenv(name, "1" if default else "0").lower() in ("1", "true", "yes", "on")
+
+
+class LLMResponseCache:
+    """
+    Opt-in response cache for chat model calls. Routes (e.g. "spawn_agent", "worker") can be
+    enabled or disabled individually; disabled routes pass straight through to the model.
+    """
+    def __init__(self, db_path: str = "agent_os.db", enabled: Optional[bool] = None,
+                 ttl: Optional[float] = None, max_entries: int = 512,
+                 routes: Optional[Dict[str, bool]] = None, bus=None):
+        self.enabled = _env_flag("LLM_CACHE_ENABLED") if enabled is None else enabled
+        self.ttl = float(os.getenv("LLM_CACHE_TTL", "3600")) if ttl is None else ttl
+        self.routes: Dict[str, bool] = dict(routes or {})
+        self.front = LRUCache(max_entries=max_entries, ttl=self.ttl)
+        self.pool = get_pool(db_path)
+        self.writer = get_writer(db_path)
+        self.counters: Dict[str, Dict[str, int]] = defaultdict(lambda: {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0})
+        # Multi-worker: invalidate() doosre workers ke front tier se bhi hatata hai (shared_state.InvalidationBus)
+        self.bus = bus
+        if bus is not None:
+            bus.subscribe("llm_cache", self._drop_front)
+        self._bootstrap_db()
+
+    def _bootstrap_db(self):
+        self.pool.executescript('''
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                cache_key TEXT PRIMARY KEY,
+                model TEXT,
+                response TEXT,
+                created_at REAL,
+                expires_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_llm_cache_expires ON llm_cache (expires_at);
+        ''')
+
+    # --- Route switches ---
+
+    def enable_route(self, route: str):
+        self.routes[route] = True
+
+    def disable_route(self, route: str):
+        self.routes[route] = False
+
+    def is_enabled(self, route: str) -> bool:
+        return self.routes.get(route, self.enabled)
+
+    # --- Keying ---
+
+    @staticmethod
+    def describe(llm) -> Dict[str, Any]:
+        """
+        Pulls model name, bound tools and temperature out of a chat model or bind_tools() binding.
+        For the LLM gateway the key also covers every candidate's model and temperature, since
+        any of them may answer.
+        """
+        model = getattr(llm, "bound", llm)
+        bound_kwargs = getattr(llm, "kwargs", {}) or {}
+        description = {
+            "model": LLMResponseCache._model_name(model),
+            "tools": bound_kwargs.get("tools"),
+            "tool_choice": bound_kwargs.get("tool_choice"),
+            "temperature": bound_kwargs.get("temperature", getattr(model, "temperature", None)),
+        }
+        candidates = getattr(model, "candidates", None)
+        if candidates:
+            description["candidates"] = sorted(
+                [name, LLMResponseCache._model_name(candidate), getattr(candidate, "temperature", None)]
+                for name, candidate in candidates.items()
+            )
+        return description
+
+    @staticmethod
+    def _model_name(model) -> str:
+        return getattr(model, "model_name", None) or getattr(model, "model", None) or type(model).__name__
+
+    @staticmethod
+    def _normalize(messages: Any) -> List[Dict[str, Any]]:
+        if isinstance(messages, str):
+            messages = [messages]
+        return [message_to_dict(m) for m in convert_to_messages(messages)]
+
+    def make_key(self, llm, messages: Any) -> str:
+        payload = dict(self.describe(llm), messages=self._normalize(messages))
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+    # --- Tiers ---
+
+    def _load(self, key: str):
+        rows = self.pool.execute(
+            "SELECT response, expires_at FROM llm_cache WHERE cache_key = ?", (key,)
+        )
+        if not rows or rows[0][1] <= time.time():
+            return None
+        return messages_from_dict([json.loads(rows[0][0])])[0]
+
+    def _store(self, key: str, llm, response, ttl: float):
+        self.front.set(key, response, ttl)
+        now = time.time()
+        self.writer.submit(
+            "INSERT OR REPLACE INTO llm_cache (cache_key, model, response, created_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+            (key, self.describe(llm)["model"], json.dumps(message_to_dict(response)), now, now + ttl)
+        )
+
+    def _lookup_front(self, route: str, key: str):
+        response = self.front.get(key)
+        if response is not None:
+            self.counters[route]["memory_hits"] += 1
+        return response
+
+    def _after_disk(self, route: str, key: str, response):
+        if response is not None:
+            self.counters[route]["disk_hits"] += 1
+            self.front.set(key, response)
+        else:
+            self.counters[route]["misses"] += 1
+        return response
+
+    def _observe(self, llm, route: str, result: str, response, started: float, messages: Any = None):
+        # Failed calls raise before this point; their latency shows up in the node timings
+        model = str(self.describe(llm)["model"])
+        elapsed = time.perf_counter() - started
+        metrics.LLM_SECONDS.observe(elapsed, route=route, model=model, cache=result)
+        metrics.LLM_CACHE_LOOKUPS.inc(route=route, result=result)
+        metrics.record(metrics.LLM_SECONDS.name, elapsed, {"route": route})
+        if result != "hit":
+            metrics.observe_llm_usage(response, route, model)
+            # Daily token quota: asli model call ka usage, us key pe jisne run shuru kiya (cache hit free)
+            meter_llm_usage(response, messages)
+
+    # --- Public API ---
+
+    def invoke(self, llm, messages: Any, route: str = "default", ttl: Optional[float] = None):
+        """Cached `llm.invoke(messages)`."""
+        started = time.perf_counter()
+        if not self.is_enabled(route):
+            self.counters[route]["bypassed"] += 1
+            response = llm.invoke(messages)
+            self._observe(llm, route, "bypass", response, started, messages)
+            return response
+        key = self.make_key(llm, messages)
+        response = self._lookup_front(route, key)
+        if response is None:
+            response = self._after_disk(route, key, self._load(key))
+        result = "hit"
+        if response is None:
+            result = "miss"
+            response = llm.invoke(messages)
+            self._store(key, llm, response, self.ttl if ttl is None else ttl)
+        self._observe(llm, route, result, response, started, messages)
+        return response
+
+    async def ainvoke(self, llm, messages: Any, route: str = "default", ttl: Optional[float] = None):
+        """Cached `await llm.ainvoke(messages)`; the SQLite tier is read off the event loop."""
+        started = time.perf_counter()
+        if not self.is_enabled(route):
+            self.counters[route]["bypassed"] += 1
+            response = await llm.ainvoke(messages)
+            self._observe(llm, route, "bypass", response, started, messages)
+            return response
+        key = self.make_key(llm, messages)
+        response = self._lookup_front(route, key)
+        if response is None:
+            response = self._after_disk(route, key, await asyncio.to_thread(self._load, key))
+        result = "hit"
+        if response is None:
+            result = "miss"
+            response = await llm.ainvoke(messages)
+            self._store(key, llm, response, self.ttl if ttl is None else ttl)
+        self._observe(llm, route, result, response, started, messages)
+        return response
+
+    def invalidate(self, keys: Optional[Iterable[str]] = None):
+        """Drops specific keys, or the whole cache when called without arguments."""
+        if keys is None:
+            self.front.clear()
+            self.writer.submit("DELETE FROM llm_cache", ())
+            if self.bus is not None:
+                self.bus.publish("llm_cache")
+            return
+        for key in keys:
+            self.front.delete(key)
+            self.writer.submit("DELETE FROM llm_cache WHERE cache_key = ?", (key,))
+            if self.bus is not None:
+                self.bus.publish("llm_cache", key)
+
+    def _drop_front(self, key: Optional[str]):
+        if key is None:
+            self.front.clear()
+        else:
+            self.front.delete(key)
+
+    def purge_expired(self):
+        self.writer.submit("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),))
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-route hit/miss counters and hit rate, plus front-tier cache stats."""
+        routes = {}
+        for route, c in self.counters.items():
+            hits = c["memory_hits"] + c["disk_hits"]
+            lookups = hits + c["misses"]
+            routes[route] = dict(c, hit_rate=hits / lookups if lookups else 0.0, enabled=self.is_enabled(route))
+        return {"enabled": self.enabled, "routes": routes, "front": self.front.stats()}
+
@@ -0,0 +1,397 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+from collections import deque
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from langchain_openai import ChatOpenAI
+
+import metrics
+from resilience import ErrorKind, breakers, classify_exception
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# --- LLM GATEWAY: shared HTTP pool, latency-aware model routing, hedged requests ---
+# Dono orchestrators ek hi RoutedChatModel use karte hain: ek connection pool, ek set of stats.
+
+DEFAULT_MODELS = "google/gemini-2.0-flash-exp:free"
+DEFAULT_BASE_URL = "https://openrouter.ai/api/v1"
+DEFAULT_HEADERS = {
+    "HTTP-Referer": "http://localhost:8000",  # OpenRouter ke liye zaroori
+    "X-Title": "Agent OS Interface",
+}
+
+GATEWAY_REQUESTS = metrics.registry.counter("llm_gateway_requests_total", "Upstream LLM requests by model and outcome.", ("model", "outcome"))
+GATEWAY_SECONDS = metrics.registry.histogram("llm_gateway_upstream_seconds", "Upstream LLM latency per model.", ("model",))
+GATEWAY_HEDGES = metrics.registry.counter("llm_gateway_hedges_total", "Hedged duplicate requests by which one won.", ("winner",))
+
+
+# --- Shared HTTP clients ---
+
+_clients: Optional[Tuple[httpx.Client, httpx.AsyncClient]] = None
+_clients_lock = threading.Lock()
+
+
+class _PerLoopTransport(httpx.AsyncBaseTransport):
+    """
+    Async connection pool per event loop. Pooled connections belong to the loop that opened them,
+    and the batch CLI / tests run their own loops, so one shared pool would hand a socket from a
+    closed loop to the next one.
+    """
+    def __init__(self, limits: httpx.Limits, http2: bool):
+        self.limits = limits
+        self.http2 = http2
+        self._transports: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncHTTPTransport]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _current(self) -> httpx.AsyncHTTPTransport:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transport = self._transports.get(loop)
+            if transport is None:
+                # Band ho chuke loops ke pools chhod do (unke sockets waise bhi kaam ke nahi)
+                for old in [l for l in self._transports if l.is_closed()]:
+                    del self._transports[old]
+                transport = self._transports[loop] = httpx.AsyncHTTPTransport(limits=self.limits, http2=self.http2)
+            return transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._current().handle_async_request(request)
+
+    async def aclose(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transport = self._transports.pop(loop, None)
+        if transport is not None:
+            await transport.aclose()
+
+
+def get_http_clients() -> Tuple[httpx.Client, httpx.AsyncClient]:
+    """
+    Process-wide keep-alive pools handed to every ChatOpenAI (openai SDK) instance, so models
+    share warm TLS connections instead of each client opening its own. The async client keeps
+    one pool per event loop.
+    """
+    global _clients
+    with _clients_lock:
+        if _clients is None:
+            limits = httpx.Limits(
+                max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "100")),
+                max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE", "20")),
+                keepalive_expiry=float(os.getenv("LLM_KEEPALIVE_SECONDS", "60")),
+            )
+            timeout = httpx.Timeout(float(os.getenv("LLM_TIMEOUT", "60")), connect=float(os.getenv("LLM_CONNECT_TIMEOUT", "5")))
+            _clients = (
+                httpx.Client(limits=limits, timeout=timeout, http2=HTTP2_AVAILABLE),
+                httpx.AsyncClient(transport=_PerLoopTransport(limits, HTTP2_AVAILABLE), timeout=timeout),
+            )
+        return _clients
+
+
+# --- Routing ---
+
+def _percentile(sorted_values: Sequence[float], q: float) -> float:
+    # Nearest-rank, benchmarks.harness jaisa
+    index = max(0, min(len(sorted_values) - 1, int(round(q / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+class ModelStats:
+    """Rolling window of one model's latencies and outcomes."""
+    def __init__(self, name: str, window: int = 200, error_window: int = 50):
+        self.name = name
+        self.latencies: deque = deque(maxlen=window)
+        self.outcomes: deque = deque(maxlen=error_window)  # 1 = error
+        self.requests = 0
+        self.errors = 0
+        self.last_error_at = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: Optional[float], error: bool):
+        with self._lock:
+            self.requests += 1
+            self.errors += int(error)
+            if error:
+                self.last_error_at = time.monotonic()
+            self.outcomes.append(int(error))
+            if seconds is not None:
+                self.latencies.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            values = sorted(self.latencies)
+        return _percentile(values, q) if values else None
+
+    @property
+    def error_rate(self) -> float:
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        p50, p95 = self.percentile(50), self.percentile(95)
+        return {
+            "requests": self.requests, "errors": self.errors, "error_rate": round(self.error_rate, 3),
+            "samples": len(self.latencies),
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+        }
+
+
+class ModelRouter:
+    """
+    Orders candidate models fastest-healthy-first. Healthy = circuit breaker ("llm:<model>",
+    shared with resilience) not open and rolling error rate below `max_error_rate` (judged after
+    `min_samples` outcomes; a model quiet for `probe_after` seconds gets traffic again). Speed is the
+    rolling p50; models without enough samples go first so every candidate gets measured, and
+    `explore` sends a small share of traffic off the best model to keep the others' stats fresh.
+    """
+    def __init__(self, names: Sequence[str], min_samples: int = 10, max_error_rate: float = 0.5,
+                 explore: float = 0.05, probe_after: float = 30.0, rng: Optional[random.Random] = None):
+        self.names = list(names)
+        self.probe_after = probe_after
+        self.stats = {name: ModelStats(name) for name in self.names}
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.explore = explore
+        self._rng = rng or random.Random()
+
+    def healthy(self, name: str) -> bool:
+        breaker = breakers.get(f"llm:{name}")
+        if breaker.state == breaker.OPEN and breaker.retry_in() > 0:
+            return False
+        stats = self.stats[name]
+        if len(stats.outcomes) < self.min_samples or stats.error_rate < self.max_error_rate:
+            return True
+        # Error window purani ho gayi: probe traffic se stats dobara bano
+        return time.monotonic() - stats.last_error_at > self.probe_after
+
+    def ranked(self) -> List[str]:
+        def score(name: str) -> Tuple[int, float]:
+            stats = self.stats[name]
+            if len(stats.latencies) < self.min_samples:
+                return 0, float(len(stats.latencies))
+            return 1, stats.percentile(50)
+
+        healthy = sorted((n for n in self.names if self.healthy(n)), key=score)
+        # Sab unhealthy hon toh bhi kuch try karo: kam error rate wala pehle
+        unhealthy = sorted((n for n in self.names if n not in healthy), key=lambda n: self.stats[n].error_rate)
+        order = healthy + unhealthy
+        if len(healthy) > 1 and self._rng.random() < self.explore:
+            order.insert(0, order.pop(self._rng.randrange(1, len(healthy))))
+        return order
+
+    def hedge_delay(self, name: str, floor: float = 0.0) -> Optional[float]:
+        """The model's p95, once it has enough samples to trust; None = don't hedge yet."""
+        stats = self.stats[name]
+        if len(stats.latencies) < self.min_samples:
+            return None
+        return max(floor, stats.percentile(95))
+
+    def record(self, name: str, seconds: Optional[float], error: Optional[BaseException] = None):
+        self.stats[name].record(seconds, error is not None)
+        breaker = breakers.get(f"llm:{name}")
+        if error is None:
+            breaker.record_success()
+        elif classify_exception(error).kind != ErrorKind.PERMANENT:
+            breaker.record_failure()
+
+
+# --- Chat model ---
+
+class RoutedChatModel(BaseChatModel):
+    """
+    LangChain chat model over several upstream models. Each call goes to the fastest healthy
+    candidate; with `hedge`, a duplicate goes to the next candidate (or the same model) once the
+    primary passes its p95, the first reply wins and the other request is cancelled. Hedging or
+    not, a primary that fails is failed over to the next healthy candidate at once. Only
+    completed calls feed the latency stats.
+    Works anywhere a ChatOpenAI does: bind_tools, the LLM cache and streaming.
+    """
+    model_name: str = "llm-gateway"
+    candidates: Dict[str, Any]
+    router: Any
+    hedge: bool = False
+    hedge_min_delay: float = 0.05
+
+    @property
+    def _llm_type(self) -> str:
+        return "routed-chat"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name, "candidates": sorted(self.candidates)}
+
+    def bind_tools(self, tools, **kwargs):
+        # OpenAI tool format: har candidate ChatOpenAI hai, kwargs seedha payload mein jaate hain
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        # Sync path (LLMResponseCache.invoke): routing haan, hedging nahi
+        name = self.router.ranked()[0]
+        started = time.perf_counter()
+        try:
+            result = self.candidates[name]._generate(messages, stop=stop, **kwargs)
+        except Exception as e:
+            self._observe(name, started, e)
+            raise
+        self._observe(name, started)
+        return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        order = self.router.ranked()
+        primary = order[0]
+        backup = order[1] if len(order) > 1 and self.router.healthy(order[1]) else primary
+        call = lambda name: asyncio.create_task(self._acall(name, messages, stop, kwargs))
+        tasks = {call(primary)}
+        hedge_task = None
+        delay = self.router.hedge_delay(primary, self.hedge_min_delay) if self.hedge else None
+        try:
+            # Hedging off (delay None): primary ke khatam hone tak; on: zyada se zyada `delay`
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            slow = not done
+            # Primary slow hai (hedge) ya fail ho gaya (failover, hedging on ho ya off): backup abhi shuru karo
+            failed = bool(done) and next(iter(done)).exception() is not None and backup != primary
+            if slow or failed:
+                hedge_task = call(backup)
+                tasks.add(hedge_task)
+            while True:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                winner = next(iter(done))
+                tasks.discard(winner)
+                # Ek fail hua par doosra abhi chal raha hai: uska intezaar karo
+                if winner.exception() is None or not tasks:
+                    break
+            if hedge_task is not None and winner.exception() is None:
+                GATEWAY_HEDGES.inc(winner="hedge" if winner is hedge_task else "primary")
+            return winner.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _acall(self, name: str, messages, stop, kwargs) -> ChatResult:
+        started = time.perf_counter()
+        try:
+            result = await self.candidates[name]._agenerate(messages, stop=stop, **kwargs)
+        except asyncio.CancelledError:
+            # Hedge haar gaya: call poora hua hi nahi, toh latency/outcome sample nahi banta
+            GATEWAY_REQUESTS.inc(model=name, outcome="cancelled")
+            raise
+        except Exception as e:
+            self._observe(name, started, e)
+            raise
+        self._observe(name, started)
+        return result
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        # Streaming: first token jaldi aata hai, isliye sirf routing (hedge nahi)
+        name = self.router.ranked()[0]
+        model = self.candidates[name]
+        started = time.perf_counter()
+        try:
+            try:
+                stream = model._astream(messages, stop=stop, **kwargs)
+                first = await stream.__anext__()
+            except NotImplementedError:
+                # Non-streaming candidate (e.g. benchmark fakes): poora jawab ek chunk mein
+                result = await model._agenerate(messages, stop=stop, **kwargs)
+                message = result.generations[0].message
+                first = ChatGenerationChunk(message=AIMessageChunk(
+                    content=message.content, tool_calls=getattr(message, "tool_calls", []) or []
+                ))
+                stream = None
+            except StopAsyncIteration:
+                self._observe(name, started)
+                return
+            if run_manager:
+                await run_manager.on_llm_new_token(first.text, chunk=first)
+            yield first
+            if stream is not None:
+                async for chunk in stream:
+                    if run_manager:
+                        await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                    yield chunk
+        except Exception as e:
+            self._observe(name, started, e)
+            raise
+        self._observe(name, started)
+
+    def _observe(self, name: str, started: float, error: Optional[BaseException] = None):
+        elapsed = time.perf_counter() - started
+        self.router.record(name, elapsed if error is None else None, error)
+        GATEWAY_REQUESTS.inc(model=name, outcome="error" if error else "ok")
+        if error is None:
+            GATEWAY_SECONDS.observe(elapsed, model=name)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hedge": self.hedge,
+            "ranked": self.router.ranked(),
+            "models": {name: dict(s.snapshot(), healthy=self.router.healthy(name)) for name, s in self.router.stats.items()},
+        }
+
+
+def _env_flag(name: str, default: str = "0") -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes", "on")
+
+
+def build_chat_model(models: Optional[Sequence[str]] = None, base_url: Optional[str] = None,
+                     api_key: Optional[str] = None, hedge: Optional[bool] = None, **chat_kwargs) -> RoutedChatModel:
+    """
+    Candidates from LLM_MODELS (comma-separated, default the free Gemini model) on LLM_BASE_URL
+    (default OpenRouter), all on the shared HTTP pool. LLM_HEDGE=1 turns on hedged requests.
+    """
+    models = list(models or [m.strip() for m in os.getenv("LLM_MODELS", DEFAULT_MODELS).split(",") if m.strip()])
+    http_client, http_async_client = get_http_clients()
+    candidates = {
+        name: ChatOpenAI(
+            model=name,
+            openai_api_key=api_key or os.getenv("OPENROUTER_API_KEY"),
+            openai_api_base=base_url or os.getenv("LLM_BASE_URL", DEFAULT_BASE_URL),
+            default_headers=DEFAULT_HEADERS,
+            http_client=http_client,
+            http_async_client=http_async_client,
+            **chat_kwargs
+        )
+        for name in models
+    }
+    router = ModelRouter(
+        models,
+        min_samples=int(os.getenv("LLM_ROUTER_MIN_SAMPLES", "10")),
+        max_error_rate=float(os.getenv("LLM_ROUTER_MAX_ERROR_RATE", "0.5")),
+        explore=float(os.getenv("LLM_ROUTER_EXPLORE", "0.05")),
+    )
+    logging.info(f"🧭 LLM gateway: {', '.join(models)} (hedging {'on' if hedge or _env_flag('LLM_HEDGE') else 'off'})")
+    return RoutedChatModel(
+        candidates=candidates, router=router,
+        hedge=_env_flag("LLM_HEDGE") if hedge is None else hedge,
+        hedge_min_delay=float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.05")),
+    )
+
+
+_shared: Optional[RoutedChatModel] = None
+_shared_lock = threading.Lock()
+
+
+def get_chat_model() -> RoutedChatModel:
+    """The process-wide gateway model: both orchestrators share its pool and latency stats."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = build_chat_model()
+        return _shared
+
+
+def gateway_stats() -> Dict[str, Any]:
+    return _shared.stats() if _shared is not None else {}
@@ -0,0 +1,538 @@
+import datetime
+import email.policy
+import json
+import logging
+import mmap
+import os
+import re
+import sqlite3
+import threading
+import time
+from email.header import decode_header, make_header
+from email.parser import BytesHeaderParser, BytesParser
+from email.utils import getaddresses, parsedate_to_datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import metrics
+from storage import get_pool, get_write_lock
+from tokenizer import truncate_to_tokens
+
+# --- MAILBOX INDEX: local Maildir / mbox sources behind AgentTools.read_emails ---
+# Sirf headers (from, to, subject, date, thread) SQLite mein index hote hain; body tabhi padhi jaati
+# hai jab result mein aaye, mmap se, aur snippet token budget tak kaata jaata hai.
+# Sync incremental hai: Maildir ke liye cur/new directory mtime, mbox ke liye byte offset checkpoint.
+
+MAIL_INDEX_DB = os.getenv("MAIL_INDEX_DB", "mail_index.db")
+MAX_LIMIT = 50
+HEADER_READ_LIMIT = 256 * 1024   # isse bade headers kaat diye jaate hain
+BODY_READ_LIMIT = 512 * 1024     # snippet ke liye message ka sirf itna prefix parse hota hai
+COMMON_TERM_HITS = 2000          # isse zyada FTS hits: newest-first date index scan sort se sasta
+
+MAIL_SYNC_SECONDS = metrics.registry.histogram(
+    "mail_sync_seconds", "Mailbox index sync duration per source.", ("kind",),
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0, 120.0, 600.0)
+)
+MAIL_SEARCH_SECONDS = metrics.registry.histogram(
+    "mail_search_seconds", "Mailbox search latency including snippet extraction.",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+)
+
+_TAG_RE = re.compile(r"<[^>]+>")
+_SPACE_RE = re.compile(r"\s+")
+_MBOX_ESCAPE_RE = re.compile(rb"\n>(>*From )")
+_MSGID_RE = re.compile(r"<[^>]+>")
+
+DateArg = Union[str, int, float, datetime.datetime, datetime.date, None]
+
+
+def sources_from_env() -> List[str]:
+    """MAIL_SOURCE: one or more Maildir directories / mbox files, comma separated."""
+    return [path.strip() for path in os.getenv("MAIL_SOURCE", "").split(",") if path.strip()]
+
+
+def _decode(value: Any) -> str:
+    if value is None:
+        return ""
+    try:
+        return str(make_header(decode_header(str(value))))
+    except Exception:  # toota hua RFC 2047 encoding: raw value hi sahi
+        return str(value)
+
+
+def _parse_date(value: DateArg, end_of_day: bool = False) -> Optional[float]:
+    """
+    ISO date/datetime string, epoch seconds or date(time) -> epoch seconds (naive = UTC). A bare
+    date with end_of_day=True means the last moment of that day, so `until` includes it.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        text = value.strip()
+        try:
+            value = datetime.datetime.fromisoformat(text.replace("Z", "+00:00"))
+        except ValueError:
+            raise ValueError(f"invalid date {text!r}, expected ISO format like 2024-05-01")
+        if len(text) == 10:
+            value = value.date()
+    if not isinstance(value, datetime.datetime):
+        day = datetime.datetime(value.year, value.month, value.day, tzinfo=datetime.timezone.utc)
+        return (day + datetime.timedelta(days=1)).timestamp() - 0.001 if end_of_day else day.timestamp()
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value.timestamp()
+
+
+def _encode_cursor(date: float, row_id: int) -> str:
+    return f"{date!r}:{row_id}"
+
+
+def _decode_cursor(cursor: str) -> Tuple[float, int]:
+    try:
+        date, row_id = str(cursor).rsplit(":", 1)
+        return float(date), int(row_id)
+    except ValueError:
+        raise ValueError(f"invalid cursor {cursor!r}")
+
+
+def _fts_query(query: str) -> str:
+    # Har token quoted aur AND: "invoice acme" dono words wale mails
+    return " ".join(f'"{t}"' for t in re.findall(r"\w+", query))
+
+
+def _header_fields(raw_headers: bytes, fallback_date: float) -> Dict[str, Any]:
+    headers = BytesHeaderParser(policy=email.policy.compat32).parsebytes(raw_headers)
+    try:
+        parsed = parsedate_to_datetime(headers["Date"]) if headers["Date"] else None
+        if parsed is not None and parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+        date = parsed.timestamp() if parsed is not None else fallback_date
+    except (TypeError, ValueError, IndexError, OverflowError):
+        date = fallback_date
+    message_id = (headers["Message-ID"] or "").strip() or None
+    # Thread = References ka pehla id (root), warna In-Reply-To, warna khud ka Message-ID
+    refs = _MSGID_RE.findall(str(headers["References"] or "")) or _MSGID_RE.findall(str(headers["In-Reply-To"] or ""))
+    recipients = getaddresses([_decode(v) for v in (headers.get_all("To") or []) + (headers.get_all("Cc") or [])])
+    return {
+        "message_id": message_id,
+        "thread": refs[0] if refs else message_id,
+        "sender": _decode(headers["From"]),
+        "recipients": ", ".join(addr or name for name, addr in recipients),
+        "subject": _decode(headers["Subject"]),
+        "date": date,
+    }
+
+
+def _read_headers(path: str) -> bytes:
+    # Header block tak hi padho: badi attachments wali files poori memory mein nahi aati
+    chunks, size = [], 0
+    with open(path, "rb") as f:
+        while size < HEADER_READ_LIMIT:
+            chunk = f.read(16384)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size += len(chunk)
+            data = b"".join(chunks)
+            end = data.find(b"\n\n")
+            if end >= 0:
+                return data[:end + 1]
+            end = data.find(b"\r\n\r\n")
+            if end >= 0:
+                return data[:end + 2]
+    return b"".join(chunks)
+
+
+def _body_text(raw: bytes) -> str:
+    try:
+        message = BytesParser(policy=email.policy.default).parsebytes(raw)
+        part = message.get_body(preferencelist=("plain", "html"))
+        if part is None:
+            return ""
+        text = part.get_content()
+        if part.get_content_subtype() == "html":
+            text = _TAG_RE.sub(" ", text)
+    except Exception as e:  # kata hua prefix / ajeeb MIME: snippet khaali, search nahi tootna chahiye
+        logging.debug(f"Mail body parse failed: {e}")
+        return ""
+    return _SPACE_RE.sub(" ", text).strip()
+
+
+class MailboxIndex:
+    """
+    Header index over Maildir directories and mbox files. sync() only parses messages it has not
+    seen (Maildir unique names, mbox bytes past the last checkpoint); search() pages with a
+    (date, id) keyset cursor and reads bodies of the returned page only, via mmap.
+    """
+    def __init__(self, sources: Sequence[str], db_path: str = MAIL_INDEX_DB,
+                 sync_interval: float = 30.0, batch_size: int = 1000):
+        self.sources = [os.path.abspath(source) for source in sources]
+        self.db_path = db_path
+        self.sync_interval = sync_interval
+        self.batch_size = batch_size
+        self.pool = get_pool(db_path)
+        self.write_lock = get_write_lock(db_path)
+        self._sync_lock = threading.Lock()
+        self._maps_lock = threading.Lock()
+        self._maps: Dict[str, Tuple[int, int, mmap.mmap]] = {}
+        self._last_sync: Optional[float] = None
+        self._started = False
+        self.last_sync: Dict[str, Any] = {}
+        self.pool.executescript('''
+            CREATE TABLE IF NOT EXISTS mail_sources (
+                source TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                checkpoint TEXT,
+                synced REAL
+            );
+            CREATE TABLE IF NOT EXISTS mail_messages (
+                id INTEGER PRIMARY KEY,
+                source TEXT NOT NULL,
+                uid TEXT NOT NULL,
+                path TEXT NOT NULL,
+                start INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                message_id TEXT,
+                thread TEXT,
+                sender TEXT,
+                recipients TEXT,
+                subject TEXT,
+                date REAL NOT NULL,
+                UNIQUE (source, uid)
+            );
+            -- Newest-first keyset pages aur thread lookups bina sort ke
+            CREATE INDEX IF NOT EXISTS idx_mail_messages_date ON mail_messages (date, id);
+            CREATE INDEX IF NOT EXISTS idx_mail_messages_thread ON mail_messages (thread, date);
+        ''')
+        self.fts_enabled = self._bootstrap_fts()
+
+    def _bootstrap_fts(self) -> bool:
+        """External-content FTS5 over sender/recipients/subject; False means LIKE fallback."""
+        exists = self.pool.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'mail_messages_fts'")
+        try:
+            self.pool.executescript('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS mail_messages_fts USING fts5(
+                    sender, recipients, subject,
+                    content='mail_messages', content_rowid='id', tokenize='porter unicode61'
+                );
+                CREATE TRIGGER IF NOT EXISTS mail_messages_fts_ai AFTER INSERT ON mail_messages BEGIN
+                    INSERT INTO mail_messages_fts (rowid, sender, recipients, subject)
+                    VALUES (new.id, new.sender, new.recipients, new.subject);
+                END;
+                CREATE TRIGGER IF NOT EXISTS mail_messages_fts_ad AFTER DELETE ON mail_messages BEGIN
+                    INSERT INTO mail_messages_fts (mail_messages_fts, rowid, sender, recipients, subject)
+                    VALUES ('delete', old.id, old.sender, old.recipients, old.subject);
+                END;
+                CREATE TRIGGER IF NOT EXISTS mail_messages_fts_au AFTER UPDATE OF sender, recipients, subject ON mail_messages BEGIN
+                    INSERT INTO mail_messages_fts (mail_messages_fts, rowid, sender, recipients, subject)
+                    VALUES ('delete', old.id, old.sender, old.recipients, old.subject);
+                    INSERT INTO mail_messages_fts (rowid, sender, recipients, subject)
+                    VALUES (new.id, new.sender, new.recipients, new.subject);
+                END;
+            ''')
+        except sqlite3.OperationalError as e:
+            logging.warning(f"⚠️ FTS5 unavailable, mail search will scan headers: {e}")
+            return False
+        if not exists:
+            self.pool.executescript("INSERT INTO mail_messages_fts (mail_messages_fts) VALUES ('rebuild');")
+        return True
+
+    # --- Sync ---
+
+    def _write(self, statements: Sequence[Tuple[str, Sequence[tuple]]]):
+        with self.pool.connection() as conn, self.write_lock:
+            with conn:
+                for sql, rows in statements:
+                    if rows:
+                        conn.executemany(sql, rows)
+
+    def _upsert(self, rows: List[tuple]):
+        # mbox ka aakhri message badh sakta hai: same (source, uid) pe size/headers refresh
+        self._write([('''
+            INSERT INTO mail_messages (source, uid, path, start, size, message_id, thread, sender, recipients, subject, date)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (source, uid) DO UPDATE SET
+                path = excluded.path, start = excluded.start, size = excluded.size,
+                message_id = excluded.message_id, thread = excluded.thread, sender = excluded.sender,
+                recipients = excluded.recipients, subject = excluded.subject, date = excluded.date
+        ''', rows)])
+
+    def _save_checkpoint(self, source: str, kind: str, checkpoint: Optional[Dict[str, Any]]):
+        self._write([("INSERT OR REPLACE INTO mail_sources (source, kind, checkpoint, synced) VALUES (?, ?, ?, ?)",
+                      [(source, kind, json.dumps(checkpoint) if checkpoint is not None else None, time.time())])])
+
+    def _checkpoint(self, source: str) -> Optional[Dict[str, Any]]:
+        rows = self.pool.execute("SELECT checkpoint FROM mail_sources WHERE source = ?", (source,))
+        return json.loads(rows[0][0]) if rows and rows[0][0] else None
+
+    def sync(self, force: bool = False) -> Dict[str, Any]:
+        """
+        Indexes new messages from every source. Throttled to `sync_interval` unless `force`; if
+        another thread is already syncing, returns immediately (search sees committed batches).
+        """
+        if not force and (self._started or (self._last_sync is not None
+                                            and time.monotonic() - self._last_sync < self.sync_interval)):
+            # Background loop chal raha hai toh tool calls kabhi sync pe intezaar nahi karte
+            return {}
+        if not self._sync_lock.acquire(blocking=False):
+            return {}
+        try:
+            result = {}
+            for source in self.sources:
+                started = time.perf_counter()
+                try:
+                    if os.path.isdir(source):
+                        kind, counts = "maildir", self._sync_maildir(source)
+                    elif os.path.isfile(source):
+                        kind, counts = "mbox", self._sync_mbox(source)
+                    else:
+                        logging.warning(f"⚠️ Mail source {source} not found, skipping")
+                        continue
+                except Exception as e:
+                    logging.error(f"❌ Mail sync failed for {source}: {e}")
+                    continue
+                MAIL_SYNC_SECONDS.observe(time.perf_counter() - started, kind=kind)
+                result[source] = counts
+                if counts.get("added") or counts.get("removed"):
+                    logging.info(f"📬 Mail sync {source}: {counts}")
+            self._last_sync = time.monotonic()
+            self.last_sync = {"at": time.time(), "sources": result}
+            return result
+        finally:
+            self._sync_lock.release()
+
+    def _sync_maildir(self, source: str) -> Dict[str, int]:
+        subdirs = [sub for sub in ("new", "cur") if os.path.isdir(os.path.join(source, sub))]
+        # Stat listing se pehle: listing ke dauraan aayi files agli sync mein dir mtime badal dengi
+        mtimes = {sub: os.stat(os.path.join(source, sub)).st_mtime_ns for sub in subdirs}
+        if self._checkpoint(source) == mtimes:
+            return {"added": 0, "moved": 0, "removed": 0}
+        on_disk: Dict[str, Tuple[str, float]] = {}
+        for sub in subdirs:
+            with os.scandir(os.path.join(source, sub)) as entries:
+                for entry in entries:
+                    if entry.name.startswith(".") or not entry.is_file():
+                        continue
+                    # Maildir unique name ':2,FLAGS' se pehle; flags badalne pe file rename hoti hai
+                    on_disk[entry.name.split(":", 1)[0]] = (entry.path, entry.stat().st_mtime)
+        known = dict(self.pool.execute("SELECT uid, path FROM mail_messages WHERE source = ?", (source,)))
+
+        moved = [(path, source, uid) for uid, (path, _) in on_disk.items() if uid in known and known[uid] != path]
+        removed = [(source, uid) for uid in known.keys() - on_disk.keys()]
+        self._write([("UPDATE mail_messages SET path = ? WHERE source = ? AND uid = ?", moved),
+                     ("DELETE FROM mail_messages WHERE source = ? AND uid = ?", removed)])
+
+        added, batch = 0, []
+        for uid, (path, mtime) in on_disk.items():
+            if uid in known:
+                continue
+            try:
+                fields = _header_fields(_read_headers(path), mtime)
+                size = os.path.getsize(path)
+            except OSError:  # sync ke beech delete / move: agli sync mein milegi
+                continue
+            batch.append((source, uid, path, 0, size, fields["message_id"], fields["thread"], fields["sender"],
+                          fields["recipients"], fields["subject"], fields["date"]))
+            if len(batch) >= self.batch_size:
+                self._upsert(batch)
+                added += len(batch)
+                batch = []
+        if batch:
+            self._upsert(batch)
+            added += len(batch)
+        # Coarse-mtime filesystems: abhi-abhi badli directory ka checkpoint mat rakho, agli sync dobara dekhe
+        fresh = any(time.time_ns() - mtime < 2_000_000_000 for mtime in mtimes.values())
+        self._save_checkpoint(source, "maildir", None if fresh else mtimes)
+        return {"added": added, "moved": len(moved), "removed": len(removed)}
+
+    def _sync_mbox(self, source: str) -> Dict[str, int]:
+        stat = os.stat(source)
+        checkpoint = self._checkpoint(source) or {}
+        if checkpoint.get("inode") == stat.st_ino and checkpoint.get("size") == stat.st_size:
+            return {"added": 0, "removed": 0}
+        removed = 0
+        start = checkpoint.get("offset", 0)
+        if checkpoint.get("inode") != stat.st_ino or stat.st_size < checkpoint.get("size", 0):
+            start = None  # rotate / rewrite: poora reindex
+        if stat.st_size == 0:
+            removed = self._reset_source(source)
+            self._save_checkpoint(source, "mbox", {"inode": stat.st_ino, "size": 0, "offset": 0})
+            return {"added": 0, "removed": removed}
+
+        added, batch, last_start, refreshed = 0, [], 0, 0
+        with open(source, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            size = len(mm)
+            if start is not None and mm[start:start + 5] != b"From ":
+                start = None  # checkpoint message boundary pe nahi raha: file badli gayi
+            if start is None:
+                removed = self._reset_source(source)
+                start = 0 if mm[:5] == b"From " else mm.find(b"\nFrom ") + 1
+                if start == 0 and mm[:5] != b"From ":
+                    self._save_checkpoint(source, "mbox", {"inode": stat.st_ino, "size": size, "offset": 0})
+                    return {"added": 0, "removed": removed}
+            elif checkpoint:
+                refreshed = 1  # checkpoint wala aakhri message dobara parse hota hai, naya nahi
+            pos = start
+            while pos < size:
+                end = mm.find(b"\nFrom ", pos + 5)
+                end = size if end < 0 else end + 1
+                line_end = mm.find(b"\n", pos, end)
+                body_start = end if line_end < 0 else line_end + 1
+                header_end = mm.find(b"\n\n", body_start, min(end, body_start + HEADER_READ_LIMIT))
+                raw_headers = mm[body_start:(header_end + 1) if header_end >= 0 else min(end, body_start + HEADER_READ_LIMIT)]
+                fields = _header_fields(raw_headers, stat.st_mtime)
+                batch.append((source, str(pos), source, pos, end - pos, fields["message_id"], fields["thread"],
+                              fields["sender"], fields["recipients"], fields["subject"], fields["date"]))
+                last_start = pos
+                pos = end
+                if len(batch) >= self.batch_size:
+                    self._upsert(batch)
+                    added += len(batch)
+                    batch = []
+        if batch:
+            self._upsert(batch)
+            added += len(batch)
+        # Offset aakhri message ki shuruaat pe: agar woh abhi likha ja raha tha, agli sync use refresh kare
+        self._save_checkpoint(source, "mbox", {"inode": stat.st_ino, "size": size, "offset": last_start})
+        return {"added": max(0, added - refreshed), "removed": removed}
+
+    def _reset_source(self, source: str) -> int:
+        count = self.pool.execute("SELECT COUNT(*) FROM mail_messages WHERE source = ?", (source,))[0][0]
+        if count:
+            self._write([("DELETE FROM mail_messages WHERE source = ?", [(source,)])])
+        return count
+
+    def start_sync(self, interval: Optional[float] = None):
+        """Initial index + periodic sync on a daemon thread (search works on partial results meanwhile)."""
+        if self._started:
+            return
+        self._started = True
+        interval = interval or self.sync_interval
+
+        def loop():
+            while True:
+                try:
+                    self.sync(force=True)
+                except Exception as e:
+                    logging.error(f"❌ Mail sync loop failed: {e}")
+                time.sleep(interval)
+
+        threading.Thread(target=loop, name="mail-sync", daemon=True).start()
+        logging.info(f"📬 Mail sync started for {len(self.sources)} source(s) every {interval}s")
+
+    # --- Search ---
+
+    def _mapped(self, path: str) -> mmap.mmap:
+        # mbox files ek baar map hote hain; size/inode badle toh naya map (purana GC band karega)
+        stat = os.stat(path)
+        with self._maps_lock:
+            cached = self._maps.get(path)
+            if cached is not None and cached[0] == stat.st_ino and cached[1] == stat.st_size:
+                return cached[2]
+            with open(path, "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[path] = (stat.st_ino, stat.st_size, mm)
+            return mm
+
+    def _raw_message(self, source: str, uid: str, path: str, start: int, size: int) -> bytes:
+        limit = min(size, BODY_READ_LIMIT)
+        if path == source:  # mbox: "From " separator line hata ke, >From unescape
+            mm = self._mapped(path)
+            raw = mm[start:start + limit]
+            return _MBOX_ESCAPE_RE.sub(rb"\n\1", raw[raw.find(b"\n") + 1:])
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            # Flags badalne pe rename (new -> cur); agli sync path theek karegi, abhi dhoondh lo
+            matches = [os.path.join(source, sub, name) for sub in ("cur", "new")
+                       if os.path.isdir(os.path.join(source, sub))
+                       for name in os.listdir(os.path.join(source, sub)) if name.split(":", 1)[0] == uid]
+            if not matches:
+                return b""
+            f = open(matches[0], "rb")
+        with f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b""
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return mm[:limit]
+
+    def snippet(self, source: str, uid: str, path: str, start: int, size: int, max_tokens: int) -> str:
+        try:
+            raw = self._raw_message(source, uid, path, start, size)
+        except OSError as e:
+            logging.warning(f"⚠️ Mail body unavailable ({path}): {e}")
+            return ""
+        return truncate_to_tokens(_body_text(raw), max_tokens) if raw else ""
+
+    def search(self, query: Optional[str] = None, since: DateArg = None, until: DateArg = None,
+               thread: Optional[str] = None, limit: int = 10, cursor: Optional[str] = None,
+               snippet_tokens: int = 200, token_budget: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Newest-first messages matching `query` (sender/recipients/subject terms) within
+        [since, until]. Returns {"emails": [...], "next_cursor": str | None}; pass next_cursor back
+        for the following page. Each snippet is capped at `snippet_tokens`, and all snippets
+        together at `token_budget`.
+        """
+        started = time.perf_counter()
+        limit = max(1, min(int(limit), MAX_LIMIT))
+        clauses, params, index_hint = [], [], ""
+        if query:
+            if self.fts_enabled:
+                match = _fts_query(query)
+                if match:
+                    clauses.append("m.id IN (SELECT rowid FROM mail_messages_fts WHERE mail_messages_fts MATCH ?)")
+                    params.append(match)
+                    # Planner hamesha saare hits sort karta hai; common terms pe date index se LIMIT jaldi bharta hai
+                    hits = self.pool.execute(
+                        "SELECT COUNT(*) FROM (SELECT 1 FROM mail_messages_fts WHERE mail_messages_fts MATCH ? LIMIT ?)",
+                        (match, COMMON_TERM_HITS)
+                    )[0][0]
+                    if hits >= COMMON_TERM_HITS and not thread:
+                        index_hint = "INDEXED BY idx_mail_messages_date"
+            else:
+                for term in re.findall(r"\w+", query):
+                    clauses.append("(m.sender LIKE ? OR m.recipients LIKE ? OR m.subject LIKE ?)")
+                    params += [f"%{term}%"] * 3
+        if (since_ts := _parse_date(since)) is not None:
+            clauses.append("m.date >= ?")
+            params.append(since_ts)
+        if (until_ts := _parse_date(until, end_of_day=True)) is not None:
+            clauses.append("m.date <= ?")
+            params.append(until_ts)
+        if thread:
+            clauses.append("m.thread = ?")
+            params.append(thread)
+        if cursor:
+            date, row_id = _decode_cursor(cursor)
+            clauses.append("(m.date < ? OR (m.date = ? AND m.id < ?))")
+            params += [date, date, row_id]
+        rows = self.pool.execute(
+            "SELECT m.id, m.source, m.uid, m.path, m.start, m.size, m.thread, m.sender, m.recipients, m.subject, m.date "
+            f"FROM mail_messages m {index_hint} {'WHERE ' + ' AND '.join(clauses) if clauses else ''} "
+            "ORDER BY m.date DESC, m.id DESC LIMIT ?",
+            [*params, limit + 1]
+        )
+        page, more = rows[:limit], len(rows) > limit
+        per_message = snippet_tokens
+        if token_budget is not None and page:
+            per_message = min(snippet_tokens, token_budget // len(page))
+        emails = []
+        for row_id, source, uid, path, start, size, thread_id, sender, recipients, subject, date in page:
+            emails.append({
+                "id": row_id,
+                "from": sender,
+                "to": recipients,
+                "subject": subject,
+                "date": datetime.datetime.fromtimestamp(date, datetime.timezone.utc).isoformat(),
+                "thread": thread_id,
+                "snippet": self.snippet(source, uid, path, start, size, per_message) if per_message > 0 else "",
+            })
+        MAIL_SEARCH_SECONDS.observe(time.perf_counter() - started)
+        last = page[-1] if page else None
+        return {"emails": emails, "next_cursor": _encode_cursor(last[10], last[0]) if more and last else None}
+
+    def stats(self) -> Dict[str, Any]:
+        count = self.pool.execute("SELECT COUNT(*) FROM mail_messages")[0][0]
+        return {"messages": count, "sources": len(self.sources), "fts_enabled": self.fts_enabled,
+                "last_sync_at": self.last_sync.get("at", 0.0)}
@@ -1,68 +1,380 @@
 import os
+import asyncio
 import logging
-from typing import TypedDict, List
-from fastapi import FastAPI
+import tempfile
+import time
+import uuid
+from typing import TypedDict, List, Optional
+# Pehle lifecycle: iske baad ka sab import time mein gina jata hai
+from lifecycle import lifecycle
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from langgraph.graph import StateGraph, END
-from langchain_openai import ChatOpenAI
+from langchain_core.messages import HumanMessage, SystemMessage
 from dotenv import load_dotenv
 
 # Apni purani os_kernel file se MemoryManager import karein
 from os_kernel import MemoryManager
+import metrics
+import shared_state
+from resilience import resilience_stats
+from tools import get_mailbox, mailbox_stats, sandbox_stats
+from llm_cache import LLMResponseCache
+from llm_gateway import gateway_stats, get_chat_model
+from checkpoint import get_checkpointer
+from singleflight import SingleFlight
+from jobs import JobQueue
+from batch import BatchReport, BatchStore, DEFAULT_CONCURRENCY, MAX_CONCURRENCY, read_jsonl, run_batch
+from storage import get_write_lock
+from dependencies import enforce_token_quota, scoped_user_id
+from rate_limit import metering, rate_limiter
+from tokenizer import get_encoding
+from routers.agents import router as agents_router
+from streaming import stream_graph, encode_ndjson, encode_sse, NDJSON_MEDIA_TYPE, SSE_MEDIA_TYPE, STREAM_HEADERS
 
 load_dotenv()
 
 app = FastAPI()
-memory = MemoryManager() # SQLite connect ho jayega
+# Lazy: SQLite bootstrap pehli zaroorat pe ya warm-up mein, import pe nahi
+# Multi-worker (WEB_CONCURRENCY > 1): caches doosre workers ke writes pe invalidation bus se saaf hote hain
+_memory = lifecycle.component("memory", lambda: MemoryManager(bus=shared_state.bus))
+_llm_cache = lifecycle.component("llm_cache", lambda: LLMResponseCache(bus=shared_state.bus)) # Opt-in: LLM_CACHE_ENABLED=1
+MEMORY_CONTEXT_TOKENS = int(os.getenv("MEMORY_CONTEXT_TOKENS", "1000"))
 
 class AgentState(TypedDict):
     messages: List[str]
     user_id: str
 
 class JobRequest(BaseModel):
-    user_id: str
+    user_id: Optional[str] = None # End-user id under the API key's user (memory namespace); default = key ka user
     task: str
+    thread_id: Optional[str] = None # Interrupted run ko resume karne ke liye wahi thread_id bhejein
 
 class AgentOrchestrator:
-    def __init__(self):
-        # 1. LLM Setup (The Brain)
-        self.llm = ChatOpenAI(
-    # Model badal kar ye wala dalein (Jo free hai)
-    model="google/gemini-2.0-flash-exp:free", 
-    openai_api_key=os.getenv("OPENROUTER_API_KEY"),
-    openai_api_base="https://openrouter.ai/api/v1",
-    default_headers={
-        "HTTP-Referer": "http://localhost:8000",
-        "X-Title": "Agent OS Interface"
-    }
-)
-        
+    def __init__(self, checkpointer=None):
+        # 1. LLM Setup (The Brain): gateway candidates LLM_MODELS se, shared HTTP pool + latency routing
+        self.llm = get_chat_model()
+
         self.workflow = StateGraph(AgentState)
-        self.workflow.add_node("agent", self.call_llm)
+        self.workflow.add_node("agent", metrics.instrument_node("spawn_agent", "agent", self.call_llm))
         self.workflow.set_entry_point("agent")
         self.workflow.add_edge("agent", END)
-        self.app = self.workflow.compile()
+        self.app = self.workflow.compile(checkpointer=checkpointer or get_checkpointer())
 
     async def call_llm(self, state: AgentState):
         user_msg = state["messages"][-1]
         
-        # 2. Memory se purani baatein nikalna (Optional upgrade)
-        # past_memory = memory.get_memory(state["user_id"])
+        # 2. Memory se purani baatein nikalna: sirf relevant hits (FTS5 + BM25), token budget ke andar
+        memory = get_memory()
+        past_memory = await memory.abuild_context(state["user_id"], user_msg, token_budget=MEMORY_CONTEXT_TOKENS)
+        prompt = user_msg
+        if past_memory:
+            prompt = [SystemMessage(content=f"Relevant past context:\n{past_memory}"), HumanMessage(content=user_msg)]
         
         # 3. AI se baat karna
-        response = await self.llm.ainvoke(user_msg)
+        response = await get_llm_cache().ainvoke(self.llm, prompt, route="spawn_agent")
         ai_reply = response.content
         
         # 4. SQLite mein save karna (The Memory)
-        memory.save_context(state["user_id"], "chat_history", ai_reply)
+        # asave_context: SQLite kaam executor mein, event loop block nahi hota
+        await memory.asave_context(state["user_id"], "chat_history", ai_reply)
         
         return {"messages": [ai_reply]}
 
-os_instance = AgentOrchestrator()
+_orchestrator = lifecycle.component("orchestrator", AgentOrchestrator)
+_checkpointer = lifecycle.component("checkpointer", get_checkpointer)
+
+def get_memory() -> MemoryManager:
+    return _memory.get()
+
+def get_llm_cache() -> LLMResponseCache:
+    return _llm_cache.get()
+
+def get_orchestrator() -> AgentOrchestrator:
+    """LLM client + compiled graph, built once (thread-safe) on first use or during warm-up."""
+    return _orchestrator.get()
+
+def thread_config(thread_id: str) -> dict:
+    return {"configurable": {"thread_id": thread_id}}
+
+async def graph_input(state: dict, config: dict):
+    """Returns None (resume from the last checkpoint) if the thread has an unfinished run, else `state`."""
+    snapshot = await get_orchestrator().app.aget_state(config)
+    return None if snapshot.next else state
+
+async def invoke_graph(state: dict, thread_id: str):
+    config = thread_config(thread_id)
+    return await get_orchestrator().app.ainvoke(await graph_input(state, config), config)
+
+# Duplicate bursts (dashboard refresh / client retries) ek hi graph run share karte hain
+spawn_flight = SingleFlight(window=float(os.getenv("COALESCE_WINDOW_SECONDS", "0")))
+
+async def run_job(job: dict):
+    """JobQueue runner: executes one queued task through the agent graph."""
+    # Job id hi thread id hai: restart ke baad recovered job checkpoint se resume hota hai
+    # Quota: graph ke har model call ka usage_metadata (prompt + memory context + reply) is key pe
+    with metering(job.get("meter_key"), job["plan"]):
+        result = await invoke_graph({"messages": [job["task"]], "user_id": job["user_id"]}, job["id"])
+    return result["messages"][-1]
+
+# Background jobs: POST /jobs turant job_id deta hai, graph worker pool mein chalta hai
+_job_queue = lifecycle.component("job_queue", lambda: JobQueue(
+    run_job,
+    max_running=int(os.getenv("JOB_MAX_RUNNING", "16")),
+    max_queued=int(os.getenv("JOB_MAX_QUEUED", "1000")),
+    worker_id=shared_state.WORKER_ID,
+    live_workers=shared_state.workers.live_workers
+))
+
+def get_job_queue() -> JobQueue:
+    return _job_queue.get()
+
+def coalesce_key(job: JobRequest, user_id: str):
+    """Jobs with the same key are treated as identical; override to widen or narrow coalescing."""
+    return (user_id, job.task.strip(), job.thread_id)
 
 @app.post("/spawn_agent")
-async def run_agent(job: JobRequest):
-    initial_state = {"messages": [job.task], "user_id": job.user_id}
-    result = await os_instance.app.ainvoke(initial_state)
-    return {"status": "success", "response": result["messages"][-1]}
+async def run_agent(job: JobRequest, user_info: tuple = Depends(enforce_token_quota)):
+    owner, plan, rate_key = user_info
+    user_id = scoped_user_id(owner, job.user_id)
+    initial_state = {"messages": [job.task], "user_id": user_id}
+
+    async def invoke():
+        # Thread id leader banata hai aur result ke saath lautata hai: coalesced followers ko wahi
+        # id milti hai jiska checkpoint sach mein bana, apni random (khaali) id nahi
+        thread_id = job.thread_id or uuid.uuid4().hex
+        # Coalesced run ka kharcha leader ki key pe; followers ko wahi result free milta hai
+        with metering(rate_key, plan):
+            # Checkpoint key ki apni namespace mein: doosri key same thread_id bheje toh bhi resume nahi kar sakti
+            return thread_id, await invoke_graph(initial_state, scoped_user_id(owner, thread_id))
+
+    thread_id, result = await spawn_flight.do(coalesce_key(job, user_id), invoke)
+    response = {"status": "success", "response": result["messages"][-1], "thread_id": thread_id}
+    breakdown = metrics.current_breakdown()
+    if breakdown is not None:
+        response["timings_ms"] = {k: round(v * 1000, 2) for k, v in breakdown.items()}
+    return response
+
+@app.post("/spawn_agent/stream")
+async def stream_agent(job: JobRequest, request: Request, user_info: tuple = Depends(enforce_token_quota)):
+    """Streams tokens and graph events as they happen (SSE if requested via Accept, else NDJSON)."""
+    owner, plan, rate_key = user_info
+    initial_state = {"messages": [job.task], "user_id": scoped_user_id(owner, job.user_id)}
+    use_sse = SSE_MEDIA_TYPE in request.headers.get("accept", "")
+    encode = encode_sse if use_sse else encode_ndjson
+
+    thread_id = job.thread_id or uuid.uuid4().hex
+    config = thread_config(scoped_user_id(owner, thread_id))
+
+    async def body():
+        yield encode({"type": "thread", "thread_id": thread_id})
+        with metering(rate_key, plan):
+            async for event in stream_graph(get_orchestrator().app, await graph_input(initial_state, config), config):
+                yield encode(event)
+
+    return StreamingResponse(body(), media_type=SSE_MEDIA_TYPE if use_sse else NDJSON_MEDIA_TYPE, headers=STREAM_HEADERS)
+
+_batch_store = lifecycle.component("batch_store", BatchStore)
+
+@app.post("/spawn_agents/batch")
+async def spawn_agents_batch(request: Request, concurrency: int = DEFAULT_CONCURRENCY, batch_id: Optional[str] = None,
+                             user_info: tuple = Depends(enforce_token_quota)):
+    """
+    Body: JSONL tasks ({"task", "user_id"?, "thread_id"?, "id"?} per line). Streams NDJSON: a
+    `batch` line, one `result` per task in completion order (with its input index), then a
+    `summary` with throughput. Re-post the same body with ?batch_id= to resume a partial batch.
+    Batches, per-line user_ids and thread_ids are all scoped to the API key's user.
+    """
+    owner, plan, rate_key = user_info
+    store = _batch_store.get()
+    batch_id = batch_id or f"batch-{uuid.uuid4().hex[:12]}"
+    if "/" in batch_id:
+        # '/' scoped ids (owner/...) ke liye reserved: batch thread ids kisi aur ke namespace mein na jaayein
+        raise HTTPException(status_code=422, detail="batch_id must not contain '/'")
+    try:
+        resume = await asyncio.to_thread(store.open, batch_id, "http", owner)
+    except PermissionError:
+        # Doosre user ka batch: existence bhi leak nahi karna
+        raise HTTPException(status_code=404, detail="Batch not found")
+    # Body pehle spool (bada ho toh disk pe): response stream chalu hone ke baad request body padhna safe nahi
+    spool = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    async for chunk in request.stream():
+        spool.write(chunk)
+    spool.seek(0)
+
+    def scoped(records):
+        for index, record in records:
+            if isinstance(record, dict):
+                record = dict(record, user_id=scoped_user_id(owner, record.get("user_id")))
+                if record.get("thread_id"):
+                    record["thread_id"] = scoped_user_id(owner, str(record["thread_id"]))
+            yield index, record
+
+    async def runner(record: dict, thread_id: str):
+        # Har task se pehle quota: lamba batch beech mein quota khatam kare toh baaki items error (resume-able)
+        remaining = rate_limiter.quota_remaining(rate_key, plan)
+        if remaining is not None and remaining <= 0:
+            raise RuntimeError(f"Daily LLM token quota exhausted for plan '{plan}'")
+        with metering(rate_key, plan):
+            result = await invoke_graph({"messages": [record["task"]], "user_id": record["user_id"]}, thread_id)
+        return result["messages"][-1]
+
+    async def body():
+        report = BatchReport()
+        try:
+            yield encode_ndjson({"type": "batch", "batch_id": batch_id, "resume": resume})
+            async for result in run_batch(scoped(read_jsonl(spool)), runner, batch_id, max(1, min(concurrency, MAX_CONCURRENCY)),
+                                          store, resume, owner, report):
+                yield encode_ndjson(result)
+            yield encode_ndjson(dict(report.summary(), batch_id=batch_id))
+        finally:
+            spool.close()
+
+    return StreamingResponse(body(), media_type=NDJSON_MEDIA_TYPE, headers=STREAM_HEADERS)
+
+app.include_router(agents_router)
+
+# --- Observability: Prometheus /metrics + optional per-request timing breakdown ---
+TIMING_HEADER = "X-Debug-Timing"
+
+@app.middleware("http")
+async def observe_request(request: Request, call_next):
+    started = time.perf_counter()
+    # Breakdown sirf tab jab client maange; histograms hamesha
+    if request.headers.get(TIMING_HEADER) == "1":
+        with metrics.request_timing() as breakdown:
+            response = await call_next(request)
+        if breakdown:
+            response.headers["Server-Timing"] = metrics.server_timing(breakdown)
+    else:
+        response = await call_next(request)
+    # Route template (/jobs/{job_id}) as label, raw path nahi: cardinality bounded rehti hai
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    metrics.HTTP_SECONDS.observe(time.perf_counter() - started, method=request.method, route=route, status=response.status_code)
+    return response
+
+@metrics.registry.collector
+def collect_component_stats():
+    # Sirf bane hue components: scrape kabhi kuch construct nahi karta
+    samples = [("ready", {}, int(lifecycle.ready))]
+    if lifecycle.import_seconds is not None:
+        samples.append(("startup_import_seconds", {}, lifecycle.import_seconds))
+    if lifecycle.time_to_ready is not None:
+        samples.append(("startup_time_to_ready_seconds", {}, lifecycle.time_to_ready))
+    if (memory := _memory.peek()) is not None:
+        samples += metrics.flatten_stats("memory_cache", memory.cache_stats())
+    if (job_queue := _job_queue.peek()) is not None:
+        samples += metrics.flatten_stats("job_queue", job_queue.stats())
+    samples += metrics.flatten_stats("spawn_coalescing", spawn_flight.stats())
+    samples += metrics.flatten_stats("invalidation_bus", shared_state.bus.stats())
+    samples += metrics.flatten_stats("db_write_lock", get_write_lock("agent_os.db").stats())
+    samples += metrics.flatten_stats("sandbox_pool", sandbox_stats())
+    samples += metrics.flatten_stats("mailbox", mailbox_stats())
+    if (llm_cache := _llm_cache.peek()) is not None:
+        llm = llm_cache.stats()
+        samples += metrics.flatten_stats("llm_cache_front", llm["front"])
+        for route, counters in llm["routes"].items():
+            samples += metrics.flatten_stats("llm_cache", counters, {"route": route})
+    for model, stats in gateway_stats().get("models", {}).items():
+        samples += metrics.flatten_stats("llm_gateway", stats, {"model": model})
+    res = resilience_stats()
+    for name, stats in res["breakers"].items():
+        samples.append(("circuit_open", {"breaker": name}, int(stats["state"] != "closed")))
+        samples += metrics.flatten_stats("circuit", {k: v for k, v in stats.items() if k != "state"}, {"breaker": name})
+    for kind, count in res["gave_up"].items():
+        samples.append(("agent_gave_up", {"kind": kind}, count))
+    return samples
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    # Multi-worker: kisi bhi worker se scrape karo, saare live workers ka aggregate milta hai
+    body = await asyncio.to_thread(shared_state.workers.render_metrics)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+# --- Lifecycle: warm-up, health & readiness ---
+
+@lifecycle.warmup("sqlite")
+def warm_sqlite():
+    # Tables bootstrap + har pool ke saare connections pehle se khol do
+    get_memory().pool.warm()
+    get_llm_cache()
+    get_job_queue()
+    _checkpointer.get().pool.warm()
+
+@lifecycle.warmup("graph")
+def warm_graph():
+    # LLM gateway (shared HTTP pool) + compiled StateGraph
+    get_orchestrator()
+
+@lifecycle.warmup("tokenizer")
+def warm_tokenizer():
+    get_encoding()
+
+@lifecycle.warmup("background")
+async def start_background_services():
+    # Heartbeat job queue se pehle: recovery hamare apne worker ko zinda dekhe
+    shared_state.workers.start()
+    shared_state.bus.start()
+    rate_limiter.start()
+    _checkpointer.get().start_retention(
+        interval=float(os.getenv("CHECKPOINT_PRUNE_INTERVAL", "3600")),
+        keep_last=int(os.getenv("CHECKPOINT_KEEP_LAST", "20")),
+        max_age_days=float(os.getenv("CHECKPOINT_MAX_AGE_DAYS", "7"))
+    )
+    retention = os.getenv("MEMORY_RETENTION_DAYS")
+    get_memory().start_compaction(
+        interval=float(os.getenv("MEMORY_COMPACT_INTERVAL", "3600")),
+        older_than_days=float(os.getenv("MEMORY_COMPACT_AFTER_DAYS", "7")),
+        keep_recent=int(os.getenv("MEMORY_KEEP_RECENT", "100")),
+        retention_days=float(retention) if retention else None
+    )
+    # MAIL_SOURCE set ho toh pehla (bada) index background mein: read_email tab tak partial results deta hai
+    if (mailbox := get_mailbox()) is not None:
+        mailbox.start_sync()
+    job_queue = get_job_queue()
+    job_queue.start_retention(
+        interval=float(os.getenv("JOB_PRUNE_INTERVAL", "3600")),
+        max_age_days=float(os.getenv("JOB_RETENTION_DAYS", "7"))
+    )
+    await job_queue.start()
+
+@lifecycle.readiness_check("sqlite")
+def check_sqlite():
+    get_memory().pool.execute("SELECT 1")
+
+_warmup_task: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def start_warmup():
+    # Background mein: /healthz turant jawab deta hai, /readyz warm-up khatam hone tak 503
+    global _warmup_task
+    _warmup_task = asyncio.create_task(lifecycle.run_warmup())
+
+@app.on_event("shutdown")
+async def flush_memory():
+    if _warmup_task is not None and not _warmup_task.done():
+        _warmup_task.cancel()
+    if (job_queue := _job_queue.peek()) is not None:
+        await job_queue.stop()
+    rate_limiter.persist()
+    shared_state.workers.stop()
+    # Write-behind queue mein jo bhi pending hai use disk pe commit karo
+    if (memory := _memory.peek()) is not None:
+        memory.close()
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process and event loop are up."""
+    return {"status": "ok", "state": lifecycle.state}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: warm-up finished and dependencies answer; 503 otherwise."""
+    checks = await asyncio.to_thread(lifecycle.check) if lifecycle.ready else {}
+    ready = lifecycle.ready and all(result == "ok" for result in checks.values())
+    return JSONResponse(status_code=200 if ready else 503, content=dict(lifecycle.report(), checks=checks))
+
+lifecycle.mark_imported()
+
 print(f"DEBUG: Key Loaded -> {os.getenv('OPENROUTER_API_KEY')[:10]}...")
\ No newline at end of file
@@ -0,0 +1,314 @@
+import bisect
+import contextvars
+import functools
+import inspect
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# --- METRICS: in-process counters/histograms, Prometheus text exposition ---
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (1, 4, 16, 64, 256, 1024, 4096, 16384, 65536)
+
+# Per-request timing breakdown: component -> seconds. Set by request_timing(); asyncio tasks
+# copy the context, so nodes/tools spawned by the request add to the same dict.
+_breakdown: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar("metrics_breakdown", default=None)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(pairs: Iterable[Tuple[str, str]]) -> str:
+    body = ",".join(f'{k}="{_escape(str(v))}"' for k, v in pairs)
+    return f"{{{body}}}" if body else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._series: Dict[tuple, Any] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _copy(self, value: Any) -> Any:
+        return value
+
+    def describe(self) -> Dict[str, Any]:
+        """JSON-safe family: name, kind, help, labelnames and [label values, value] series."""
+        with self._lock:
+            series = [[list(key), self._copy(value)] for key, value in self._series.items()]
+        return {"name": self.name, "kind": self.kind, "help": self.help, "labelnames": list(self.labelnames), "series": series}
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._series.get(self._key(labels), 0)
+
+
+
+class Histogram(_Metric):
+    """Fixed buckets; an observation is one bisect + a few increments under a lock."""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """Observes the block's wall time and adds it to the current request breakdown."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.observe(elapsed, **labels)
+            record(self.name, elapsed, labels)
+
+    def snapshot(self, **labels) -> Dict[str, float]:
+        series = self._series.get(self._key(labels))
+        return {"count": series[2], "sum": series[1]} if series else {"count": 0, "sum": 0.0}
+
+    def _copy(self, value: list) -> list:
+        return [list(value[0]), value[1], value[2]]
+
+    def describe(self) -> Dict[str, Any]:
+        return dict(super().describe(), buckets=list(self.buckets))
+
+
+# A collector returns (name, labels, value) samples, rendered as gauges on every scrape.
+Sample = Tuple[str, Dict[str, Any], float]
+
+
+class Registry:
+    def __init__(self, prefix: str = "agentos_"):
+        self.prefix = prefix
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        name = self.prefix + name
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, help, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help, labelnames, buckets)
+
+    def collector(self, fn: Callable[[], Iterable[Sample]]):
+        """Registers a callback that turns existing stats() dicts into gauges at scrape time."""
+        self._collectors.append(fn)
+        return fn
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Everything render() would print, as JSON-safe data (collectors evaluated now). Worker
+        processes publish these so any worker can render the whole deployment.
+        """
+        gauges, errors = [], []
+        for collect in self._collectors:
+            try:
+                samples = list(collect())
+            except Exception as e:
+                errors.append(f"collector {getattr(collect, '__name__', 'collector')} failed: {e}")
+                continue
+            gauges.extend([self.prefix + name, dict(labels), value] for name, labels, value in samples)
+        return {"metrics": [m.describe() for m in list(self._metrics.values())], "gauges": gauges, "errors": errors}
+
+    def render(self, snapshots: Optional[Dict[str, Dict[str, Any]]] = None) -> str:
+        """
+        Prometheus text for this process, or for several workers' snapshots (worker -> snapshot):
+        counters and histograms are summed, gauges keep a `worker` label.
+        """
+        if snapshots is None:
+            return render_snapshots({"": self.snapshot()}, worker_label=False)
+        return render_snapshots(snapshots)
+
+
+def _merge_families(snapshots: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    families: Dict[str, Dict[str, Any]] = {}
+    for snapshot in snapshots:
+        for family in snapshot["metrics"]:
+            merged = families.get(family["name"])
+            if merged is None:
+                merged = families[family["name"]] = dict(family, series={})
+            series = merged["series"]
+            for key, value in family["series"]:
+                key = tuple(key)
+                current = series.get(key)
+                if current is None:
+                    series[key] = [list(value[0]), value[1], value[2]] if family["kind"] == "histogram" else value
+                elif family["kind"] == "histogram":
+                    current[0] = [a + b for a, b in zip(current[0], value[0])]
+                    current[1] += value[1]
+                    current[2] += value[2]
+                else:
+                    series[key] = current + value
+    return families
+
+
+def _render_family(family: Dict[str, Any]) -> List[str]:
+    name, labelnames = family["name"], family["labelnames"]
+    lines = [f"# HELP {name} {family['help']}", f"# TYPE {name} {family['kind']}"]
+    for key, value in sorted(family["series"].items()):
+        pairs = list(zip(labelnames, key))
+        if family["kind"] != "histogram":
+            lines.append(f"{name}{_format_labels(pairs)} {_format_value(value)}")
+            continue
+        counts, total, count = value
+        cumulative = 0
+        for bound, n in zip(list(family["buckets"]) + [float("inf")], counts):
+            cumulative += n
+            lines.append(f"{name}_bucket{_format_labels(pairs + [('le', _format_value(bound))])} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(pairs)} {_format_value(total)}")
+        lines.append(f"{name}_count{_format_labels(pairs)} {count}")
+    return lines
+
+
+def render_snapshots(snapshots: Dict[str, Dict[str, Any]], worker_label: bool = True) -> str:
+    lines: List[str] = []
+    for family in _merge_families(snapshots.values()).values():
+        lines.extend(_render_family(family))
+    gauges: Dict[str, List[str]] = {}
+    for worker, snapshot in sorted(snapshots.items()):
+        lines.extend(f"# {worker + ': ' if worker_label else ''}{_escape(error)}" for error in snapshot["errors"])
+        for name, labels, value in snapshot["gauges"]:
+            # Gauges add nahi hote (ready, queue depth...), isliye har worker alag series
+            pairs = sorted(dict(labels, worker=worker).items() if worker_label else labels.items())
+            gauges.setdefault(name, []).append(f"{name}{_format_labels(pairs)} {_format_value(value)}")
+    for name, samples in gauges.items():
+        lines.append(f"# TYPE {name} gauge")
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+
+def flatten_stats(prefix: str, stats: Dict[str, Any], labels: Optional[Dict[str, Any]] = None) -> List[Sample]:
+    """Numeric (and bool) leaves of a stats() dict as samples; nested dicts extend the name."""
+    samples: List[Sample] = []
+    for key, value in stats.items():
+        name = f"{prefix}_{re.sub(r'[^a-zA-Z0-9_]', '_', str(key))}"
+        if isinstance(value, bool):
+            samples.append((name, dict(labels or {}), int(value)))
+        elif isinstance(value, (int, float)):
+            samples.append((name, dict(labels or {}), value))
+        elif isinstance(value, dict):
+            samples.extend(flatten_stats(name, value, labels))
+    return samples
+
+
+registry = Registry()
+
+# --- Core instruments (both orchestrators, LLM cache, tools, SQLite) ---
+NODE_SECONDS = registry.histogram("node_seconds", "LangGraph node latency.", ("graph", "node"))
+LLM_SECONDS = registry.histogram("llm_request_seconds", "LLM call latency, including cache lookups.", ("route", "model", "cache"))
+LLM_TOKENS = registry.histogram("llm_tokens", "Tokens per LLM call.", ("route", "model", "kind"), SIZE_BUCKETS)
+LLM_CACHE_LOOKUPS = registry.counter("llm_cache_lookups_total", "LLM cache lookups by result.", ("route", "result"))
+TOOL_SECONDS = registry.histogram("tool_seconds", "Tool execution latency.", ("tool", "agent_role", "outcome"))
+TOOL_CALLS = registry.counter("tool_calls_total", "Tool calls by outcome.", ("tool", "agent_role", "outcome"))
+RETRIES = registry.counter("agent_retries_total", "Worker retries scheduled.", ("agent_role", "kind"))
+RETRY_DELAY = registry.histogram("agent_retry_delay_seconds", "Backoff slept before a retry.", ("kind",))
+DB_SECONDS = registry.histogram("db_operation_seconds", "MemoryManager operation latency.", ("op",))
+DB_BATCH_SECONDS = registry.histogram("db_write_batch_seconds", "Write-behind batch commit latency.", ("db",))
+DB_BATCH_ROWS = registry.histogram("db_write_batch_rows", "Rows per write-behind batch.", ("db",), SIZE_BUCKETS)
+DB_WRITES_DROPPED = registry.counter("db_write_dropped_total", "Write-behind statements dropped after failing on their own.", ("db",))
+HTTP_SECONDS = registry.histogram("http_request_seconds", "HTTP request latency.", ("method", "route", "status"))
+
+
+# --- Per-request breakdown ---
+
+def record(name: str, seconds: float, labels: Optional[Dict[str, Any]] = None):
+    """Adds `seconds` to the active request breakdown (no-op outside request_timing())."""
+    breakdown = _breakdown.get()
+    if breakdown is None:
+        return
+    component = name[len(registry.prefix):] if name.startswith(registry.prefix) else name
+    detail = ".".join(str(v) for k, v in (labels or {}).items() if k not in ("outcome", "cache", "status") and v)
+    key = f"{component}.{detail}" if detail else component
+    breakdown[key] = breakdown.get(key, 0.0) + seconds
+
+
+@contextmanager
+def request_timing() -> Iterator[Dict[str, float]]:
+    breakdown: Dict[str, float] = {}
+    token = _breakdown.set(breakdown)
+    try:
+        yield breakdown
+    finally:
+        _breakdown.reset(token)
+
+
+def current_breakdown() -> Optional[Dict[str, float]]:
+    return _breakdown.get()
+
+
+def server_timing(breakdown: Dict[str, float]) -> str:
+    """Server-Timing header value (milliseconds), heaviest components first."""
+    items = sorted(breakdown.items(), key=lambda kv: -kv[1])
+    return ", ".join(f"{re.sub(r'[^A-Za-z0-9_.-]', '_', k)};dur={v * 1000:.2f}" for k, v in items)
+
+
+# --- Wrappers ---
+
+def instrument_node(graph: str, node: str, fn: Callable) -> Callable:
+    """Wraps a LangGraph node (sync or async) with NODE_SECONDS; the signature is preserved."""
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def timed_async(*args, **kwargs):
+            with NODE_SECONDS.time(graph=graph, node=node):
+                return await fn(*args, **kwargs)
+        return timed_async
+
+    @functools.wraps(fn)
+    def timed(*args, **kwargs):
+        with NODE_SECONDS.time(graph=graph, node=node):
+            return fn(*args, **kwargs)
+    return timed
+
+
+def observe_llm_usage(response: Any, route: str, model: str):
+    """Records prompt/completion tokens from a LangChain AIMessage's usage_metadata, if present."""
+    usage = getattr(response, "usage_metadata", None) or {}
+    for kind, field in (("prompt", "input_tokens"), ("completion", "output_tokens")):
+        if usage.get(field):
+            LLM_TOKENS.observe(usage[field], route=route, model=model, kind=kind)
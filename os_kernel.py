@@ -1,82 +1,768 @@
+import asyncio
 import logging
 import sqlite3
 import json
-from typing import Dict, Any, List
+import os
+import queue
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from fnmatch import fnmatchcase
+from functools import partial
+from typing import Dict, Any, AsyncIterator, Iterable, Iterator, List, Optional, Union
 from langchain_core.messages import SystemMessage
 
+# zstd better ratio/speed deta hai; install na ho toh zlib fallback
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+import metrics
+from cache import LRUCache
+from storage import WriteBehindWriter, get_pool, get_write_lock, get_writer
+from tokenizer import count_tokens, truncate_to_tokens
+
 # Logging setup takki terminal mein alerts dikhein
 logging.basicConfig(level=logging.INFO)
 
+def _context_size(entries: List[tuple]) -> int:
+    """Approximate bytes held by a cached list of (key, value) pairs."""
+    return sum(len(key or "") + len(value or "") for key, value in entries) + 64
+
+# --- Value tiering: small values inline as TEXT, large ones as compressed BLOBs ---
+INLINE_LIMIT = 1024      # chars; isse bade values compress hote hain
+PREVIEW_CHARS = 512      # compressed rows keep a plain-text preview in context_value
+SEGMENT_KEY = "__segment__"
+SEGMENT_PREVIEW_CHARS = 4096
+
+def _compress(text: str) -> tuple:
+    data = text.encode("utf-8")
+    if ZSTD_AVAILABLE:
+        return "zstd", zstandard.ZstdCompressor(level=3).compress(data)
+    return "zlib", zlib.compress(data, 6)
+
+def _decompress(codec: str, blob: bytes) -> str:
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompress(blob).decode("utf-8")
+    if codec == "zlib":
+        return zlib.decompress(blob).decode("utf-8")
+    raise ValueError(f"Unknown memory codec: {codec}")
+
+def _encode_value(text: str) -> tuple:
+    """Returns (context_value, value_codec, value_blob) for storage."""
+    if len(text) <= INLINE_LIMIT:
+        return text, None, None
+    codec, blob = _compress(text)
+    return text[:PREVIEW_CHARS], codec, blob
+
+def _fts_text(key: str, value: str) -> str:
+    """Text that goes into the FTS index: the full value, or every entry of a segment."""
+    if key != SEGMENT_KEY:
+        return value
+    return "\n".join(f"{k}: {v}" for k, v, _ in json.loads(value))
+
+def _decode_row(row: tuple) -> tuple:
+    """(id, key, value, ts, codec, blob) -> (id, key, full value, ts)."""
+    row_id, key, value, ts, codec, blob = row
+    if codec:
+        value = _decompress(codec, blob)
+    return row_id, key, value, ts
+
 # --- PILLAR 2: AGENT MEMORY (The Hippocampus) ---
 class MemoryManager:
     """
     Consolidates short-term context into long-term SQLite storage.
+    Writes go through a shared write-behind queue; reads use a pooled WAL connection.
     """
-    def __init__(self, db_path="agent_os.db"):
+    def __init__(self, db_path="agent_os.db", cache_entries: int = 1024, cache_bytes: int = 8 * 1024 * 1024,
+                 cache_ttl: float = 300.0, recent_window: int = 20, bus=None):
         self.db_path = db_path
-        self.short_term = {} # Session cache
+        # Session cache: har agent ki last `recent_window` (key, value) entries, newest first.
+        # Bounded by entries/bytes + TTL, taaki naye user_ids se memory leak na ho.
+        self.recent_window = recent_window
+        self.short_term = LRUCache(max_entries=cache_entries, max_bytes=cache_bytes, ttl=cache_ttl, sizeof=_context_size)
+        # Multi-worker: doosre worker ne is agent ke liye save kiya toh hamara cached list purana hai
+        self.bus = bus
+        if bus is not None:
+            bus.subscribe("memory", self._drop_recent)
+        self.pool = get_pool(db_path)
+        self.writer = get_writer(db_path)
+        self.write_lock = get_write_lock(db_path)
+        # Dedicated executor: async callers ka SQLite kaam event loop se bahar chalta hai
+        self._executor = ThreadPoolExecutor(max_workers=self.pool.size, thread_name_prefix="memory-io")
         self._bootstrap_db()
 
     def _bootstrap_db(self):
         """Database aur Table create karta hai agar nahi bani toh."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
+        self.pool.executescript('''
             CREATE TABLE IF NOT EXISTS agent_memory (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 agent_id TEXT,
                 context_key TEXT,
                 context_value TEXT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                value_codec TEXT,
+                value_blob BLOB
+            );
+            -- Composite indexes: per-agent time windows / keyset pages aur key lookups bina full scan ke
+            CREATE INDEX IF NOT EXISTS idx_agent_memory_agent_ts ON agent_memory (agent_id, timestamp);
+            CREATE INDEX IF NOT EXISTS idx_agent_memory_agent_key ON agent_memory (agent_id, context_key);
         ''')
-        conn.commit()
-        conn.close()
+        # Purani DB files: compression columns baad mein add hue
+        columns = {row[1] for row in self.pool.execute("PRAGMA table_info(agent_memory)")}
+        for column, ddl in (("value_codec", "TEXT"), ("value_blob", "BLOB")):
+            if column not in columns:
+                self.pool.executescript(f"ALTER TABLE agent_memory ADD COLUMN {column} {ddl};")
+        self.fts_enabled = self._bootstrap_fts()
+        self.last_compaction: Dict[str, Any] = {}
         logging.info("✅ SQLite Database connected and initialized.")
 
+    def _bootstrap_fts(self) -> bool:
+        """
+        FTS5 index over the full text of agent_memory. save_context/compact write the decompressed
+        value (segments: every rolled entry) next to the row; a delete trigger keeps it in sync.
+        Returns False if this SQLite build has no FTS5, in which case search falls back to LIKE.
+        """
+        existing = self.pool.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'agent_memory_fts'")
+        try:
+            if existing and "content='agent_memory'" in existing[0][0]:
+                # Purana external-content index sirf 512-char preview dekhta tha: drop karke full text se rebuild
+                self.pool.executescript('''
+                    DROP TRIGGER IF EXISTS agent_memory_fts_ai;
+                    DROP TRIGGER IF EXISTS agent_memory_fts_ad;
+                    DROP TRIGGER IF EXISTS agent_memory_fts_au;
+                    DROP TABLE agent_memory_fts;
+                ''')
+                existing = []
+            self.pool.executescript('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS agent_memory_fts USING fts5(
+                    context_key, context_value, agent_id UNINDEXED, tokenize='porter unicode61'
+                );
+                CREATE TRIGGER IF NOT EXISTS agent_memory_fts_ad AFTER DELETE ON agent_memory BEGIN
+                    DELETE FROM agent_memory_fts WHERE rowid = old.id;
+                END;
+            ''')
+        except sqlite3.OperationalError as e:
+            logging.warning(f"⚠️ FTS5 unavailable, memory search will scan rows: {e}")
+            return False
+        if not existing:
+            # Pehli baar (ya migration): purani rows decompress karke index mein bharo
+            self._reindex_fts()
+        return True
+
+    def _reindex_fts(self, page_size: int = 500):
+        after_id = 0
+        while True:
+            rows = self.pool.execute(
+                "SELECT id, context_key, context_value, timestamp, value_codec, value_blob, agent_id FROM agent_memory "
+                "WHERE id > ? ORDER BY id LIMIT ?", (after_id, page_size)
+            )
+            if not rows:
+                return
+            with self.pool.connection() as conn, self.write_lock:
+                with conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO agent_memory_fts (rowid, context_key, context_value, agent_id) VALUES (?, ?, ?, ?)",
+                        [(row_id, key, _fts_text(key, value), row[6])
+                         for row in rows for row_id, key, value, _ in [_decode_row(row[:6])]]
+                    )
+            after_id = rows[-1][0]
+
     def save_context(self, agent_id: str, key: str, value: Any):
-        """Permanent storage mein memory save karta hai."""
-        # Feature: Memory Consolidation
+        """Permanent storage ke liye memory queue karta hai (background writer commit karega)."""
+        # Feature: Memory Consolidation - bade values poore compress hote hain, truncate nahi
         content_str = str(value)
-        if len(content_str) > 4000:
-            content_str = f"Summary: {content_str[:100]}... [Archived]"
+        stored_value, codec, blob = _encode_value(content_str)
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO agent_memory (agent_id, context_key, context_value) VALUES (?, ?, ?)",
-            (agent_id, key, content_str)
-        )
-        conn.commit()
-        conn.close()
-        self.short_term[agent_id] = content_str
+        statements = [(
+            "INSERT INTO agent_memory (agent_id, context_key, context_value, value_codec, value_blob) VALUES (?, ?, ?, ?, ?)",
+            (agent_id, key, stored_value, codec, blob)
+        )]
+        if self.fts_enabled:
+            # Index mein poora text jata hai, sirf preview nahi - compressed values bhi searchable
+            statements.append((
+                "INSERT INTO agent_memory_fts (rowid, context_key, context_value, agent_id) VALUES (last_insert_rowid(), ?, ?, ?)",
+                (key, content_str, agent_id)
+            ))
+        self.writer.submit_all(statements)
+        # Write-through: agar agent cached hai toh naya entry aage jod do; agar usi waqt
+        # get_or_load chal raha hai toh generation badh jata hai aur uska (purana) list cache nahi hota
+        entry = (key, content_str)
+        self.short_term.update(agent_id, lambda recent: [entry] + recent[:self.recent_window - 1])
+        if self.bus is not None:
+            self.bus.publish("memory", agent_id)
         return "Memory stored in persistent DB."
 
+    def _drop_recent(self, agent_id: Optional[str]):
+        if agent_id is None:
+            self.short_term.clear()
+        else:
+            self.short_term.delete(agent_id)
+
+    def recent_context(self, agent_id: str, n: Optional[int] = None) -> List[tuple]:
+        """Read-through cache: last N (context_key, context_value) pairs, newest first."""
+        n = self.recent_window if n is None else n
+        if n > self.recent_window:
+            return [(key, value) for _, key, value, _ in self.recent_memory(agent_id, n)]
+        recent = self.short_term.get_or_load(
+            agent_id,
+            lambda: [(key, value) for _, key, value, _ in self.recent_memory(agent_id, self.recent_window)]
+        )
+        return recent[:n]
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """Hit/miss/eviction counters for sizing the short-term cache."""
+        return self.short_term.stats()
+
     def get_memory(self, agent_id: str):
-        """Agent ki saari purani yaadein nikalta hai."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT context_key, context_value FROM agent_memory WHERE agent_id = ?", (agent_id,))
-        rows = cursor.fetchall()
-        conn.close()
-        return rows
+        """Agent ki saari purani yaadein nikalta hai (compacted segments apni entries mein khul jaate hain)."""
+        memories = []
+        for _, key, value, _ in self.iter_memory(agent_id):
+            if key == SEGMENT_KEY:
+                memories.extend((k, v) for k, v, _ in json.loads(value))
+            else:
+                memories.append((key, value))
+        return memories
+
+    # --- Indexed retrieval: keyset pagination + streaming ---
+
+    @staticmethod
+    def _as_timestamp(value: Union[str, datetime, None]) -> Optional[str]:
+        """SQLite CURRENT_TIMESTAMP format (UTC, 'YYYY-MM-DD HH:MM:SS') mein convert karta hai."""
+        if value is None or isinstance(value, str):
+            return value
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+
+    def query_memory(self, agent_id: str, after_id: Optional[int] = None, limit: int = 100,
+                     key: Optional[str] = None, since: Union[str, datetime, None] = None,
+                     until: Union[str, datetime, None] = None, newest_first: bool = False) -> List[tuple]:
+        """
+        Returns one page of (id, context_key, context_value, timestamp) rows ordered by time.
+        Pass the id of the last row as `after_id` to fetch the next page. Compressed values
+        are decompressed transparently.
+        """
+        # Read-your-writes: pending queue pehle commit ho jaye
+        self.writer.flush()
+        where, params = ["agent_id = ?"], [agent_id]
+        if key is not None:
+            where.append("context_key = ?")
+            params.append(key)
+        if since is not None:
+            where.append("timestamp >= ?")
+            params.append(self._as_timestamp(since))
+        if until is not None:
+            where.append("timestamp < ?")
+            params.append(self._as_timestamp(until))
+
+        op, order = ("<", "DESC") if newest_first else (">", "ASC")
+        if after_id is not None:
+            # Keyset cursor: (timestamp, id) row value, taaki index se seek ho, OFFSET scan nahi
+            anchor = self.pool.execute("SELECT timestamp FROM agent_memory WHERE id = ?", (after_id,))
+            if anchor:
+                where.append(f"(timestamp, id) {op} (?, ?)")
+                params.extend([anchor[0][0], after_id])
+            else:
+                where.append(f"id {op} ?")
+                params.append(after_id)
+
+        sql = (
+            "SELECT id, context_key, context_value, timestamp, value_codec, value_blob FROM agent_memory "
+            f"WHERE {' AND '.join(where)} ORDER BY timestamp {order}, id {order} LIMIT ?"
+        )
+        params.append(limit)
+        return [_decode_row(row) for row in self.pool.execute(sql, params)]
+
+    def iter_memory(self, agent_id: str, page_size: int = 500, **filters) -> Iterator[tuple]:
+        """Lazily streams every matching row page by page; memory use stays at one page."""
+        after_id = None
+        while True:
+            rows = self.query_memory(agent_id, after_id=after_id, limit=page_size, **filters)
+            yield from rows
+            if len(rows) < page_size:
+                return
+            after_id = rows[-1][0]
+
+    def recent_memory(self, agent_id: str, n: int = 10, key: Optional[str] = None) -> List[tuple]:
+        """Last N memories (newest first) - index seek, table size se independent."""
+        return self.query_memory(agent_id, limit=n, key=key, newest_first=True)
+
+    # --- Full-text search & context assembly ---
+
+    @staticmethod
+    def _fts_query(query: str) -> str:
+        # Har token quote karke OR: user text mein FTS5 operators / syntax errors nahi aate
+        terms = re.findall(r"\w+", query)
+        return " OR ".join(f'"{t}"' for t in terms)
+
+    def search_memory(self, agent_id: str, query: str, k: int = 5) -> List[tuple]:
+        """
+        Top-k BM25 matches for `query` in this agent's memory.
+        Returns (id, context_key, snippet, score, timestamp) rows, best first (lower score = better).
+        """
+        match = self._fts_query(query)
+        if not match or k <= 0:
+            return []
+        self.writer.flush()
+        if not self.fts_enabled:
+            like = [f"%{t}%" for t in re.findall(r"\w+", query)]
+            rows = self.pool.execute(
+                "SELECT id, context_key, substr(context_value, 1, 200), 0.0, timestamp FROM agent_memory "
+                f"WHERE agent_id = ? AND ({' OR '.join('context_value LIKE ?' for _ in like)}) "
+                "ORDER BY timestamp DESC, id DESC LIMIT ?",
+                [agent_id, *like, k]
+            )
+            return rows
+        return self.pool.execute('''
+            SELECT m.id, m.context_key, snippet(agent_memory_fts, 1, '[', ']', '…', 32),
+                   bm25(agent_memory_fts) AS score, m.timestamp
+            FROM agent_memory_fts JOIN agent_memory m ON m.id = agent_memory_fts.rowid
+            WHERE agent_memory_fts MATCH ? AND m.agent_id = ?
+            ORDER BY score LIMIT ?
+        ''', (match, agent_id, k))
+
+    def build_context(self, agent_id: str, query: str, token_budget: int = 1000, k: int = 20) -> str:
+        """
+        Packs the full text of the best search hits into at most `token_budget` tokens
+        (tiktoken-counted), best first; the last hit that doesn't fit is truncated.
+        """
+        hits = self.search_memory(agent_id, query, k)
+        if not hits:
+            return ""
+        ids = [hit[0] for hit in hits]
+        rows = self.pool.execute(
+            "SELECT id, context_key, context_value, timestamp, value_codec, value_blob FROM agent_memory "
+            f"WHERE id IN ({', '.join('?' * len(ids))})", ids
+        )
+        values = {row[0]: _decode_row(row) for row in rows}
+        parts, remaining = [], token_budget
+        for row_id in ids:
+            if row_id not in values:
+                continue
+            _, key, value, ts = values[row_id]
+            line = f"[{key} @ {ts}] {value}"
+            cost = count_tokens(line)
+            if cost > remaining:
+                line = truncate_to_tokens(line, remaining)
+                if line:
+                    parts.append(line)
+                break
+            parts.append(line)
+            remaining -= cost
+        return "\n".join(parts)
+
+    # --- Compaction & retention ---
+
+    def compact(self, older_than_days: float = 7.0, keep_recent: int = 100,
+                retention_days: Optional[float] = None, min_rows: int = 10) -> Dict[str, Any]:
+        """
+        Rolls each agent's entries older than `older_than_days` (except its newest `keep_recent`)
+        into one compressed segment row with a short summary, and deletes rows past
+        `retention_days`. Nothing is truncated: segments hold every rolled entry in full.
+        """
+        started = time.monotonic()
+        self.writer.flush()
+        cutoff = f"-{older_than_days} days"
+        rolled = segments = expired = 0
+        agents = [row[0] for row in self.pool.execute("SELECT DISTINCT agent_id FROM agent_memory")]
+        for agent_id in agents:
+            # Write lock: doosre workers ka compaction usi agent ko dobara roll nahi karta
+            with self.pool.connection() as conn, self.write_lock:
+                with conn:
+                    rows = conn.execute('''
+                        SELECT id, context_key, context_value, timestamp, value_codec, value_blob FROM agent_memory
+                        WHERE agent_id = ? AND context_key != ? AND timestamp < datetime('now', ?)
+                        AND id NOT IN (
+                            -- keep_recent sirf asli entries ginta hai, purane segments window nahi khaate
+                            SELECT id FROM agent_memory WHERE agent_id = ? AND context_key != ?
+                            ORDER BY timestamp DESC, id DESC LIMIT ?
+                        )
+                        ORDER BY timestamp, id
+                    ''', (agent_id, SEGMENT_KEY, cutoff, agent_id, SEGMENT_KEY, keep_recent)).fetchall()
+                    if len(rows) < min_rows:
+                        continue
+                    entries = [_decode_row(row) for row in rows]
+                    keys = Counter(key for _, key, _, _ in entries)
+                    summary = (
+                        f"Segment: {len(entries)} entries from {entries[0][3]} to {entries[-1][3]}; "
+                        f"keys: {', '.join(f'{k} ({n})' for k, n in keys.most_common(10))}\n"
+                        # Excerpts bhi rakhte hain taaki segment full-text search mein milta rahe
+                        + "\n".join(f"{k}: {v[:200]}" for _, k, v, _ in entries)
+                    )[:SEGMENT_PREVIEW_CHARS]
+                    payload = json.dumps([[k, v, ts] for _, k, v, ts in entries])
+                    codec, blob = _compress(payload)
+                    segment_id = conn.execute(
+                        "INSERT INTO agent_memory (agent_id, context_key, context_value, timestamp, value_codec, value_blob) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (agent_id, SEGMENT_KEY, summary, entries[-1][3], codec, blob)
+                    ).lastrowid
+                    if self.fts_enabled:
+                        # Rolled entries ka poora text segment ke naam pe index hota hai, sirf summary nahi
+                        conn.execute(
+                            "INSERT INTO agent_memory_fts (rowid, context_key, context_value, agent_id) VALUES (?, ?, ?, ?)",
+                            (segment_id, SEGMENT_KEY, _fts_text(SEGMENT_KEY, payload), agent_id)
+                        )
+                    conn.executemany("DELETE FROM agent_memory WHERE id = ?", [(row[0],) for row in rows])
+            rolled += len(rows)
+            segments += 1
+        if retention_days is not None:
+            with self.pool.connection() as conn, self.write_lock:
+                with conn:
+                    expired = conn.execute(
+                        "DELETE FROM agent_memory WHERE timestamp < datetime('now', ?)", (f"-{retention_days} days",)
+                    ).rowcount
+        elapsed = time.monotonic() - started
+        self.last_compaction = {
+            "rows_rolled": rolled, "segments_created": segments, "rows_expired": expired,
+            "seconds": round(elapsed, 3), "rows_per_second": round(rolled / elapsed, 1) if elapsed else 0.0,
+        }
+        if rolled or expired:
+            logging.info(f"🗜️ Memory compaction: {self.last_compaction}")
+        return self.last_compaction
+
+    def start_compaction(self, interval: float = 3600.0, **compact_kwargs):
+        """Runs compact() every `interval` seconds on a daemon thread."""
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.compact(**compact_kwargs)
+                except Exception as e:
+                    logging.error(f"❌ Memory compaction failed: {e}")
+        threading.Thread(target=loop, name="memory-compaction", daemon=True).start()
+
+    def storage_stats(self) -> Dict[str, Any]:
+        """DB size, row counts and the last compaction's throughput."""
+        self.writer.flush()
+        page_count = self.pool.execute("PRAGMA page_count")[0][0]
+        page_size = self.pool.execute("PRAGMA page_size")[0][0]
+        freelist = self.pool.execute("PRAGMA freelist_count")[0][0]
+        rows, compressed, segments = self.pool.execute('''
+            SELECT COUNT(*), COUNT(value_codec), SUM(context_key = ?) FROM agent_memory
+        ''', (SEGMENT_KEY,))[0]
+        wal_path = f"{self.db_path}-wal"
+        return {
+            "db_bytes": page_count * page_size,
+            "wal_bytes": os.path.getsize(wal_path) if os.path.exists(wal_path) else 0,
+            "free_bytes": freelist * page_size,
+            "rows": rows,
+            "compressed_rows": compressed,
+            "segments": segments or 0,
+            "codec": "zstd" if ZSTD_AVAILABLE else "zlib",
+            "last_compaction": self.last_compaction,
+        }
+
+    # --- Async API (FastAPI request path) ---
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        # Timer event loop pe: executor queue wait bhi latency mein aata hai
+        with metrics.DB_SECONDS.time(op=getattr(fn, "func", fn).__name__):
+            return await loop.run_in_executor(self._executor, partial(fn, *args))
+
+    async def asave_context(self, agent_id: str, key: str, value: Any):
+        """Non-blocking save_context for async nodes."""
+        return await self._run(self.save_context, agent_id, key, value)
+
+    async def aget_memory(self, agent_id: str):
+        """Non-blocking get_memory for async nodes."""
+        return await self._run(self.get_memory, agent_id)
+
+    async def aquery_memory(self, agent_id: str, **kwargs) -> List[tuple]:
+        """Non-blocking query_memory."""
+        return await self._run(partial(self.query_memory, agent_id, **kwargs))
+
+    async def arecent_context(self, agent_id: str, n: Optional[int] = None) -> List[tuple]:
+        """Non-blocking recent_context (cache hit ho toh bhi executor se hoke jata hai)."""
+        return await self._run(self.recent_context, agent_id, n)
+
+    async def arecent_memory(self, agent_id: str, n: int = 10, key: Optional[str] = None) -> List[tuple]:
+        return await self._run(self.recent_memory, agent_id, n, key)
+
+    async def asearch_memory(self, agent_id: str, query: str, k: int = 5) -> List[tuple]:
+        return await self._run(self.search_memory, agent_id, query, k)
+
+    async def abuild_context(self, agent_id: str, query: str, token_budget: int = 1000, k: int = 20) -> str:
+        """Non-blocking build_context for async nodes."""
+        return await self._run(self.build_context, agent_id, query, token_budget, k)
+
+    async def aiter_memory(self, agent_id: str, page_size: int = 500, **filters) -> AsyncIterator[tuple]:
+        """Rows ko pages mein stream karta hai, bina poori list memory mein laaye."""
+        after_id = None
+        while True:
+            rows = await self._run(partial(self.query_memory, agent_id, after_id=after_id, limit=page_size, **filters))
+            for row in rows:
+                yield row
+            if len(rows) < page_size:
+                return
+            after_id = rows[-1][0]
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Blocks until all queued memories are on disk."""
+        return self.writer.flush(timeout)
+
+    def close(self):
+        """Shutdown hook: pending writes flush karta hai."""
+        self.writer.flush()
+        self._executor.shutdown(wait=True)
 
 # --- PILLAR 1: AGENT PERMISSIONS (The Firewall) ---
+
+# Seed policy: pehli baar DB khali ho toh yahi rules likhe jaate hain
+DEFAULT_POLICY = {
+    "research_agent": ["search_web", "read_email"],
+    "finance_agent": ["read_email", "execute_payment"],
+    "junior_agent": ["search_web"]
+}
+
+
+class CompiledPolicy:
+    """
+    Immutable, versioned policy snapshot. Role and tool names are interned to integer ids and
+    each role's allowed tools become one int bitset (inheritance and role "*" already folded in).
+    Tool patterns like "search_*" or "*" are kept aside and only consulted for unknown tools.
+    """
+    __slots__ = ("version", "tool_ids", "role_bits", "role_patterns", "decisions")
+
+    def __init__(self, version: int, rules: Dict[str, List[str]], parents: Dict[str, List[str]]):
+        self.version = version
+        tools = sorted({t for allowed in rules.values() for t in allowed if not _is_pattern(t)})
+        self.tool_ids = {name: i for i, name in enumerate(tools)}
+        self.role_bits: Dict[str, int] = {}
+        self.role_patterns: Dict[str, tuple] = {}
+        self.decisions: Dict[tuple, bool] = {}  # (role, tool) -> decision, snapshot ke saath hi invalidate
+
+        global_tools = self._resolve("*", rules, parents, set())
+        for role in set(rules) | set(parents):
+            if role == "*":
+                continue
+            allowed = self._resolve(role, rules, parents, set()) | global_tools
+            self.role_bits[role] = self._bits(t for t in allowed if not _is_pattern(t))
+            self.role_patterns[role] = tuple(t for t in allowed if _is_pattern(t))
+        # Unknown roles sirf "*" rules inherit karte hain
+        self.role_bits["*"] = self._bits(t for t in global_tools if not _is_pattern(t))
+        self.role_patterns["*"] = tuple(t for t in global_tools if _is_pattern(t))
+
+    @staticmethod
+    def _resolve(role: str, rules, parents, seen: set) -> set:
+        if role in seen:  # inheritance cycle guard
+            return set()
+        seen.add(role)
+        allowed = set(rules.get(role, ()))
+        for parent in parents.get(role, ()):
+            allowed |= CompiledPolicy._resolve(parent, rules, parents, seen)
+        return allowed
+
+    def _bits(self, tools: Iterable[str]) -> int:
+        bits = 0
+        for tool in tools:
+            bits |= 1 << self.tool_ids[tool]
+        return bits
+
+    def allows(self, role: str, tool: str) -> bool:
+        key = (role, tool)
+        decision = self.decisions.get(key)
+        if decision is None:
+            bits = self.role_bits.get(role, self.role_bits["*"])
+            tool_id = self.tool_ids.get(tool)
+            decision = (tool_id is not None and bool(bits >> tool_id & 1)) or any(
+                fnmatchcase(tool, pattern) for pattern in self.role_patterns.get(role, self.role_patterns["*"])
+            )
+            if len(self.decisions) >= 65536:
+                self.decisions.clear()
+            self.decisions[key] = decision
+        return decision
+
+    def as_dict(self) -> Dict[str, List[str]]:
+        names = sorted(self.tool_ids, key=self.tool_ids.get)
+        return {
+            role: [n for n in names if bits >> self.tool_ids[n] & 1] + list(self.role_patterns[role])
+            for role, bits in self.role_bits.items() if role != "*"
+        }
+
+
+def _is_pattern(name: str) -> bool:
+    return any(c in name for c in "*?[")
+
+
+class AuditSink:
+    """
+    Buffered security audit trail. Denials are queued in memory; a background thread logs them
+    in batches and appends them to the security_audit table through the write-behind writer.
+    """
+    def __init__(self, writer: WriteBehindWriter, flush_interval: float = 1.0, max_pending: int = 10000):
+        self.writer = writer
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[tuple]" = queue.Queue(maxsize=max_pending)
+        self.dropped = 0
+        threading.Thread(target=self._run, name="security-audit", daemon=True).start()
+
+    def record(self, agent_role: str, tool_name: str, policy_version: int):
+        try:
+            self._queue.put_nowait((agent_role, tool_name, policy_version))
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            time.sleep(self.flush_interval)
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            summary = ", ".join(f"{role}->{tool}" for role, tool, _ in batch[:20])
+            more = f" (+{len(batch) - 20} more)" if len(batch) > 20 else ""
+            logging.warning(f"🚨 SECURITY ALERT: {len(batch)} unauthorized tool call(s): {summary}{more}")
+            try:
+                for role, tool, version in batch:
+                    self.writer.submit(
+                        "INSERT INTO security_audit (agent_role, tool_name, policy_version) VALUES (?, ?, ?)",
+                        (role, tool, version)
+                    )
+            except RuntimeError:
+                # Interpreter shutdown: writer pehle hi band ho chuka hai
+                return
+
+
 class PermissionEngine:
     """
     Agents cannot call tools directly. They must pass through this proxy.
+    Policies live in SQLite and are compiled into a CompiledPolicy snapshot; a version bump in the
+    DB is picked up within `reload_interval` seconds without a restart.
     """
-    def __init__(self):
-        # Define RBAC (Role Based Access Control)
-        self.policy = {
-            "research_agent": ["search_web", "read_email"],
-            "finance_agent": ["read_email", "execute_payment"],
-            "junior_agent": ["search_web"] 
-        }
+    def __init__(self, db_path="agent_os.db", reload_interval: float = 5.0):
+        self.db_path = db_path
+        self.pool = get_pool(db_path)
+        # Policy writes bhi baaki writers ki tarah shared lock pe: multi-worker mein SQLITE_BUSY nahi
+        self.write_lock = get_write_lock(db_path)
+        self.reload_interval = reload_interval
+        self._reload_lock = threading.Lock()
+        self._next_check = 0.0
+        self._bootstrap_db()
+        self.audit = AuditSink(get_writer(db_path))
+        self._policy = self._compile()
+
+    def _bootstrap_db(self):
+        with self.pool.connection() as conn, self.write_lock:
+            with conn:
+                conn.executescript('''
+                    CREATE TABLE IF NOT EXISTS permission_rules (
+                        role TEXT NOT NULL,
+                        tool TEXT NOT NULL,
+                        PRIMARY KEY (role, tool)
+                    );
+                    CREATE TABLE IF NOT EXISTS permission_parents (
+                        role TEXT NOT NULL,
+                        parent TEXT NOT NULL,
+                        PRIMARY KEY (role, parent)
+                    );
+                    CREATE TABLE IF NOT EXISTS permission_version (
+                        id INTEGER PRIMARY KEY CHECK (id = 1),
+                        version INTEGER NOT NULL
+                    );
+                    CREATE TABLE IF NOT EXISTS security_audit (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        agent_role TEXT,
+                        tool_name TEXT,
+                        policy_version INTEGER,
+                        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+                    );
+                ''')
+                # Define RBAC (Role Based Access Control) - sirf pehli baar seed hota hai
+                if conn.execute("INSERT OR IGNORE INTO permission_version (id, version) VALUES (1, 1)").rowcount:
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO permission_rules (role, tool) VALUES (?, ?)",
+                        [(role, tool) for role, tools in DEFAULT_POLICY.items() for tool in tools]
+                    )
+
+    def _compile(self) -> CompiledPolicy:
+        # Ek hi read transaction: rules aur version consistent rahein
+        with self.pool.connection() as conn:
+            conn.execute("BEGIN")
+            version = conn.execute("SELECT version FROM permission_version WHERE id = 1").fetchone()[0]
+            rules: Dict[str, List[str]] = {}
+            for role, tool in conn.execute("SELECT role, tool FROM permission_rules"):
+                rules.setdefault(role, []).append(tool)
+            parents: Dict[str, List[str]] = {}
+            for role, parent in conn.execute("SELECT role, parent FROM permission_parents"):
+                parents.setdefault(role, []).append(parent)
+            conn.execute("COMMIT")
+        return CompiledPolicy(version, rules, parents)
+
+    # --- Hot reload ---
+
+    @property
+    def version(self) -> int:
+        return self._policy.version
+
+    @property
+    def policy(self) -> Dict[str, List[str]]:
+        """Role -> allowed tools view of the current snapshot."""
+        return self._policy.as_dict()
+
+    def reload(self, force: bool = False) -> bool:
+        """Recompiles if the DB version changed; the snapshot swap is atomic. Returns True on reload."""
+        with self._reload_lock:
+            current = self.pool.execute("SELECT version FROM permission_version WHERE id = 1")[0][0]
+            if not force and current == self._policy.version:
+                return False
+            self._policy = self._compile()
+            logging.info(f"🔐 Permission policy reloaded (version {self._policy.version}).")
+            return True
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + self.reload_interval
+            self.reload()
+
+    def _modify(self, statements: List[tuple]):
+        with self.pool.connection() as conn, self.write_lock:
+            with conn:
+                for sql, params in statements:
+                    conn.execute(sql, params)
+                conn.execute("UPDATE permission_version SET version = version + 1 WHERE id = 1")
+        self.reload()
+
+    def grant(self, agent_role: str, tool_name: str):
+        """Allows a tool (or pattern like "search_*", or "*") for a role; role "*" means every role."""
+        self._modify([("INSERT OR IGNORE INTO permission_rules (role, tool) VALUES (?, ?)", (agent_role, tool_name))])
+
+    def revoke(self, agent_role: str, tool_name: str):
+        self._modify([("DELETE FROM permission_rules WHERE role = ? AND tool = ?", (agent_role, tool_name))])
+
+    def set_parents(self, agent_role: str, parents: List[str]):
+        """Role inherits every tool of its parent roles."""
+        self._modify(
+            [("DELETE FROM permission_parents WHERE role = ?", (agent_role,))]
+            + [("INSERT INTO permission_parents (role, parent) VALUES (?, ?)", (agent_role, p)) for p in parents]
+        )
+
+    # --- Decisions ---
 
     def verify_action(self, agent_role: str, tool_name: str) -> bool:
-        allowed_tools = self.policy.get(agent_role, [])
-        if tool_name in allowed_tools:
+        self._maybe_reload()
+        policy = self._policy
+        if policy.allows(agent_role, tool_name):
             return True
-        logging.warning(f"🚨 SECURITY ALERT: {agent_role} unauthorized tool: {tool_name}")
-        return False
\ No newline at end of file
+        self.audit.record(agent_role, tool_name, policy.version)
+        return False
+
+    def verify_many(self, agent_role: str, tool_names: List[str]) -> List[bool]:
+        """Batch check for multi-tool turns; every decision comes from the same policy snapshot."""
+        self._maybe_reload()
+        policy = self._policy
+        decisions = [policy.allows(agent_role, tool) for tool in tool_names]
+        for tool, allowed in zip(tool_names, decisions):
+            if not allowed:
+                self.audit.record(agent_role, tool, policy.version)
+        return decisions
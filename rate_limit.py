@@ -0,0 +1,254 @@
+import logging
+import math
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+from shared_state import worker_count
+from storage import get_pool, get_write_lock
+from tokenizer import count_tokens
+
+# --- RATE LIMITING: per-key token buckets + daily LLM token quotas ---
+
+
+class PlanLimit(NamedTuple):
+    rate: float                   # requests refilled per second
+    burst: int                    # bucket capacity
+    daily_tokens: Optional[int]   # LLM tokens (prompt + completion) per UTC day, None = unlimited
+
+
+PLAN_LIMITS: Dict[str, PlanLimit] = {
+    "free": PlanLimit(rate=0.5, burst=10, daily_tokens=50_000),
+    "pro": PlanLimit(rate=5.0, burst=50, daily_tokens=2_000_000),
+    "enterprise": PlanLimit(rate=50.0, burst=200, daily_tokens=None),
+}
+DEFAULT_PLAN = "free"
+
+
+class RateDecision(NamedTuple):
+    allowed: bool
+    limit: int
+    remaining: int
+    reset: float                  # seconds until the bucket is full again
+    retry_after: float = 0.0
+
+    def headers(self) -> Dict[str, str]:
+        headers = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.remaining),
+            "X-RateLimit-Reset": str(math.ceil(self.reset)),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(math.ceil(self.retry_after))
+        return headers
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated", "quota_day", "quota_used")
+
+    def __init__(self, tokens: float, updated: float, quota_day: int = 0, quota_used: int = 0):
+        self.tokens = tokens
+        self.updated = updated
+        self.quota_day = quota_day
+        self.quota_used = quota_used
+
+
+def _utc_day(now: float) -> int:
+    return int(now // 86400)
+
+
+class RateLimiter:
+    """
+    In-memory limiter: O(1) dict lookup + a few float ops per request. Buckets are mutated only
+    from the event loop (async dependencies); a background thread periodically snapshots changed
+    keys to SQLite so limits survive restarts. The pending-sync state it hands over (dirty keys,
+    unsynced quota tokens) is guarded by a short, uncontended lock.
+
+    Multi-worker: each worker enforces its 1/`workers` share of every plan's rate and burst, and
+    daily token quotas are shared - persist() adds this worker's metered tokens to the row and
+    reads back the total, so a key's quota is exact across workers within `persist_interval`.
+    """
+    def __init__(self, db_path: str = "agent_os.db", plans: Optional[Dict[str, PlanLimit]] = None,
+                 persist_interval: float = 10.0, workers: Optional[int] = None):
+        self.plans = plans or PLAN_LIMITS
+        self.pool = get_pool(db_path)
+        self.write_lock = get_write_lock(db_path)
+        self.persist_interval = persist_interval
+        self.workers = workers or worker_count()
+        self._buckets: Dict[str, _Bucket] = {}
+        self._dirty: set = set()
+        self._unsynced: Dict[str, int] = defaultdict(int)   # key -> tokens metered here, not yet in SQLite
+        # persist() thread pe swap karta hai, event loop meter karta hai: bina lock ke increments kho jaate
+        self._sync_lock = threading.Lock()
+        self._started = False
+
+    def _plan(self, plan: str) -> PlanLimit:
+        limit = self.plans.get(plan) or self.plans[DEFAULT_PLAN]
+        if self.workers > 1:
+            # Har worker ka hissa: load balancer requests barabar baant-ta hai, total plan ke barabar
+            return limit._replace(rate=limit.rate / self.workers, burst=max(1, limit.burst // self.workers))
+        return limit
+
+    # --- Persistence ---
+
+    def start(self):
+        """Loads persisted counters and starts the periodic snapshot thread."""
+        if self._started:
+            return
+        self._started = True
+        self.pool.executescript('''
+            CREATE TABLE IF NOT EXISTS rate_limits (
+                key TEXT PRIMARY KEY,
+                tokens REAL,
+                updated REAL,
+                quota_day INTEGER,
+                quota_used INTEGER
+            );
+        ''')
+        for key, tokens, updated, quota_day, quota_used in self.pool.execute(
+            "SELECT key, tokens, updated, quota_day, quota_used FROM rate_limits", ()
+        ):
+            self._buckets.setdefault(key, _Bucket(tokens, updated, quota_day, quota_used))
+        threading.Thread(target=self._persist_loop, name="rate-limit-persist", daemon=True).start()
+
+    def _persist_loop(self):
+        while True:
+            time.sleep(self.persist_interval)
+            self.persist()
+
+    def persist(self):
+        if not self._started:
+            return  # table abhi bani nahi (warm-up se pehle shutdown)
+        # Swap lock ke andar: is ke baad jo meter ho woh naye dicts mein, agli persist mein jaata hai
+        with self._sync_lock:
+            dirty, self._dirty = self._dirty, set()
+            unsynced, self._unsynced = self._unsynced, defaultdict(int)
+        rows = []
+        for key in dirty | unsynced.keys():
+            b = self._buckets.get(key)
+            if b is not None:
+                rows.append((key, b.tokens, b.updated, b.quota_day, unsynced.get(key, 0)))
+        today = _utc_day(time.time())
+        try:
+            with self.pool.connection() as conn, self.write_lock:
+                with conn:
+                    # quota_used additive hai (doosre workers ke tokens overwrite nahi hote); naya din = reset
+                    conn.executemany('''
+                        INSERT INTO rate_limits (key, tokens, updated, quota_day, quota_used) VALUES (?, ?, ?, ?, ?)
+                        ON CONFLICT (key) DO UPDATE SET
+                            tokens = excluded.tokens,
+                            updated = excluded.updated,
+                            quota_used = CASE
+                                WHEN rate_limits.quota_day = excluded.quota_day THEN rate_limits.quota_used + excluded.quota_used
+                                WHEN rate_limits.quota_day > excluded.quota_day THEN rate_limits.quota_used
+                                ELSE excluded.quota_used END,
+                            quota_day = MAX(rate_limits.quota_day, excluded.quota_day)
+                    ''', rows)
+                # Aaj ke saare keys: jo key yahan idle hai par doosre worker pe chal rahi hai, uska total bhi taaza
+                shared = conn.execute("SELECT key, quota_used FROM rate_limits WHERE quota_day = ?", (today,)).fetchall()
+        except Exception as e:
+            # Tokens wapas pending mein: agli persist dobara koshish kare
+            with self._sync_lock:
+                for key, *_rest, tokens in rows:
+                    self._unsynced[key] += tokens
+                    self._dirty.add(key)
+            logging.error(f"❌ Rate-limit persist failed: {e}")
+            return
+        with self._sync_lock:
+            for key, quota_used in shared:
+                b = self._buckets.get(key)
+                if b is not None and b.quota_day == today:
+                    # Saare workers ka total + jo yahan swap ke baad meter hua
+                    b.quota_used = quota_used + self._unsynced.get(key, 0)
+        if rows:
+            logging.debug(f"Persisted {len(rows)} rate-limit counters")
+
+    # --- Hot path ---
+
+    def _bucket(self, key: str, limit: PlanLimit, now: float) -> _Bucket:
+        b = self._buckets.get(key)
+        if b is None:
+            b = self._buckets[key] = _Bucket(float(limit.burst), now, _utc_day(now))
+        else:
+            b.tokens = min(limit.burst, b.tokens + (now - b.updated) * limit.rate)
+            b.updated = now
+        return b
+
+    def check_request(self, key: str, plan: str, cost: float = 1.0) -> RateDecision:
+        """Takes `cost` tokens from the key's bucket if available."""
+        limit = self._plan(plan)
+        now = time.time()
+        b = self._bucket(key, limit, now)
+        allowed = b.tokens >= cost
+        if allowed:
+            b.tokens -= cost
+            with self._sync_lock:
+                self._dirty.add(key)
+        reset = (limit.burst - b.tokens) / limit.rate
+        retry_after = 0.0 if allowed else (cost - b.tokens) / limit.rate
+        return RateDecision(allowed, limit.burst, int(b.tokens), reset, retry_after)
+
+    def quota_remaining(self, key: str, plan: str) -> Optional[int]:
+        """LLM tokens left today, or None for unlimited plans."""
+        limit = self._plan(plan)
+        if limit.daily_tokens is None:
+            return None
+        now = time.time()
+        b = self._bucket(key, limit, now)
+        if b.quota_day != _utc_day(now):
+            b.quota_day, b.quota_used = _utc_day(now), 0
+        return max(0, limit.daily_tokens - b.quota_used)
+
+    def record_tokens(self, key: str, plan: str, tokens: int):
+        """Meters prompt/completion tokens against the key's daily quota."""
+        now = time.time()
+        b = self._bucket(key, self._plan(plan), now)
+        with self._sync_lock:
+            if b.quota_day != _utc_day(now):
+                b.quota_day, b.quota_used = _utc_day(now), 0
+            b.quota_used += tokens
+            self._unsynced[key] += tokens
+            self._dirty.add(key)
+
+
+rate_limiter = RateLimiter()
+
+
+# --- LLM usage metering: whoever started the graph run pays for its model calls ---
+
+_meter: ContextVar[Optional[Tuple[str, str]]] = ContextVar("rate_limit_meter", default=None)
+
+
+@contextmanager
+def metering(key: Optional[str], plan: str):
+    """LLM calls made inside this block (graph nodes inherit the context) are charged to `key`."""
+    token = _meter.set((key, plan) if key else None)
+    try:
+        yield
+    finally:
+        try:
+            _meter.reset(token)
+        except ValueError:  # streaming body ka async generator doosre context mein band hua
+            pass
+
+
+def usage_tokens(response: Any, messages: Any = None) -> int:
+    """Prompt + completion tokens from usage_metadata; tiktoken estimate if the provider sent none."""
+    usage = getattr(response, "usage_metadata", None) or {}
+    total = usage.get("total_tokens") or (usage.get("input_tokens", 0) + usage.get("output_tokens", 0))
+    if total:
+        return int(total)
+    if isinstance(messages, str):
+        prompt = messages
+    else:
+        prompt = "\n".join(str(getattr(m, "content", m)) for m in messages or ())
+    return count_tokens(prompt) + count_tokens(str(getattr(response, "content", "") or ""))
+
+
+def meter_llm_usage(response: Any, messages: Any = None):
+    meter = _meter.get()
+    if meter is not None:
+        rate_limiter.record_tokens(meter[0], meter[1], usage_tokens(response, messages))
@@ -0,0 +1,202 @@
+import random
+import threading
+import time
+from collections import Counter
+from email.utils import parsedate_to_datetime
+from enum import Enum
+from typing import Any, Dict, Iterable, NamedTuple, Optional
+
+# --- RESILIENCE: error classification, backoff + jitter, circuit breakers ---
+
+
+class ErrorKind(str, Enum):
+    TRANSIENT = "transient"          # retry with backoff
+    RATE_LIMITED = "rate_limited"    # retry, but not before Retry-After
+    PERMANENT = "permanent"          # never retry (permission denied, bad request, ...)
+    CIRCUIT_OPEN = "circuit_open"    # fail fast, dependency is known-bad right now
+
+
+class ClassifiedError(NamedTuple):
+    kind: ErrorKind
+    message: str
+    retry_after: Optional[float] = None
+
+    def as_state(self) -> Dict[str, Any]:
+        """Plain dict form for LangGraph state."""
+        return {"kind": self.kind.value, "message": self.message, "retry_after": self.retry_after}
+
+
+_PERMANENT_STATUS = {400, 401, 403, 404, 405, 409, 422}
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After header: delta seconds or an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_exception(exc: BaseException) -> ClassifiedError:
+    """Maps an exception from the LLM client or a tool onto an ErrorKind."""
+    message = f"{type(exc).__name__}: {exc}"
+    status = _status_code(exc)
+    if status == 429 or "RateLimit" in type(exc).__name__:
+        headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+        return ClassifiedError(ErrorKind.RATE_LIMITED, message, parse_retry_after(headers.get("retry-after")))
+    if status in _PERMANENT_STATUS or isinstance(exc, (PermissionError, ValueError, TypeError, KeyError)):
+        return ClassifiedError(ErrorKind.PERMANENT, message)
+    # 5xx, timeouts, connection resets, unknown -> transient
+    return ClassifiedError(ErrorKind.TRANSIENT, message)
+
+
+def merge_errors(errors: Iterable[Optional[ClassifiedError]]) -> Optional[ClassifiedError]:
+    """Worst-of for a multi-tool turn: any permanent error makes the whole turn permanent."""
+    errors = [e for e in errors if e is not None]
+    if not errors:
+        return None
+    for kind in (ErrorKind.PERMANENT, ErrorKind.CIRCUIT_OPEN, ErrorKind.RATE_LIMITED):
+        picked = [e for e in errors if e.kind == kind]
+        if picked:
+            retry_after = max((e.retry_after or 0.0 for e in picked), default=0.0) or None
+            return ClassifiedError(kind, "; ".join(e.message for e in picked), retry_after)
+    return ClassifiedError(ErrorKind.TRANSIENT, "; ".join(e.message for e in errors))
+
+
+class Backoff:
+    """
+    Exponential backoff with full jitter, never shorter than a server-provided Retry-After.
+    A Retry-After above `max_retry_after` (default: `cap`) is not worth sleeping through inside
+    a request: callers check too_long() and fail fast instead; delay() never exceeds it either.
+    """
+    def __init__(self, base: float = 0.5, factor: float = 2.0, cap: float = 30.0,
+                 max_retry_after: Optional[float] = None):
+        self.base = base
+        self.factor = factor
+        self.cap = cap
+        self.max_retry_after = cap if max_retry_after is None else max_retry_after
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        ceiling = min(self.cap, self.base * self.factor ** attempt)
+        return max(min(retry_after or 0.0, self.max_retry_after), random.uniform(0, ceiling))
+
+    def too_long(self, retry_after: Optional[float]) -> bool:
+        """True if the server asked us to wait longer than we are willing to sleep."""
+        return retry_after is not None and retry_after > self.max_retry_after
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `failure_threshold` consecutive failures; open rejects calls for
+    `reset_timeout` seconds, then half-open lets one probe through to decide.
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.rejected = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def retry_in(self) -> float:
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def release(self):
+        """
+        Frees the half-open probe slot without deciding anything (cancelled call). Safe to call
+        after record_success/record_failure: state already settled, nothing changes.
+        """
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "failures": self.failures, "times_opened": self.times_opened, "rejected": self.rejected}
+
+
+def settle(breaker: CircuitBreaker, exc: BaseException) -> ClassifiedError:
+    """Classifies `exc` and settles the breaker: a permanent error still means the dependency answered."""
+    error = classify_exception(exc)
+    if error.kind == ErrorKind.PERMANENT:
+        breaker.record_success()
+    else:
+        breaker.record_failure()
+    return error
+
+
+class BreakerRegistry:
+    """Process-wide breakers keyed by dependency, e.g. "llm:<model>" or "tool:execute_python"."""
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> CircuitBreaker:
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(
+                    name, CircuitBreaker(name, self.failure_threshold, self.reset_timeout)
+                )
+        return breaker
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: b.stats() for name, b in list(self._breakers.items())}
+
+
+breakers = BreakerRegistry()
+retry_counts: Counter = Counter()     # kind -> retries scheduled
+give_up_counts: Counter = Counter()   # kind -> runs that stopped retrying
+
+
+def resilience_stats() -> Dict[str, Any]:
+    return {"retries": dict(retry_counts), "gave_up": dict(give_up_counts), "breakers": breakers.stats()}
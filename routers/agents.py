@@ -1,5 +1,7 @@
-from fastapi import APIRouter, Depends
-from dependencies import verify_api_key
+from fastapi import APIRouter, Depends, HTTPException, status
+from dependencies import enforce_rate_limit, enforce_token_quota
+from jobs import QueueFull
+from lifecycle import lifecycle
 from pydantic import BaseModel
 
 # 1. Define your schema
@@ -9,12 +11,31 @@ class JobRequest(BaseModel):
 # 2. Use APIRouter instead of app
 router = APIRouter()
 
-@router.post("/spawn_agent")
-async def run_agent_job(job: JobRequest, user_info: tuple = Depends(verify_api_key)):
-    user_id, plan = user_info
+@router.post("/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def submit_agent_job(job: JobRequest, user_info: tuple = Depends(enforce_token_quota)):
+    """Queues the agent run and returns a job id immediately; poll /jobs/{job_id} for the result."""
+    # Quota yahan sirf check hota hai; tokens job chalne pe model ke usage se meter hote hain (run_job)
+    user_id, plan, rate_key = user_info
     
-    # To avoid circular imports, import the instance inside the function
-    from main import os_instance 
+    # Lifecycle registry se: main ko dobara import nahi karna padta (no circular import)
+    job_queue = lifecycle.get("job_queue")
     
-    final_output = os_instance.app.invoke({"task": job.task})
-    return {"status": "success", "trace": final_output}
\ No newline at end of file
+    try:
+        job_id = await job_queue.submit(user_id, plan, job.task, meter_key=rate_key)
+    except QueueFull:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Job queue is full, try again shortly.",
+            headers={"Retry-After": "5"}
+        )
+    return {"status": "queued", "job_id": job_id}
+
+@router.get("/jobs/{job_id}")
+async def get_agent_job(job_id: str, user_info: tuple = Depends(enforce_rate_limit)):
+    user_id, plan, _ = user_info
+
+    job = await lifecycle.get("job_queue").aget(job_id)
+    # Dusre user ki job ka existence bhi leak nahi karna
+    if job is None or job["user_id"] != user_id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job
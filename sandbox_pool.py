@@ -0,0 +1,422 @@
+import json
+import logging
+import os
+import queue
+import select
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import NamedTuple, Optional
+
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:  # Windows: rlimits nahi milte
+    RESOURCE_AVAILABLE = False
+
+try:
+    from e2b_code_interpreter import Sandbox
+    E2B_AVAILABLE = True
+except ImportError:
+    E2B_AVAILABLE = False
+
+
+class ExecutionResult(NamedTuple):
+    stdout: str
+    result: Optional[str] = None
+    error: Optional[str] = None  # "Name: value"
+
+
+class SandboxTimeout(Exception):
+    pass
+
+
+# --- BACKEND INTERFACE ---
+
+class SandboxSession(ABC):
+    """One warm interpreter. Sessions are leased from a SandboxPool, one caller at a time."""
+    uses = 0
+
+    @abstractmethod
+    def run(self, code: str, timeout: float) -> ExecutionResult: ...
+
+    @abstractmethod
+    def reset(self):
+        """Clears interpreter state so the next lease starts clean."""
+
+    @abstractmethod
+    def close(self): ...
+
+    def keepalive(self):
+        """Called when the session goes back to the pool; remote backends push their expiry out."""
+
+    @property
+    def alive(self) -> bool:
+        return True
+
+
+class SandboxBackend(ABC):
+    name = "base"
+
+    @abstractmethod
+    def create(self) -> SandboxSession: ...
+
+
+# --- E2B (remote) ---
+
+class E2BSession(SandboxSession):
+    # Itne der idle rahe toh E2B se poochte hain ki sandbox abhi bhi zinda hai (warna lease free hai)
+    CHECK_AFTER = 30.0
+
+    def __init__(self, timeout: int = 300):
+        self.timeout = timeout
+        self.sb = Sandbox(timeout=timeout)
+        self.refreshed_at = time.monotonic()
+
+    def run(self, code: str, timeout: float) -> ExecutionResult:
+        execution = self.sb.run_code(code, timeout=timeout)
+        error = f"{execution.error.name}: {execution.error.value}" if execution.error else None
+        stdout = "".join(execution.logs.stdout) if execution.logs.stdout else ""
+        result = str(execution.results) if execution.results else None
+        return ExecutionResult(stdout, result, error)
+
+    def reset(self):
+        self.sb.run_code("%reset -f")
+
+    def keepalive(self):
+        # E2B ka timeout abhi se dobara ginti shuru karta hai
+        self.sb.set_timeout(self.timeout)
+        self.refreshed_at = time.monotonic()
+
+    @property
+    def alive(self) -> bool:
+        idle = time.monotonic() - self.refreshed_at
+        # Remote side pe expire hone ke kareeb (ya ho chuka): recycle, is pe lease mat do
+        if idle >= self.timeout * 0.9:
+            return False
+        if idle < self.CHECK_AFTER:
+            return True
+        try:
+            return self.sb.is_running()
+        except Exception:
+            return False
+
+    def close(self):
+        try:
+            self.sb.kill()
+        except Exception:
+            pass
+
+
+class E2BBackend(SandboxBackend):
+    """Remote E2B sandboxes; `timeout` is the server-side idle lifetime, refreshed on every return to the pool."""
+    name = "e2b"
+
+    def __init__(self, timeout: int = 300):
+        self.timeout = timeout
+
+    def create(self) -> SandboxSession:
+        if not E2B_AVAILABLE:
+            raise RuntimeError("'e2b-code-interpreter' is not installed. Please install it to run Python code safely.")
+        return E2BSession(self.timeout)
+
+
+# --- Local subprocess (resource-limited) ---
+
+# Child interpreter: JSON request/response lines over a private fd; user code ka stdout StringIO mein jata hai.
+_WORKER_SOURCE = r'''
+import ast, contextlib, io, json, os, sys
+proto_out = os.fdopen(os.dup(1), "w")
+devnull = os.open(os.devnull, os.O_WRONLY)
+os.dup2(devnull, 1)
+os.dup2(devnull, 2)
+max_output = int(sys.argv[1])
+namespace = {"__name__": "__sandbox__"}
+for line in sys.stdin:
+    request = json.loads(line)
+    if request["op"] == "reset":
+        namespace = {"__name__": "__sandbox__"}
+        proto_out.write("{}\n"); proto_out.flush()
+        continue
+    buf = io.StringIO()
+    result = error = None
+    try:
+        tree = ast.parse(request["code"])
+        last = tree.body.pop() if tree.body and isinstance(tree.body[-1], ast.Expr) else None
+        with contextlib.redirect_stdout(buf), contextlib.redirect_stderr(buf):
+            exec(compile(tree, "<sandbox>", "exec"), namespace)
+            if last is not None:
+                value = eval(compile(ast.Expression(last.value), "<sandbox>", "eval"), namespace)
+                if value is not None:
+                    result = repr(value)[:max_output]
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+    proto_out.write(json.dumps({"stdout": buf.getvalue()[:max_output], "result": result, "error": error}) + "\n")
+    proto_out.flush()
+'''
+
+
+class SubprocessSession(SandboxSession):
+    def __init__(self, max_output: int, memory_mb: int, cpu_seconds: int):
+        self.workdir = tempfile.TemporaryDirectory(prefix="agent-sandbox-")
+        self.memory_mb = memory_mb
+        self.cpu_seconds = cpu_seconds
+        self.proc = subprocess.Popen(
+            [sys.executable, "-I", "-u", "-c", _WORKER_SOURCE, str(max_output)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            cwd=self.workdir.name, env={"PATH": os.environ.get("PATH", "")},
+            text=True, preexec_fn=self._limit if RESOURCE_AVAILABLE else None,
+        )
+
+    def _limit(self):
+        # Child process mein chalta hai, exec se pehle
+        mem = self.memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (mem, mem))
+        resource.setrlimit(resource.RLIMIT_CPU, (self.cpu_seconds, self.cpu_seconds))
+        resource.setrlimit(resource.RLIMIT_FSIZE, (16 * 1024 * 1024, 16 * 1024 * 1024))
+        resource.setrlimit(resource.RLIMIT_NOFILE, (64, 64))
+
+    def _call(self, request: dict, timeout: float) -> dict:
+        self.proc.stdin.write(json.dumps(request) + "\n")
+        self.proc.stdin.flush()
+        ready, _, _ = select.select([self.proc.stdout], [], [], timeout)
+        if not ready:
+            self.close()
+            raise SandboxTimeout(f"Execution exceeded {timeout}s")
+        line = self.proc.stdout.readline()
+        if not line:
+            raise RuntimeError("Sandbox interpreter exited (resource limit hit?)")
+        return json.loads(line)
+
+    def run(self, code: str, timeout: float) -> ExecutionResult:
+        reply = self._call({"op": "run", "code": code}, timeout)
+        return ExecutionResult(reply["stdout"], reply["result"], reply["error"])
+
+    def reset(self):
+        self._call({"op": "reset"}, timeout=5)
+
+    @property
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def close(self):
+        if self.alive:
+            self.proc.kill()
+        self.proc.wait()
+        for stream in (self.proc.stdin, self.proc.stdout):
+            try:
+                stream.close()
+            except OSError:
+                pass
+        self.workdir.cleanup()
+
+
+class SubprocessBackend(SandboxBackend):
+    """
+    Local interpreter per session with rlimits on memory, CPU time, file size and open files.
+    Not an isolation boundary: code runs as the server's user with its network access and can
+    read anything that user can (only cwd and env are scrubbed). Use it for trusted code or
+    inside a container that provides the isolation; untrusted code belongs on e2b.
+    """
+    name = "local"
+
+    def __init__(self, max_output: int = 10_000, memory_mb: int = 512, cpu_seconds: int = 30):
+        self.max_output = max_output
+        self.memory_mb = memory_mb
+        self.cpu_seconds = cpu_seconds
+
+    def create(self) -> SandboxSession:
+        return SubprocessSession(self.max_output, self.memory_mb, self.cpu_seconds)
+
+
+BACKENDS = {"e2b": E2BBackend, "local": SubprocessBackend}
+
+
+# --- POOL ---
+
+class SandboxPool:
+    """
+    Keeps `size` pre-warmed sessions and leases one per execution. A session is reset after each
+    use and recycled after `max_uses` uses, on timeout, or when it dies. At most `max_sessions`
+    sessions exist at once (idle + leased + starting); past that, lease() waits up to `timeout`
+    for one to come back and then raises SandboxTimeout.
+    """
+    def __init__(self, backend: SandboxBackend, size: int = 2, max_uses: int = 50,
+                 timeout: float = 30.0, max_output: int = 10_000, max_sessions: Optional[int] = None):
+        self.backend = backend
+        self.size = size
+        self.max_uses = max_uses
+        self.timeout = timeout
+        self.max_output = max_output
+        self.max_sessions = max(size, max_sessions if max_sessions is not None else 4 * size, 1)
+        self._idle: "queue.Queue[SandboxSession]" = queue.Queue()
+        # _live = sessions jo exist karti hain ya ban rahi hain; cap yahin lagta hai
+        self._cond = threading.Condition()
+        self._live = 0
+        self._closed = False
+        self.created = 0
+        self.recycled = 0
+        self.expired = 0
+        self.waits = 0
+
+    def warm(self, block: bool = False):
+        """Starts `size` sessions (in the background unless block=True)."""
+        threads = [threading.Thread(target=self._spawn, daemon=True) for _ in range(self.size)]
+        for t in threads:
+            t.start()
+        if block:
+            for t in threads:
+                t.join()
+
+    def _spawn(self):
+        with self._cond:
+            if self._live >= self.max_sessions:
+                return
+            self._live += 1
+        try:
+            session = self.backend.create()
+        except Exception as e:
+            self._release_slot()
+            logging.error(f"❌ Sandbox warm-up failed ({self.backend.name}): {e}")
+            return
+        self.created += 1
+        if self._closed:
+            session.close()
+            self._release_slot()
+        else:
+            self._put_idle(session)
+
+    def _put_idle(self, session: SandboxSession):
+        with self._cond:
+            self._idle.put(session)
+            self._cond.notify()
+
+    def _release_slot(self):
+        with self._cond:
+            self._live -= 1
+            self._cond.notify()
+
+    def _take(self, deadline: float) -> Optional[SandboxSession]:
+        """An idle session, or None once a slot for a new one is reserved; waits while at the cap."""
+        with self._cond:
+            while True:
+                try:
+                    return self._idle.get_nowait()
+                except queue.Empty:
+                    pass
+                if self._live < self.max_sessions:
+                    self._live += 1
+                    return None
+                # Cap pe: naya session banane ke bajaye kisi ke wapas aane ka intezaar
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise SandboxTimeout(f"No sandbox free within {self.timeout}s ({self.max_sessions} sessions busy)")
+                self.waits += 1
+                self._cond.wait(remaining)
+
+    def _acquire(self) -> SandboxSession:
+        deadline = time.monotonic() + self.timeout
+        while True:
+            session = self._take(deadline)
+            if session is None:
+                break
+            if session.alive:
+                return session
+            # Pool mein pada pada expire ho gaya (e.g. E2B timeout): band karo, agla try karo
+            self.expired += 1
+            self._discard(session, replace=False)
+        try:
+            # Cold path: koi warm session free nahi, toh ek naya bana do
+            session = self.backend.create()
+        except BaseException:
+            self._release_slot()
+            raise
+        self.created += 1
+        return session
+
+    def _discard(self, session: SandboxSession, replace: bool = True):
+        self.recycled += 1
+        try:
+            session.close()
+        except Exception:
+            pass
+        self._release_slot()
+        if replace and not self._closed and self._idle.qsize() < self.size:
+            # Pool warm rahe: replacement background mein
+            threading.Thread(target=self._spawn, daemon=True).start()
+
+    @contextmanager
+    def lease(self):
+        session = self._acquire()
+        healthy = True
+        try:
+            yield session
+        except Exception:
+            healthy = False
+            raise
+        finally:
+            session.uses += 1
+            if self._idle.qsize() >= self.size:
+                # Cold-path extra session: pool already full, isko band karo
+                self._discard(session, replace=False)
+            elif not healthy or not session.alive or session.uses >= self.max_uses:
+                self._discard(session)
+            else:
+                try:
+                    session.reset()
+                    session.keepalive()
+                    self._put_idle(session)
+                except Exception:
+                    self._discard(session)
+
+    def run(self, code: str, timeout: Optional[float] = None) -> ExecutionResult:
+        with self.lease() as session:
+            res = session.run(code, self.timeout if timeout is None else timeout)
+        cap = self.max_output
+        return ExecutionResult(res.stdout[:cap], res.result[:cap] if res.result else None, res.error)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+            self._release_slot()
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend.name, "idle": self._idle.qsize(), "live": self._live,
+            "max_sessions": self.max_sessions, "waits": self.waits, "expired": self.expired,
+            "created": self.created, "recycled": self.recycled,
+        }
+
+
+def pool_from_env() -> SandboxPool:
+    """
+    SANDBOX_BACKEND=e2b|local, SANDBOX_POOL_SIZE, SANDBOX_MAX_SESSIONS, SANDBOX_MAX_USES,
+    SANDBOX_TIMEOUT, SANDBOX_MAX_OUTPUT, SANDBOX_E2B_TIMEOUT (remote idle lifetime, seconds). `local` only applies rlimits (no network or filesystem
+    isolation, see SubprocessBackend): run it inside a container, or keep e2b for untrusted code.
+    """
+    name = os.getenv("SANDBOX_BACKEND", "e2b")
+    max_output = int(os.getenv("SANDBOX_MAX_OUTPUT", "10000"))
+    if name == "local":
+        logging.warning("⚠️ SANDBOX_BACKEND=local: rlimits only, code keeps the server's network and file access")
+        backend = SubprocessBackend(max_output=max_output)
+    elif name == "e2b":
+        backend = E2BBackend(timeout=int(os.getenv("SANDBOX_E2B_TIMEOUT", "300")))
+    else:
+        backend = BACKENDS[name]()
+    max_sessions = os.getenv("SANDBOX_MAX_SESSIONS")
+    return SandboxPool(
+        backend,
+        size=int(os.getenv("SANDBOX_POOL_SIZE", "2")),
+        max_uses=int(os.getenv("SANDBOX_MAX_USES", "50")),
+        timeout=float(os.getenv("SANDBOX_TIMEOUT", "30")),
+        max_output=max_output,
+        max_sessions=int(max_sessions) if max_sessions else None,
+    )
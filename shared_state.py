@@ -0,0 +1,236 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import metrics
+from storage import flush_all, get_pool
+
+# --- SHARED STATE: multiple uvicorn/gunicorn workers on one box ---
+# Har worker apne in-process caches rakhta hai (fast path same rehta hai); yahan sirf woh hai jo
+# processes ke beech share hona chahiye: cache invalidations, worker liveness, metrics.
+
+SHARED_DB = os.getenv("SHARED_STATE_DB", "agent_os.shared.db")
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+Handler = Callable[[Optional[str]], None]
+
+
+def worker_count() -> int:
+    """Worker processes configured for this deployment (uvicorn/gunicorn read WEB_CONCURRENCY too)."""
+    return max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+
+
+def _enabled_from_env() -> bool:
+    # SHARED_STATE=1/0 force; default: sirf jab ek se zyada workers hon
+    setting = os.getenv("SHARED_STATE", "auto").lower()
+    if setting in ("1", "true", "on"):
+        return True
+    if setting in ("0", "false", "off"):
+        return False
+    return worker_count() > 1
+
+
+class InvalidationBus:
+    """
+    Cross-process cache invalidation over a notify table. publish(namespace, key) is buffered and
+    de-duplicated; a poll thread commits the buffer (after flushing write-behind queues, so the
+    data behind the invalidation is already durable) and reads other workers' events. Reads are
+    gated on `PRAGMA data_version`, so an idle bus costs one pragma per poll. key=None means
+    "drop the whole namespace". Disabled (publish is a no-op) in single-process deployments.
+    """
+    def __init__(self, db_path: str = SHARED_DB, poll_interval: float = 0.25, retention: float = 300.0,
+                 enabled: Optional[bool] = None):
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.enabled = _enabled_from_env() if enabled is None else enabled
+        self._handlers: Dict[str, List[Handler]] = defaultdict(list)
+        self._pending: Set[Tuple[str, Optional[str]]] = set()
+        self._lock = threading.Lock()
+        self._last_seq = 0
+        self._started = False
+        self.published = 0
+        self.received = 0
+
+    def subscribe(self, namespace: str, handler: Handler):
+        """`handler(key)` runs on the poll thread for events from *other* workers."""
+        self._handlers[namespace].append(handler)
+
+    def publish(self, namespace: str, key: Optional[str] = None):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._pending.add((namespace, key))
+
+    def start(self):
+        if self._started or not self.enabled:
+            return
+        self._started = True
+        pool = get_pool(self.db_path)
+        pool.executescript('''
+            CREATE TABLE IF NOT EXISTS cache_events (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                namespace TEXT NOT NULL,
+                key TEXT,
+                origin TEXT NOT NULL,
+                created REAL NOT NULL
+            );
+        ''')
+        # Sirf start ke baad ke events: purane invalidations hamare khaali caches pe bekaar hain
+        self._last_seq = pool.execute("SELECT COALESCE(MAX(seq), 0) FROM cache_events")[0][0]
+        threading.Thread(target=self._run, name="invalidation-bus", daemon=True).start()
+        logging.info(f"📣 Invalidation bus started for worker {WORKER_ID} (poll {self.poll_interval}s)")
+
+    def _run(self):
+        # Dedicated connection: data_version per-connection hota hai, pooled connections pe nahi chalega
+        conn = sqlite3.connect(self.db_path, timeout=10.0)
+        conn.execute("PRAGMA journal_mode=WAL")
+        data_version = None
+        last_prune = time.monotonic()
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self._flush_pending(conn)
+                current = conn.execute("PRAGMA data_version").fetchone()[0]
+                if current != data_version:
+                    data_version = current
+                    self._dispatch(conn)
+                if time.monotonic() - last_prune > self.retention:
+                    last_prune = time.monotonic()
+                    with conn:
+                        conn.execute("DELETE FROM cache_events WHERE created < ?", (time.time() - self.retention,))
+            except Exception as e:
+                logging.error(f"❌ Invalidation bus poll failed: {e}")
+
+    def _flush_pending(self, conn: sqlite3.Connection):
+        with self._lock:
+            pending, self._pending = self._pending, set()
+        if not pending:
+            return
+        # Pehle data commit ho, phir invalidation: doosra worker reload kare toh naya row mile
+        flush_all(timeout=5.0)
+        now = time.time()
+        with conn:
+            conn.executemany(
+                "INSERT INTO cache_events (namespace, key, origin, created) VALUES (?, ?, ?, ?)",
+                [(namespace, key, WORKER_ID, now) for namespace, key in pending]
+            )
+        self.published += len(pending)
+
+    def _dispatch(self, conn: sqlite3.Connection):
+        rows = conn.execute(
+            "SELECT seq, namespace, key, origin FROM cache_events WHERE seq > ? ORDER BY seq", (self._last_seq,)
+        ).fetchall()
+        for seq, namespace, key, origin in rows:
+            self._last_seq = seq
+            if origin == WORKER_ID:
+                continue
+            self.received += 1
+            for handler in self._handlers.get(namespace, ()):
+                try:
+                    handler(key)
+                except Exception as e:
+                    logging.error(f"❌ Invalidation handler for {namespace} failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {"enabled": self.enabled, "published": self.published, "received": self.received,
+                "pending": len(self._pending), "last_seq": self._last_seq}
+
+
+class WorkerRegistry:
+    """
+    Per-worker heartbeat row carrying that worker's metrics snapshot. Any worker can then answer
+    /metrics for the whole deployment (counters/histograms summed) and tell which workers are
+    alive (e.g. whose running jobs must not be re-queued).
+    """
+    def __init__(self, registry: metrics.Registry = metrics.registry, db_path: str = SHARED_DB,
+                 interval: float = 5.0, enabled: Optional[bool] = None):
+        self.registry = registry
+        self.db_path = db_path
+        self.interval = interval
+        self.enabled = _enabled_from_env() if enabled is None else enabled
+        self.started_at = time.time()
+        self._bootstrapped = False
+        self._started = False
+
+    @property
+    def max_age(self) -> float:
+        # Teen heartbeats miss = worker mara hua maano
+        return 3 * self.interval
+
+    def _bootstrap(self):
+        if self._bootstrapped:
+            return
+        get_pool(self.db_path).executescript('''
+            CREATE TABLE IF NOT EXISTS workers (
+                worker TEXT PRIMARY KEY,
+                pid INTEGER,
+                started REAL,
+                heartbeat REAL,
+                metrics TEXT
+            );
+        ''')
+        self._bootstrapped = True
+
+    def _write(self, sql: str, params: tuple):
+        with get_pool(self.db_path).connection() as conn:
+            with conn:
+                conn.execute(sql, params)
+
+    def heartbeat(self):
+        """Publishes this worker's liveness and metrics snapshot."""
+        self._bootstrap()
+        self._write(
+            "INSERT OR REPLACE INTO workers (worker, pid, started, heartbeat, metrics) VALUES (?, ?, ?, ?, ?)",
+            (WORKER_ID, os.getpid(), self.started_at, time.time(), json.dumps(self.registry.snapshot(), default=str))
+        )
+
+    def start(self):
+        if self._started or not self.enabled:
+            return
+        self._started = True
+        self.heartbeat()
+        threading.Thread(target=self._run, name="worker-heartbeat", daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.heartbeat()
+            except Exception as e:
+                logging.error(f"❌ Worker heartbeat failed: {e}")
+
+    def stop(self):
+        """Removes this worker's row on clean shutdown (its counters leave the aggregate)."""
+        if self._started:
+            self._write("DELETE FROM workers WHERE worker = ?", (WORKER_ID,))
+
+    def live_workers(self) -> List[str]:
+        if not self.enabled:
+            return [WORKER_ID]
+        self._bootstrap()
+        rows = get_pool(self.db_path).execute(
+            "SELECT worker FROM workers WHERE heartbeat >= ?", (time.time() - self.max_age,)
+        )
+        return [row[0] for row in rows]
+
+    def render_metrics(self) -> str:
+        """Prometheus text across all live workers; single-process deployments render locally."""
+        if not self.enabled:
+            return self.registry.render()
+        # Apna snapshot taaza, baaki workers ka last heartbeat se (max `interval` purana)
+        self.heartbeat()
+        rows = get_pool(self.db_path).execute(
+            "SELECT worker, metrics FROM workers WHERE heartbeat >= ?", (time.time() - self.max_age,)
+        )
+        return self.registry.render({worker: json.loads(snapshot) for worker, snapshot in rows})
+
+
+bus = InvalidationBus()
+workers = WorkerRegistry()
@@ -0,0 +1,50 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from cache import LRUCache
+
+_MISSING = object()
+
+
+class SingleFlight:
+    """
+    Request coalescing: concurrent calls with the same key share one execution and its result.
+    With `window > 0`, a finished result is also served to identical calls arriving within
+    `window` seconds after it completed.
+    """
+    def __init__(self, window: float = 0.0, max_recent: int = 1024):
+        self.window = window
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._recent = LRUCache(max_entries=max_recent, ttl=window) if window > 0 else None
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        if self._recent is not None:
+            result = self._recent.get(key, _MISSING)
+            if result is not _MISSING:
+                self.coalesced += 1
+                return result
+
+        task = self._inflight.get(key)
+        if task is None:
+            # Leader: execution ek alag Task mein, taaki leader client disconnect ho toh baaki cancel na hon
+            self.executions += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, key=key: self._finish(key, t))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        if self._recent is not None and not task.cancelled() and task.exception() is None:
+            self._recent.set(key, task.result())
+
+    @property
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+    def stats(self) -> Dict[str, int]:
+        return {"executions": self.executions, "coalesced": self.coalesced, "inflight": self.inflight}
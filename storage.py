@@ -0,0 +1,362 @@
+import atexit
+import contextlib
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:  # Windows: sirf in-process lock
+    FCNTL_AVAILABLE = False
+
+import metrics
+
+# --- STORAGE LAYER: pooled SQLite + write-behind batching ---
+# Har call pe naya sqlite3.connect() + commit karne ki jagah connections reuse hote hain
+# aur writes ek background thread batch mein flush karta hai.
+
+DEFAULT_PRAGMAS: Dict[str, Any] = {
+    "journal_mode": "WAL",        # readers never block the writer
+    "synchronous": "NORMAL",      # fsync on checkpoint, not on every commit (safe with WAL)
+    "busy_timeout": 5000,         # wait instead of raising "database is locked"
+    "cache_size": -16000,         # ~16 MB page cache per connection
+    "temp_store": "MEMORY",
+    "mmap_size": 128 * 1024 * 1024,
+}
+
+
+class ConnectionPool:
+    """
+    A small, thread-safe pool of SQLite connections with WAL journaling and tuned pragmas.
+    """
+    def __init__(self, db_path: str, size: int = 4, pragmas: Optional[Dict[str, Any]] = None, timeout: float = 10.0):
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = dict(DEFAULT_PRAGMAS, **(pragmas or {}))
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=size)
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        """Idle connection lo, ya pool full nahi hai toh naya banao."""
+        if self._closed:
+            raise RuntimeError(f"Connection pool for {self.db_path} is closed")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        return self._idle.get(timeout=self.timeout)
+
+    def release(self, conn: sqlite3.Connection):
+        if conn.in_transaction:
+            conn.rollback()
+        if self._closed:
+            conn.close()
+            return
+        self._idle.put_nowait(conn)
+
+    def warm(self):
+        """Opens every pooled connection up front (pragmas applied, schema loaded)."""
+        while True:
+            with self._lock:
+                if self._created >= self.size:
+                    return
+                self._created += 1
+            try:
+                conn = self._connect()
+                conn.execute("SELECT count(*) FROM sqlite_master").fetchone()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+            self.release(conn)
+
+    @contextmanager
+    def connection(self):
+        """Leases a connection for the duration of the `with` block."""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def execute(self, sql: str, params: Sequence[Any] = ()) -> list:
+        """Runs a read query and returns all rows."""
+        with self.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def executescript(self, script: str):
+        with self.connection() as conn:
+            conn.executescript(script)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class WriteLock:
+    """
+    Single-writer lock for one DB file across threads *and* worker processes (flock on
+    `<db>.writelock`). SQLite allows one writer anyway; taking the lock first means the other
+    workers queue up in the kernel instead of spinning on busy_timeout retries.
+    """
+    def __init__(self, db_path: str):
+        self.path = f"{db_path}.writelock"
+        self._thread_lock = threading.Lock()
+        self._fd: Optional[int] = None
+        self._pid: Optional[int] = None
+        self.acquisitions = 0
+        self.wait_seconds = 0.0
+
+    def _file(self) -> int:
+        # Fork ke baad inherited fd pe flock parent ke saath share hota hai, isliye per-pid open
+        if self._fd is None or self._pid != os.getpid():
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            self._pid = os.getpid()
+        return self._fd
+
+    def acquire(self):
+        started = time.perf_counter()
+        self._thread_lock.acquire()
+        if FCNTL_AVAILABLE:
+            try:
+                fcntl.flock(self._file(), fcntl.LOCK_EX)
+            except Exception:
+                self._thread_lock.release()
+                raise
+        self.acquisitions += 1
+        self.wait_seconds += time.perf_counter() - started
+
+    def release(self):
+        if FCNTL_AVAILABLE and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"acquisitions": self.acquisitions, "wait_seconds": self.wait_seconds, "interprocess": FCNTL_AVAILABLE}
+
+
+class _Flush:
+    """Marker put on the write queue; the writer sets the event once everything before it is committed."""
+    __slots__ = ("event",)
+
+    def __init__(self):
+        self.event = threading.Event()
+
+
+_STOP = object()
+
+
+class WriteBehindWriter:
+    """
+    Queues INSERT/UPDATE statements in memory and commits them from a single background thread.
+    A batch is flushed when it reaches `batch_size` statements or `flush_interval` seconds
+    after its first statement, whichever comes first.
+    """
+    def __init__(self, pool: ConnectionPool, batch_size: int = 256, flush_interval: float = 0.05, max_pending: int = 10000,
+                 lock: Optional[WriteLock] = None):
+        self.pool = pool
+        self.lock = lock
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # Bounded queue = backpressure: agar disk peeche reh gayi toh submit() block karega
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name=f"sqlite-writer:{pool.db_path}", daemon=True)
+        self._closed = False
+        self.batches_written = 0
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self._thread.start()
+
+    def submit(self, sql: str, params: Sequence[Any] = ()):
+        """Enqueue a write; returns immediately."""
+        if self._closed:
+            raise RuntimeError("Writer is closed")
+        self._queue.put((sql, tuple(params)))
+
+    def submit_all(self, statements: Iterable[Tuple[str, Sequence[Any]]]):
+        """Enqueue several writes that commit in order, in the same batch and connection."""
+        if self._closed:
+            raise RuntimeError("Writer is closed")
+        # Ek hi queue item: doosre threads ke writes beech mein nahi aa sakte (last_insert_rowid() safe)
+        self._queue.put([(sql, tuple(params)) for sql, params in statements])
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Blocks until every write submitted so far has been committed."""
+        if self._closed or not self._thread.is_alive():
+            return True
+        marker = _Flush()
+        self._queue.put(marker)
+        return marker.event.wait(timeout)
+
+    def close(self, timeout: Optional[float] = 10.0):
+        """Flushes pending writes and stops the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            # batch = units: ek submit() ya ek submit_all() group, jo saath commit/drop hote hain
+            batch, markers, stop, rows = [], [], False, 0
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is _STOP:
+                    stop = True
+                    break
+                if isinstance(item, _Flush):
+                    markers.append(item)
+                    break
+                unit = item if isinstance(item, list) else [item]
+                batch.append(unit)
+                rows += len(unit)
+                if rows >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+            for marker in markers:
+                marker.event.set()
+            if stop:
+                return
+
+    def _commit(self, statements: List[Tuple[str, tuple]]):
+        # Consecutive same-SQL statements ko executemany mein group karo
+        groups: list = []
+        for sql, params in statements:
+            if groups and groups[-1][0] == sql:
+                groups[-1][1].append(params)
+            else:
+                groups.append((sql, [params]))
+        with self.pool.connection() as conn, (self.lock or contextlib.nullcontext()):
+            with conn:
+                for sql, rows in groups:
+                    conn.executemany(sql, rows)
+
+    def _write(self, batch: List[List[Tuple[str, tuple]]]):
+        db = os.path.basename(self.pool.db_path)
+        statements = [statement for unit in batch for statement in unit]
+        started = time.perf_counter()
+        try:
+            self._commit(statements)
+        except Exception as e:
+            # Ek kharab row poora transaction rollback karti hai: baaki callers (checkpoints, audit,
+            # job state) ke writes na khoyein, isliye har unit alag se dobara, sirf fail wala drop
+            logging.warning(f"⚠️ Write-behind batch failed, retrying {len(batch)} writes one by one: {e}")
+            statements = []
+            for unit in batch:
+                try:
+                    self._commit(unit)
+                    statements.extend(unit)
+                except Exception as e:
+                    self.rows_dropped += len(unit)
+                    metrics.DB_WRITES_DROPPED.inc(len(unit), db=db)
+                    logging.error(f"❌ Write-behind dropped {len(unit)} statement(s) [{unit[0][0][:80]}]: {e}")
+        self.batches_written += 1
+        self.rows_written += len(statements)
+        metrics.DB_BATCH_SECONDS.observe(time.perf_counter() - started, db=db)
+        metrics.DB_BATCH_ROWS.observe(len(statements), db=db)
+
+
+# --- Shared per-file registry: ek DB file = ek pool + ek writer ---
+_pools: Dict[str, ConnectionPool] = {}
+_writers: Dict[str, WriteBehindWriter] = {}
+_write_locks: Dict[str, WriteLock] = {}
+_registry_lock = threading.Lock()
+
+
+def get_pool(db_path: str = "agent_os.db") -> ConnectionPool:
+    with _registry_lock:
+        pool = _pools.get(db_path)
+        if pool is None:
+            pool = _pools[db_path] = ConnectionPool(db_path)
+        return pool
+
+
+def get_write_lock(db_path: str = "agent_os.db") -> WriteLock:
+    """The file's single-writer lock; direct (non write-behind) commits should hold it too."""
+    with _registry_lock:
+        lock = _write_locks.get(db_path)
+        if lock is None:
+            lock = _write_locks[db_path] = WriteLock(db_path)
+        return lock
+
+
+def get_writer(db_path: str = "agent_os.db") -> WriteBehindWriter:
+    pool = get_pool(db_path)
+    lock = get_write_lock(db_path)
+    with _registry_lock:
+        writer = _writers.get(db_path)
+        if writer is None:
+            writer = _writers[db_path] = WriteBehindWriter(pool, lock=lock)
+        return writer
+
+
+def flush_all(timeout: Optional[float] = None):
+    """Commits every queued write across all databases."""
+    for writer in list(_writers.values()):
+        writer.flush(timeout)
+
+
+@atexit.register
+def shutdown():
+    """Flush-on-shutdown hook: drains writers, then closes pooled connections."""
+    with _registry_lock:
+        writers, pools = list(_writers.values()), list(_pools.values())
+        _writers.clear()
+        _pools.clear()
+    for writer in writers:
+        writer.close()
+    for pool in pools:
+        pool.close()
@@ -0,0 +1,76 @@
+import json
+from typing import Any, AsyncIterator, Dict, Optional
+
+# --- STREAMING: LangGraph events -> compact client events (SSE / NDJSON) ---
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+SSE_MEDIA_TYPE = "text/event-stream"
+
+# Proxies (nginx etc.) ko buffering band karne ko bolo, warna tokens atak jaate hain
+STREAM_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def _jsonable(value: Any) -> Any:
+    """Best-effort conversion of LangChain messages / state values into JSON-safe data."""
+    if hasattr(value, "content"):
+        return value.content
+    if isinstance(value, dict):
+        return {k: _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+def translate_event(event: Dict[str, Any], node_names: set) -> Optional[Dict[str, Any]]:
+    """Maps one `astream_events(version="v2")` event to a client event, or None to skip it."""
+    kind = event["event"]
+    name = event.get("name")
+    node = event.get("metadata", {}).get("langgraph_node")
+
+    if kind == "on_chat_model_stream":
+        chunk = event["data"].get("chunk")
+        content = getattr(chunk, "content", "")
+        if content:
+            return {"type": "token", "node": node, "content": content}
+    elif kind == "on_chain_start" and name in node_names and name == node:
+        return {"type": "node_start", "node": name}
+    elif kind == "on_chain_end" and name in node_names and name == node:
+        return {"type": "node_end", "node": name, "output": _jsonable(event["data"].get("output"))}
+    elif kind == "on_tool_start":
+        return {"type": "tool_call", "node": node, "tool": name, "args": _jsonable(event["data"].get("input"))}
+    elif kind == "on_tool_end":
+        return {"type": "tool_result", "node": node, "tool": name, "result": _jsonable(event["data"].get("output"))}
+    elif kind == "on_custom_event":
+        # Nodes adispatch_custom_event("tool_call", {...}) se apne events bhej sakte hain
+        return {"type": name, "node": node, **_jsonable(event["data"] or {})}
+    return None
+
+
+async def stream_graph(graph, state: Dict[str, Any], config: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+    """Runs a compiled graph and yields client events as they happen, ending with a `final` event."""
+    node_names = set(graph.get_graph().nodes) - {"__start__", "__end__"}
+    final_state = None
+    try:
+        async for event in graph.astream_events(state, config=config, version="v2"):
+            # Top-level graph run khatam -> final state
+            if event["event"] == "on_chain_end" and not event.get("parent_ids"):
+                final_state = event["data"].get("output")
+                continue
+            translated = translate_event(event, node_names)
+            if translated is not None:
+                yield translated
+    except Exception as e:
+        yield {"type": "error", "error": str(e)}
+        return
+    messages = (final_state or {}).get("messages") or [None]
+    yield {"type": "final", "response": _jsonable(messages[-1])}
+
+
+def encode_ndjson(event: Dict[str, Any]) -> bytes:
+    return (json.dumps(event, default=str) + "\n").encode()
+
+
+def encode_sse(event: Dict[str, Any]) -> bytes:
+    return f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n".encode()
@@ -0,0 +1,67 @@
+import asyncio
+import time
+
+from resilience import Backoff, CircuitBreaker, ErrorKind, settle
+
+
+def _open_then_half_open(breaker: CircuitBreaker):
+    for _ in range(breaker.failure_threshold):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == breaker.OPEN
+    time.sleep(breaker.reset_timeout)
+    assert breaker.allow()  # the half-open probe
+    assert breaker.state == breaker.HALF_OPEN
+
+
+def test_permanent_error_on_probe_closes_breaker():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=0.01)
+    _open_then_half_open(breaker)
+    try:
+        raise PermissionError("denied")
+    except PermissionError as e:
+        error = settle(breaker, e)
+    finally:
+        breaker.release()
+    assert error.kind == ErrorKind.PERMANENT
+    assert breaker.state == breaker.CLOSED
+    assert [breaker.allow() for _ in range(3)] == [True, True, True]
+
+
+def test_cancelled_probe_frees_the_slot():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=0.01)
+    _open_then_half_open(breaker)
+
+    async def probe():
+        try:
+            await asyncio.sleep(10)
+        finally:
+            breaker.release()
+
+    async def main():
+        task = asyncio.create_task(probe())
+        await asyncio.sleep(0)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(main())
+    assert breaker.state == breaker.HALF_OPEN
+    assert breaker.allow()        # next probe admitted...
+    assert not breaker.allow()    # ...but only one at a time
+
+
+def test_release_after_settling_is_a_noop():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.01)
+    _open_then_half_open(breaker)
+    breaker.record_failure()
+    breaker.release()
+    assert breaker.state == breaker.OPEN
+    assert not breaker.allow()
+
+
+def test_retry_after_is_clamped_and_flagged():
+    backoff = Backoff(base=0.1, cap=5.0)
+    assert backoff.delay(0, retry_after=3600) == 5.0
+    assert backoff.too_long(3600)
+    assert not backoff.too_long(2.0) and backoff.delay(0, retry_after=2.0) >= 2.0
+    assert not backoff.too_long(None)
@@ -0,0 +1,43 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+pytest.importorskip("langgraph")
+httpx = pytest.importorskip("httpx")
+
+
+@pytest.fixture(scope="module")
+def app_main(tmp_path_factory):
+    # Fakes + fresh DB dir: main ko import karne se pehle
+    mp = pytest.MonkeyPatch()
+    mp.chdir(tmp_path_factory.mktemp("threads"))
+    from benchmarks.fakes import install_fakes
+    install_fakes(latency=0.0, tool_script=[])
+    import main
+    with sqlite3.connect("agent_os.db") as conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS api_keys (key TEXT PRIMARY KEY, user_id TEXT, plan TEXT)")
+        conn.executemany("INSERT OR REPLACE INTO api_keys VALUES (?, ?, 'tiny')", [("key-a", "alice"), ("key-b", "bob")])
+    yield main
+    mp.undo()
+
+
+def test_same_thread_id_from_two_keys_does_not_share_a_checkpoint(app_main):
+    async def scenario():
+        transport = httpx.ASGITransport(app=app_main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            for key, task in (("key-a", "alice secret plan"), ("key-b", "bob question")):
+                reply = await client.post("/spawn_agent", headers={"X-API-Key": key},
+                                          json={"task": task, "thread_id": "shared"})
+                assert reply.status_code == 200
+                assert reply.json()["thread_id"] == "shared"
+        graph = app_main.get_orchestrator().app
+        return [
+            (await graph.aget_state(app_main.thread_config(thread_id))).values
+            for thread_id in ("alice/shared", "bob/shared", "shared")
+        ]
+
+    alice, bob, unscoped = asyncio.run(scenario())
+    assert alice["user_id"] == "alice"
+    assert bob["user_id"] == "bob"
+    assert unscoped == {}
@@ -0,0 +1,54 @@
+import logging
+import threading
+from typing import Any, Dict
+
+# Try to import tiktoken. If it fails (ya encoding download na ho sake), ~4 chars/token estimate use hota hai.
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+DEFAULT_ENCODING = "cl100k_base"
+
+_encodings: Dict[str, Any] = {}
+_lock = threading.Lock()
+
+
+def get_encoding(name: str = DEFAULT_ENCODING):
+    """Loads (once) and returns a tiktoken encoding, or None when unavailable."""
+    if not TIKTOKEN_AVAILABLE:
+        return None
+    enc = _encodings.get(name)
+    if enc is None and name not in _encodings:
+        with _lock:
+            if name not in _encodings:
+                try:
+                    _encodings[name] = tiktoken.get_encoding(name)
+                except Exception as e:
+                    logging.warning(f"⚠️ tiktoken encoding {name} unavailable, estimating tokens: {e}")
+                    _encodings[name] = None
+            enc = _encodings[name]
+    return enc
+
+
+def count_tokens(text: str, encoding: str = DEFAULT_ENCODING) -> int:
+    if not text:
+        return 0
+    enc = get_encoding(encoding)
+    if enc is None:
+        return max(1, len(text) // 4)
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, encoding: str = DEFAULT_ENCODING) -> str:
+    """Cuts `text` down to at most `max_tokens` tokens."""
+    if max_tokens <= 0 or not text:
+        return ""
+    enc = get_encoding(encoding)
+    if enc is None:
+        return text[:max_tokens * 4]
+    tokens = enc.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return enc.decode(tokens[:max_tokens])
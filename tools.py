@@ -1,10 +1,54 @@
+import asyncio
 import datetime
-# Try to import Sandbox. If it fails (user didn't install it), we handle it gracefully.
-try:
-    from e2b_code_interpreter import Sandbox
-    E2B_AVAILABLE = True
-except ImportError:
-    E2B_AVAILABLE = False
+import inspect
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Optional
+# Sandbox backends (E2B import bhi wahin gracefully handle hota hai)
+from sandbox_pool import E2B_AVAILABLE, SandboxTimeout, pool_from_env
+from mailbox_index import MAX_LIMIT, MailboxIndex, sources_from_env
+
+_sandbox_pool = None
+_sandbox_lock = threading.Lock()
+
+def get_sandbox_pool():
+    """Lazily builds the shared warm sandbox pool (configured via SANDBOX_* env vars)."""
+    global _sandbox_pool
+    with _sandbox_lock:
+        if _sandbox_pool is None:
+            _sandbox_pool = pool_from_env()
+            _sandbox_pool.warm()
+        return _sandbox_pool
+
+def sandbox_stats() -> dict:
+    """Pool stats without building the pool (empty until the first execute_python call)."""
+    pool = _sandbox_pool
+    return pool.stats() if pool is not None else {}
+
+_mailbox = None
+_mailbox_lock = threading.Lock()
+
+def get_mailbox() -> Optional[MailboxIndex]:
+    """Lazily builds the mail index over MAIL_SOURCE; None when no source is configured (demo inbox)."""
+    global _mailbox
+    with _mailbox_lock:
+        if _mailbox is None:
+            sources = sources_from_env()
+            if not sources:
+                return None
+            _mailbox = MailboxIndex(sources, sync_interval=float(os.getenv("MAIL_SYNC_INTERVAL", "30")))
+        return _mailbox
+
+def mailbox_stats() -> dict:
+    mailbox = _mailbox
+    return mailbox.stats() if mailbox is not None else {}
+
+DEMO_EMAILS = [
+    {"from": "boss@work.com", "subject": "Urgent Report", "body": "Need the Q1 stats now."},
+    {"from": "newsletter@tech.com", "subject": "AI News", "body": "Agents are taking over!"}
+]
 
 class AgentTools:
     """
@@ -13,13 +57,23 @@ class AgentTools:
     """
 
     @staticmethod
-    def read_emails():
-        """Simulates reading emails from an inbox."""
-        # In a real app, use the Gmail API here
-        return [
-            {"from": "boss@work.com", "subject": "Urgent Report", "body": "Need the Q1 stats now."},
-            {"from": "newsletter@tech.com", "subject": "AI News", "body": "Agents are taking over!"}
-        ]
+    def read_emails(query: Optional[str] = None, since: Optional[str] = None, until: Optional[str] = None,
+                    limit: int = 10, cursor: Optional[str] = None):
+        """Searches the local mailbox index (newest first, one page); demo inbox if MAIL_SOURCE is unset."""
+        mailbox = get_mailbox()
+        if mailbox is None:
+            return DEMO_EMAILS[:max(1, min(int(limit), MAX_LIMIT))]
+        # Sync throttled hai (MAIL_SYNC_INTERVAL): zyada tar calls pe sirf ek stat bhi nahi
+        mailbox.sync()
+        try:
+            return mailbox.search(
+                query=query, since=since, until=until, limit=limit, cursor=cursor,
+                snippet_tokens=int(os.getenv("MAIL_SNIPPET_TOKENS", "120")),
+                token_budget=int(os.getenv("MAIL_TOKEN_BUDGET", "1500"))
+            )
+        except ValueError as e:
+            # Galat date / cursor: LLM ko saaf message, taaki agli call theek kare
+            return f"Error: {e}"
 
     @staticmethod
     def get_system_time():
@@ -28,29 +82,91 @@ class AgentTools:
 
     @staticmethod
     def execute_python(code: str):
-        """Runs Python code in a secure, isolated cloud environment."""
+        """Runs Python code in an isolated sandbox leased from a warm pool."""
+        pool = get_sandbox_pool()
         
         # Fallback if E2B is not installed or configured
-        if not E2B_AVAILABLE:
+        if pool.backend.name == "e2b" and not E2B_AVAILABLE:
             return "ERROR: 'e2b-code-interpreter' is not installed. Please install it to run Python code safely."
 
         try:
-            # This happens on a remote secure server, NOT your laptop
-            # You need an E2B_API_KEY in your environment variables for this to work
-            with Sandbox() as sb:
-                execution = sb.run_code(code)
+            # Remote (E2B) ya local resource-limited interpreter - SANDBOX_BACKEND decide karta hai
+            execution = pool.run(code)
                 
-                if execution.error:
-                    return f"Runtime Error: {execution.error.name}: {execution.error.value}"
+            if execution.error:
+                return f"Runtime Error: {execution.error}"
                 
-                # combine stdout and results
-                output = []
-                if execution.logs.stdout:
-                    output.append(str(execution.logs.stdout))
-                if execution.results:
-                    output.append(str(execution.results))
-                    
-                return "\n".join(output) if output else "Code executed successfully (No output)"
+            # combine stdout and results
+            output = []
+            if execution.stdout:
+                output.append(execution.stdout)
+            if execution.result:
+                output.append(execution.result)
                 
+            return "\n".join(output) if output else "Code executed successfully (No output)"
+
+        except SandboxTimeout as e:
+            return f"Sandbox Error: Timeout - {str(e)}"
         except Exception as e:
-            return f"Sandbox Error: {str(e)}"
\ No newline at end of file
+            return f"Sandbox Error: {str(e)}"
+
+
+# --- TOOL REGISTRY ---
+class ToolRegistry:
+    """
+    Maps tool names to callables and their function-calling schemas.
+    Schemas are built once, so orchestrators can bind_tools() at construction time.
+    """
+    def __init__(self, max_workers: int = 4):
+        self.functions = {}
+        self._schemas = {}
+        self._params = {}
+        # Sync tools (read_emails, execute_python) is pool mein chalte hain, event loop pe nahi
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="agent-tool")
+
+    def register(self, name: str, fn, description: str, parameters: Optional[dict] = None):
+        parameters = parameters or {"type": "object", "properties": {}}
+        self.functions[name] = fn
+        self._params[name] = set(parameters.get("properties", {}))
+        self._schemas[name] = {
+            "type": "function",
+            "function": {"name": name, "description": description, "parameters": parameters}
+        }
+        return fn
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.functions
+
+    @property
+    def schemas(self) -> list:
+        return list(self._schemas.values())
+
+    async def acall(self, name: str, args: Optional[dict] = None):
+        """Runs a tool: coroutines are awaited, sync functions go to the tool thread pool."""
+        fn = self.functions[name]
+        # Sirf declared parameters pass karo; LLM kabhi kabhi extra keys bhej deta hai
+        kwargs = {k: v for k, v in (args or {}).items() if k in self._params[name]}
+        if inspect.iscoroutinefunction(fn):
+            return await fn(**kwargs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(fn, **kwargs))
+
+
+def build_default_registry(max_workers: int = 4) -> ToolRegistry:
+    registry = ToolRegistry(max_workers=max_workers)
+    registry.register(
+        "read_email", AgentTools.read_emails,
+        "Search the user's emails, newest first. Returns one page of emails with short body snippets and a next_cursor for the next page.",
+        {"type": "object", "properties": {
+            "query": {"type": "string", "description": "Words to match in sender, recipients or subject"},
+            "since": {"type": "string", "description": "Only emails on/after this ISO date or datetime, e.g. 2024-05-01"},
+            "until": {"type": "string", "description": "Only emails on/before this ISO date or datetime"},
+            "limit": {"type": "integer", "description": f"Emails per page (max {MAX_LIMIT})", "default": 10},
+            "cursor": {"type": "string", "description": "next_cursor from the previous page"}
+        }}
+    )
+    registry.register(
+        "execute_python", AgentTools.execute_python, "Run Python code to solve math or data tasks",
+        {"type": "object", "properties": {"code": {"type": "string", "description": "Python source to run"}}, "required": ["code"]}
+    )
+    return registry
@@ -0,0 +1,369 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from storage import get_pool
+
+# --- VECTOR MEMORY: semantic recall next to MemoryManager's keyword search ---
+# Abhi request path mein wired nahi hai: row arrays har process ke apne hain aur vector file pe
+# appends workers ke beech coordinate nahi hote, isliye ek hi (offline) indexer process chahiye.
+# Abhi sirf benchmarks/micro.py aur offline indexing isse use karte hain. index_memories() ko
+# MemoryManager.compact() ke baad chalao, taaki rolled/expired rows ke vectors tombstone ho jayein.
+
+
+class Embedder(ABC):
+    """Turns texts into float32 vectors of a fixed dimension."""
+    dim: int
+
+    @abstractmethod
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """Returns a (len(texts), dim) float32 array."""
+
+
+class HashingEmbedder(Embedder):
+    """
+    Deterministic, offline embedder (feature hashing of words + word bigrams). No model, no
+    network: good enough for tests, benchmarks and a baseline when no embedding API is set.
+    """
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def _features(self, text: str) -> List[str]:
+        words = re.findall(r"\w+", text.lower())
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for feature in self._features(text):
+                h = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+                # Sign bit alag rakhte hain taaki collisions average out ho jayein
+                out[i, h % self.dim] += 1.0 if (h >> 63) else -1.0
+        return out
+
+
+class LangChainEmbedder(Embedder):
+    """Adapter for any LangChain `Embeddings` (e.g. OpenAIEmbeddings)."""
+    def __init__(self, embeddings: Any, dim: int):
+        self.embeddings = embeddings
+        self.dim = dim
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        return np.asarray(self.embeddings.embed_documents(list(texts)), dtype=np.float32)
+
+
+class VectorHit(NamedTuple):
+    memory_id: Optional[int]
+    agent_id: str
+    score: float                  # cosine similarity
+    row: int
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32, copy=False)
+
+
+class VectorMemory:
+    """
+    Append-only store of L2-normalized float32 embeddings in a memory-mapped file; row i of the
+    file is row i of the `vector_rows` table (agent_id, memory_id, deleted). Search is a chunked
+    matrix-vector product over the mapping (cosine = dot on unit vectors) + argpartition top-k,
+    so the OS page cache, not the Python heap, holds the matrix.
+
+    Compaction writes live rows to a new generation file and swaps generations in one SQLite
+    transaction, so a crash mid-compaction leaves the previous generation intact.
+    """
+    CHUNK_ROWS = 65536
+
+    def __init__(self, path: str = "agent_os.vectors", embedder: Optional[Embedder] = None,
+                 db_path: str = "agent_os.db"):
+        self.path = path
+        self.embedder = embedder or HashingEmbedder()
+        self.dim = self.embedder.dim
+        self.pool = get_pool(db_path)
+        self._lock = threading.RLock()
+        self._agents: Dict[str, int] = {}
+        self._agent_names: List[str] = []
+        self._map: Optional[np.memmap] = None
+        self._bootstrap_db()
+        self._load()
+
+    def _bootstrap_db(self):
+        self.pool.executescript('''
+            CREATE TABLE IF NOT EXISTS vector_rows (
+                row INTEGER PRIMARY KEY,
+                agent_id TEXT,
+                memory_id INTEGER,
+                deleted INTEGER DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_vector_rows_memory ON vector_rows (memory_id);
+            CREATE TABLE IF NOT EXISTS vector_meta (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                dim INTEGER,
+                generation INTEGER,
+                indexed_memory_id INTEGER DEFAULT 0
+            );
+        ''')
+        with self.pool.connection() as conn:
+            with conn:
+                conn.execute("INSERT OR IGNORE INTO vector_meta (id, dim, generation) VALUES (1, ?, 0)", (self.dim,))
+        dim = self.pool.execute("SELECT dim FROM vector_meta WHERE id = 1")[0][0]
+        if dim != self.dim:
+            raise ValueError(f"Vector store {self.path} has dim {dim}, embedder produces {self.dim}")
+
+    def _file(self, generation: int) -> str:
+        return f"{self.path}.{generation}.f32"
+
+    def _load(self):
+        """Rebuilds the in-memory agent/deleted arrays and trims rows the DB never committed."""
+        with self._lock:
+            self.generation = self.pool.execute("SELECT generation FROM vector_meta WHERE id = 1")[0][0]
+            rows = self.pool.execute("SELECT row, agent_id, deleted FROM vector_rows ORDER BY row")
+            self._codes_buf = np.empty(len(rows), dtype=np.int32)
+            self._alive_buf = np.empty(len(rows), dtype=bool)
+            for i, (_, agent_id, deleted) in enumerate(rows):
+                self._codes_buf[i] = self._agent_code(agent_id)
+                self._alive_buf[i] = not deleted
+            self._agent_codes, self._alive = self._codes_buf, self._alive_buf
+            path = self._file(self.generation)
+            expected = len(rows) * self.dim * 4
+            if not os.path.exists(path):
+                open(path, "wb").close()
+            if os.path.getsize(path) > expected:
+                # Crash after file append but before commit: un rows ka koi metadata nahi hai
+                os.truncate(path, expected)
+            self._remap()
+
+    def _agent_code(self, agent_id: str) -> int:
+        code = self._agents.get(agent_id)
+        if code is None:
+            code = self._agents[agent_id] = len(self._agent_names)
+            self._agent_names.append(agent_id)
+        return code
+
+    def _append_rows(self, code: int, count: int):
+        """Extends the agent/alive arrays; capacity doubles so appends are amortized O(1)."""
+        n = len(self._alive)
+        if n + count > len(self._alive_buf):
+            capacity = max(n + count, 2 * len(self._alive_buf), 1024)
+            codes, alive = np.empty(capacity, dtype=np.int32), np.empty(capacity, dtype=bool)
+            codes[:n], alive[:n] = self._agent_codes, self._alive
+            self._codes_buf, self._alive_buf = codes, alive
+        self._codes_buf[n:n + count] = code
+        self._alive_buf[n:n + count] = True
+        # Views: search_vector ke purane snapshots ki length nahi badalti
+        self._agent_codes, self._alive = self._codes_buf[:n + count], self._alive_buf[:n + count]
+
+    def _remap(self):
+        n = len(self._alive)
+        self._map = np.memmap(self._file(self.generation), dtype=np.float32, mode="r", shape=(n, self.dim)) if n else None
+
+    def __len__(self) -> int:
+        return int(self._alive.sum())
+
+    # --- Writes ---
+
+    def add(self, agent_id: str, texts: Sequence[str], memory_ids: Optional[Sequence[Optional[int]]] = None) -> List[int]:
+        """Embeds and appends `texts`; returns their row ids."""
+        return self.add_vectors(agent_id, self.embedder.embed(texts), memory_ids)
+
+    def add_vectors(self, agent_id: str, vectors: np.ndarray,
+                    memory_ids: Optional[Sequence[Optional[int]]] = None) -> List[int]:
+        vectors = _normalize(np.atleast_2d(np.asarray(vectors, dtype=np.float32)))
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-dim vectors, got {vectors.shape[1]}")
+        memory_ids = list(memory_ids) if memory_ids is not None else [None] * len(vectors)
+        if len(memory_ids) != len(vectors):
+            raise ValueError(f"Got {len(memory_ids)} memory_ids for {len(vectors)} vectors")
+        with self._lock:
+            start = len(self._alive)
+            rows = list(range(start, start + len(vectors)))
+            path, size = self._file(self.generation), start * self.dim * 4
+            try:
+                # DB rows pehle (transaction khula), file append uske andar: dono saath commit ya dono nahi
+                with self.pool.connection() as conn:
+                    with conn:
+                        conn.executemany(
+                            "INSERT INTO vector_rows (row, agent_id, memory_id) VALUES (?, ?, ?)",
+                            [(row, agent_id, memory_id) for row, memory_id in zip(rows, memory_ids)]
+                        )
+                        with open(path, "ab") as f:
+                            f.write(vectors.tobytes())
+            except BaseException:
+                # Rollback hua: file ko pichhle size pe wapas, warna agle rows galat offset pe map honge
+                if os.path.getsize(path) > size:
+                    os.truncate(path, size)
+                raise
+            self._append_rows(self._agent_code(agent_id), len(rows))
+            self._remap()
+        return rows
+
+    def delete(self, memory_ids: Sequence[int]) -> int:
+        """Tombstones vectors of the given memory rows; space is reclaimed by compact()."""
+        with self._lock:
+            placeholders = ", ".join("?" * len(memory_ids))
+            rows = [r[0] for r in self.pool.execute(
+                f"SELECT row FROM vector_rows WHERE memory_id IN ({placeholders}) AND deleted = 0", list(memory_ids)
+            )] if memory_ids else []
+            if rows:
+                with self.pool.connection() as conn:
+                    with conn:
+                        conn.executemany("UPDATE vector_rows SET deleted = 1 WHERE row = ?", [(r,) for r in rows])
+                self._alive[rows] = False
+        return len(rows)
+
+    def prune_memories(self) -> int:
+        """Tombstones vectors whose agent_memory row is gone (rolled into a segment or expired)."""
+        with self._lock:
+            rows = [r[0] for r in self.pool.execute('''
+                SELECT row FROM vector_rows v WHERE deleted = 0 AND memory_id IS NOT NULL
+                AND NOT EXISTS (SELECT 1 FROM agent_memory m WHERE m.id = v.memory_id)
+            ''')]
+            if rows:
+                with self.pool.connection() as conn:
+                    with conn:
+                        conn.executemany("UPDATE vector_rows SET deleted = 1 WHERE row = ?", [(r,) for r in rows])
+                self._alive[rows] = False
+        return len(rows)
+
+    def index_memories(self, batch_size: int = 512, limit: Optional[int] = None) -> int:
+        """
+        Incrementally embeds agent_memory rows added since the last call (tracked by id), after
+        tombstoning vectors of rows that MemoryManager.compact() rolled up or expired; the segment
+        that replaced them is a new row, so it gets embedded here. Compressed rows and segments
+        are embedded by their stored preview/summary.
+        """
+        indexed = 0
+        with self._lock:
+            self.prune_memories()
+            while limit is None or indexed < limit:
+                last_id = self.pool.execute("SELECT indexed_memory_id FROM vector_meta WHERE id = 1")[0][0]
+                rows = self.pool.execute(
+                    "SELECT id, agent_id, context_value FROM agent_memory WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, batch_size)
+                )
+                if not rows:
+                    break
+                by_agent: Dict[str, list] = {}
+                for memory_id, agent_id, value in rows:
+                    by_agent.setdefault(agent_id, []).append((memory_id, value or ""))
+                for agent_id, items in by_agent.items():
+                    self.add(agent_id, [value for _, value in items], [memory_id for memory_id, _ in items])
+                with self.pool.connection() as conn:
+                    with conn:
+                        conn.execute("UPDATE vector_meta SET indexed_memory_id = ? WHERE id = 1", (rows[-1][0],))
+                indexed += len(rows)
+        return indexed
+
+    # --- Search ---
+
+    def search(self, query: str, k: int = 5, agent_id: Optional[str] = None) -> List[VectorHit]:
+        return self.search_vector(self.embedder.embed([query])[0], k, agent_id)
+
+    def search_vector(self, vector: np.ndarray, k: int = 5, agent_id: Optional[str] = None) -> List[VectorHit]:
+        """Top-k cosine matches, best first, optionally restricted to one agent."""
+        q = _normalize(np.asarray(vector, dtype=np.float32).reshape(1, -1))[0]
+        with self._lock:
+            matrix, alive, codes = self._map, self._alive, self._agent_codes
+        if matrix is None or k <= 0:
+            return []
+        if agent_id is not None:
+            code = self._agents.get(agent_id)
+            if code is None:
+                return []
+            candidates = np.flatnonzero(alive & (codes == code))
+        else:
+            candidates = None
+
+        best_rows, best_scores = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        total = len(alive) if candidates is None else len(candidates)
+        for start in range(0, total, self.CHUNK_ROWS):
+            if candidates is None:
+                rows = np.arange(start, min(start + self.CHUNK_ROWS, total))
+                scores = matrix[start:start + self.CHUNK_ROWS] @ q
+                scores[~alive[start:start + self.CHUNK_ROWS]] = -np.inf
+            else:
+                rows = candidates[start:start + self.CHUNK_ROWS]
+                scores = matrix[rows] @ q
+            if len(scores) > k:
+                top = np.argpartition(scores, -k)[-k:]
+                rows, scores = rows[top], scores[top]
+            best_rows = np.concatenate([best_rows, rows])
+            best_scores = np.concatenate([best_scores, scores])
+            if len(best_scores) > k:
+                top = np.argpartition(best_scores, -k)[-k:]
+                best_rows, best_scores = best_rows[top], best_scores[top]
+
+        order = np.argsort(-best_scores)
+        hits = [(int(best_rows[i]), float(best_scores[i])) for i in order if np.isfinite(best_scores[i])]
+        if not hits:
+            return []
+        meta = dict((row, (memory_id, agent)) for row, memory_id, agent in self.pool.execute(
+            f"SELECT row, memory_id, agent_id FROM vector_rows WHERE row IN ({', '.join('?' * len(hits))})",
+            [row for row, _ in hits]
+        ))
+        return [VectorHit(meta[row][0], meta[row][1], score, row) for row, score in hits if row in meta]
+
+    # --- Compaction ---
+
+    def stats(self) -> Dict[str, Any]:
+        total = len(self._alive)
+        return {
+            "rows": total,
+            "live": len(self),
+            "dead_ratio": round(1 - len(self) / total, 4) if total else 0.0,
+            "dim": self.dim,
+            "generation": self.generation,
+            "file_bytes": os.path.getsize(self._file(self.generation)),
+        }
+
+    def compact(self, min_dead_ratio: float = 0.2) -> Dict[str, Any]:
+        """Rewrites the file without tombstoned rows if at least `min_dead_ratio` of it is dead."""
+        with self._lock:
+            total = len(self._alive)
+            live = np.flatnonzero(self._alive)
+            if not total or (total - len(live)) / total < min_dead_ratio:
+                return {"compacted": False, **self.stats()}
+            started = time.monotonic()
+            new_generation = self.generation + 1
+            with open(self._file(new_generation), "wb") as f:
+                for start in range(0, len(live), self.CHUNK_ROWS):
+                    f.write(np.ascontiguousarray(self._map[live[start:start + self.CHUNK_ROWS]]).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            meta = self.pool.execute("SELECT row, agent_id, memory_id FROM vector_rows WHERE deleted = 0 ORDER BY row")
+            with self.pool.connection() as conn:
+                with conn:
+                    conn.execute("DELETE FROM vector_rows")
+                    conn.executemany(
+                        "INSERT INTO vector_rows (row, agent_id, memory_id) VALUES (?, ?, ?)",
+                        [(i, agent_id, memory_id) for i, (_, agent_id, memory_id) in enumerate(meta)]
+                    )
+                    conn.execute("UPDATE vector_meta SET generation = ? WHERE id = 1", (new_generation,))
+            old_path = self._file(self.generation)
+            self._map = None
+            self._load()
+            os.remove(old_path)
+            elapsed = time.monotonic() - started
+        logging.info(f"🗜️ Vector store compacted: {total} -> {len(live)} rows in {elapsed:.2f}s")
+        return {"compacted": True, "seconds": round(elapsed, 3), **self.stats()}
+
+    def start_compaction(self, interval: float = 3600.0, **compact_kwargs):
+        """Runs compact() every `interval` seconds on a daemon thread."""
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.compact(**compact_kwargs)
+                except Exception as e:
+                    logging.error(f"❌ Vector compaction failed: {e}")
+        threading.Thread(target=loop, name="vector-compaction", daemon=True).start()